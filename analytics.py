@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""
+Módulo de estatísticas históricas de presença.
+
+Mantém agregados por dia, semana e mês, por aluno e por turma, nas tabelas
+'agregado_aluno' e 'agregado_turma'. Os agregados são atualizados de forma
+incremental: apenas os dias que receberam novos registros em 'presenca' desde
+a última atualização são recalculados.
+
+A atualização é uma transação de escrita, então não é feita nas consultas: o
+agendador iniciado pelo run.py (iniciar_agendador) a executa a cada minuto, e
+consultar_estatisticas() apenas lê os agregados. Quando as regras de horário
+mudam, o histórico inteiro é refeito pela tarefa 'recalcular_historico' da fila
+do jobs.py.
+
+Os agregados de períodos já arquivados (veja arquivamento.py) são mantidos: como
+os registros desses dias não estão mais na tabela 'presenca', eles nunca são
+recalculados, nem mesmo em uma reconstrução completa.
+"""
+
+import threading
+import time
+from datetime import date, datetime, timedelta
+import database as db
+import jobs
+import regras_horario
+
+# Garante que duas requisições simultâneas não recalculem os mesmos dias ao mesmo tempo.
+_lock_atualizacao = threading.Lock()
+
+PERIODOS = ('dia', 'semana', 'mes')
+INTERVALO_PADRAO_SEGUNDOS = 60
+PAUSA_ENTRE_PERIODOS = 0.05  # Segundos; dá vez aos registros de presença na reconstrução completa
+
+
+def _inicio_semana(dia):
+    """Retorna a segunda-feira da semana do dia informado."""
+    return dia - timedelta(days=dia.weekday())
+
+
+def _inicio_mes(dia):
+    return dia.replace(day=1)
+
+
+def _fim_mes(dia):
+    proximo_mes = (dia.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return proximo_mes - timedelta(days=1)
+
+
+def _recalcular_dia(cursor, dia):
+    """
+    Recalcula os agregados diários de todos os alunos para um dia. Atrasos e saídas
+    antecipadas seguem as regras de horário de cada turma (veja regras_horario.py).
+    """
+    dia_str = dia.isoformat()
+    # Intervalo semiaberto em vez de DATE(timestamp) = ?, para usar o índice de timestamp.
+    inicio, fim = datetime.combine(dia, datetime.min.time()), datetime.combine(dia + timedelta(days=1), datetime.min.time())
+
+    cursor.execute("DELETE FROM agregado_aluno WHERE periodo = 'dia' AND inicio = ?", (dia_str,))
+    cursor.execute("""
+    INSERT INTO agregado_aluno (periodo, inicio, codigo_turma, aluno_id, presentes, atrasos, saidas_antecipadas, ausentes)
+    SELECT
+        'dia', ?, COALESCE(a.codigo_turma, ''), a.id,
+        entrada.timestamp IS NOT NULL,
+        regra_atraso(a.codigo_turma, entrada.timestamp),
+        regra_saida_antecipada(a.codigo_turma, saida.timestamp),
+        entrada.timestamp IS NULL
+    FROM alunos a
+    LEFT JOIN (
+        SELECT aluno_id, MAX(timestamp) as timestamp FROM presenca
+        WHERE tipo_registro = 'entrada' AND timestamp >= ? AND timestamp < ?
+        GROUP BY aluno_id
+    ) entrada ON a.id = entrada.aluno_id
+    LEFT JOIN (
+        SELECT aluno_id, MAX(timestamp) as timestamp FROM presenca
+        WHERE tipo_registro = 'saida' AND timestamp >= ? AND timestamp < ?
+        GROUP BY aluno_id
+    ) saida ON a.id = saida.aluno_id
+    """, (dia_str, inicio, fim, inicio, fim))
+
+
+def _recalcular_periodo(cursor, periodo, inicio, fim):
+    """Recalcula os agregados de uma semana ou mês a partir dos agregados diários."""
+    cursor.execute(
+        "DELETE FROM agregado_aluno WHERE periodo = ? AND inicio = ?",
+        (periodo, inicio.isoformat())
+    )
+    cursor.execute("""
+    INSERT INTO agregado_aluno (periodo, inicio, codigo_turma, aluno_id, presentes, atrasos, saidas_antecipadas, ausentes)
+    SELECT ?, ?, codigo_turma, aluno_id, SUM(presentes), SUM(atrasos), SUM(saidas_antecipadas), SUM(ausentes)
+    FROM agregado_aluno
+    WHERE periodo = 'dia' AND inicio BETWEEN ? AND ?
+    GROUP BY codigo_turma, aluno_id
+    """, (periodo, inicio.isoformat(), inicio.isoformat(), fim.isoformat()))
+
+
+def _recalcular_turmas(cursor, periodo, inicio):
+    """Consolida os agregados dos alunos de um período nos agregados por turma."""
+    cursor.execute(
+        "DELETE FROM agregado_turma WHERE periodo = ? AND inicio = ?",
+        (periodo, inicio.isoformat())
+    )
+    cursor.execute("""
+    INSERT INTO agregado_turma (periodo, inicio, codigo_turma, presentes, atrasos, saidas_antecipadas, ausentes)
+    SELECT periodo, inicio, codigo_turma, SUM(presentes), SUM(atrasos), SUM(saidas_antecipadas), SUM(ausentes)
+    FROM agregado_aluno
+    WHERE periodo = ? AND inicio = ?
+    GROUP BY codigo_turma
+    """, (periodo, inicio.isoformat()))
+
+
+def atualizar_agregados(recalcular_tudo=False):
+    """
+    Atualiza os agregados a partir dos registros de presença ainda não processados.
+    Retorna a lista de dias recalculados.
+
+    Como 'add_attendance_record' sempre insere um novo registro (com id maior) ao
+    substituir o anterior, basta guardar o maior id processado para saber quais
+    dias mudaram desde a última atualização.
+    """
+    with _lock_atualizacao:
+        conn = db.get_db_connection()
+        cursor = conn.cursor()
+        try:
+            limite_arquivo = db.data_limite_arquivo()
+            semanas_borda, meses_borda = set(), set()
+            if recalcular_tudo:
+                ultimo_id = 0
+                if limite_arquivo is not None:
+                    # Preserva os dias arquivados; a semana e o mês que contêm o limite
+                    # são recalculados a partir dos agregados diários.
+                    primeiro_dia = limite_arquivo + timedelta(days=1)
+                    semanas_borda.add(_inicio_semana(primeiro_dia))
+                    meses_borda.add(_inicio_mes(primeiro_dia))
+            else:
+                row = cursor.execute(
+                    "SELECT valor FROM agregado_estado WHERE chave = 'ultimo_id_presenca'"
+                ).fetchone()
+                ultimo_id = int(row['valor']) if row else 0
+
+            novo_ultimo_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM presenca").fetchone()[0]
+            if novo_ultimo_id <= ultimo_id and not recalcular_tudo:
+                return []
+
+            cursor.execute(
+                "SELECT DISTINCT DATE(timestamp) AS dia FROM presenca WHERE id > ? AND id <= ? ORDER BY dia",
+                (ultimo_id, novo_ultimo_id)
+            )
+            dias = [date.fromisoformat(row['dia']) for row in cursor.fetchall() if row['dia']]
+            if limite_arquivo is not None:
+                dias = [dia for dia in dias if dia > limite_arquivo]
+
+            semanas = sorted({_inicio_semana(dia) for dia in dias} | semanas_borda)
+            meses = sorted({_inicio_mes(dia) for dia in dias} | meses_borda)
+
+            def _liberar():
+                # Em uma reconstrução completa, cada período é gravado em sua própria
+                # transação, com uma pausa em seguida, para não travar as leituras de
+                # QR Code durante todo o recálculo.
+                if recalcular_tudo:
+                    conn.commit()
+                    time.sleep(PAUSA_ENTRE_PERIODOS)
+
+            if recalcular_tudo:
+                # Em vez de apagar tudo antes de refazer, remove apenas os períodos que não
+                # têm mais registros: as consultas continuam vendo o histórico completo.
+                primeiro_dia = limite_arquivo + timedelta(days=1) if limite_arquivo else date.min
+                _remover_obsoletos(cursor, 'dia', primeiro_dia, dias)
+                _remover_obsoletos(cursor, 'semana', min(semanas_borda, default=primeiro_dia), semanas)
+                _remover_obsoletos(cursor, 'mes', min(meses_borda, default=primeiro_dia), meses)
+                _liberar()
+
+            for dia in dias:
+                _recalcular_dia(cursor, dia)
+                _recalcular_turmas(cursor, 'dia', dia)
+                _liberar()
+            for semana in semanas:
+                _recalcular_periodo(cursor, 'semana', semana, semana + timedelta(days=6))
+                _recalcular_turmas(cursor, 'semana', semana)
+                _liberar()
+            for mes in meses:
+                _recalcular_periodo(cursor, 'mes', mes, _fim_mes(mes))
+                _recalcular_turmas(cursor, 'mes', mes)
+                _liberar()
+
+            cursor.execute(
+                "INSERT OR REPLACE INTO agregado_estado (chave, valor) VALUES ('ultimo_id_presenca', ?)",
+                (str(novo_ultimo_id),)
+            )
+            conn.commit()
+            return dias
+        finally:
+            conn.close()
+
+
+def _remover_obsoletos(cursor, periodo, inicio_minimo, manter):
+    """Apaga os agregados do período a partir de 'inicio_minimo' cujo início não está em 'manter'."""
+    manter = {inicio.isoformat() for inicio in manter}
+    for tabela in ('agregado_aluno', 'agregado_turma'):
+        existentes = [
+            row[0] for row in cursor.execute(
+                f"SELECT DISTINCT inicio FROM {tabela} WHERE periodo = ? AND inicio >= ?",
+                (periodo, inicio_minimo.isoformat())
+            )
+        ]
+        for inicio in existentes:
+            if inicio not in manter:
+                cursor.execute(f"DELETE FROM {tabela} WHERE periodo = ? AND inicio = ?", (periodo, inicio))
+
+
+def _decompor_intervalo(inicio, fim):
+    """
+    Divide o intervalo [inicio, fim] em meses completos e dias avulsos nas bordas,
+    para que os totais sejam somados com o menor número possível de linhas.
+    Retorna (lista_de_meses, lista_de_intervalos_de_dias).
+    """
+    meses = []
+    intervalos_dias = []
+    cursor_dia = inicio
+    while cursor_dia <= fim:
+        fim_do_mes = _fim_mes(cursor_dia)
+        if cursor_dia.day == 1 and fim_do_mes <= fim:
+            meses.append(cursor_dia)
+        else:
+            intervalos_dias.append((cursor_dia, min(fim_do_mes, fim)))
+        cursor_dia = fim_do_mes + timedelta(days=1)
+    return meses, intervalos_dias
+
+
+def _taxa_presenca(linha):
+    total = linha['presentes'] + linha['ausentes']
+    return round(linha['presentes'] / total, 4) if total else None
+
+
+def consultar_estatisticas(codigo_turma=None, inicio=None, fim=None, periodo='mes'):
+    """
+    Retorna as estatísticas de presença no intervalo informado.
+
+    - 'turmas': série temporal por turma, na granularidade de 'periodo'.
+    - 'alunos': totais por aluno no intervalo exato [inicio, fim].
+
+    Só lê os agregados; as leituras mais recentes entram na próxima execução
+    do agendador (veja iniciar_agendador).
+    """
+    if periodo not in PERIODOS:
+        raise ValueError(f"Período inválido: {periodo}")
+    hoje = date.today()
+    fim = fim or hoje
+    inicio = inicio or _inicio_mes(fim)
+
+    filtro_turma = ""
+    params_turma = []
+    if codigo_turma:
+        filtro_turma = " AND codigo_turma = ?"
+        params_turma = [codigo_turma]
+
+    conn = db.get_db_connection()
+    cursor = conn.cursor()
+
+    # Série por turma: períodos cujo início está dentro do intervalo.
+    if periodo == 'semana':
+        inicio_serie = _inicio_semana(inicio)
+    elif periodo == 'mes':
+        inicio_serie = _inicio_mes(inicio)
+    else:
+        inicio_serie = inicio
+    cursor.execute(f"""
+        SELECT inicio, codigo_turma, presentes, atrasos, saidas_antecipadas, ausentes
+        FROM agregado_turma
+        WHERE periodo = ?{filtro_turma} AND inicio BETWEEN ? AND ?
+        ORDER BY codigo_turma, inicio
+    """, [periodo] + params_turma + [inicio_serie.isoformat(), fim.isoformat()])
+    turmas = []
+    for row in cursor.fetchall():
+        linha = dict(row)
+        linha['taxa_presenca'] = _taxa_presenca(linha)
+        turmas.append(linha)
+
+    # Totais por aluno: meses completos vêm do agregado mensal e as bordas do diário.
+    meses, intervalos_dias = _decompor_intervalo(inicio, fim)
+    condicoes = []
+    params = []
+    if meses:
+        condicoes.append(f"(periodo = 'mes' AND inicio IN ({', '.join('?' for _ in meses)}))")
+        params.extend(m.isoformat() for m in meses)
+    for inicio_dias, fim_dias in intervalos_dias:
+        condicoes.append("(periodo = 'dia' AND inicio BETWEEN ? AND ?)")
+        params.extend([inicio_dias.isoformat(), fim_dias.isoformat()])
+
+    alunos = []
+    if condicoes:
+        cursor.execute(f"""
+            SELECT al.ra, al.nome, ag.codigo_turma,
+                   SUM(ag.presentes) AS presentes, SUM(ag.atrasos) AS atrasos,
+                   SUM(ag.saidas_antecipadas) AS saidas_antecipadas, SUM(ag.ausentes) AS ausentes
+            FROM agregado_aluno ag
+            JOIN alunos al ON al.id = ag.aluno_id
+            WHERE ({' OR '.join(condicoes)}){' AND ag.codigo_turma = ?' if codigo_turma else ''}
+            GROUP BY ag.aluno_id, ag.codigo_turma
+            ORDER BY al.nome
+        """, params + params_turma)
+        for row in cursor.fetchall():
+            linha = dict(row)
+            linha['taxa_presenca'] = _taxa_presenca(linha)
+            alunos.append(linha)
+
+    conn.close()
+    return {
+        "de": inicio.isoformat(),
+        "ate": fim.isoformat(),
+        "periodo": periodo,
+        "turmas": turmas,
+        "alunos": alunos,
+    }
+
+
+def iniciar_agendador(intervalo_segundos=INTERVALO_PADRAO_SEGUNDOS):
+    """Executa atualizar_agregados() a cada 'intervalo_segundos' em uma thread daemon."""
+    def _loop():
+        while True:
+            try:
+                atualizar_agregados()
+            except Exception as e:
+                print(f"[ANALYTICS] Erro ao atualizar os agregados: {e}")
+            time.sleep(intervalo_segundos)
+
+    thread = threading.Thread(target=_loop, name='analytics', daemon=True)
+    thread.start()
+    return thread
+
+
+def _recalcular_historico(progresso=None):
+    """Tarefa 'recalcular_historico' (veja jobs.py), agendada quando as regras de horário mudam."""
+    return {"dias": regras_horario.recalcular_historico()}
+
+
+jobs.registrar('recalcular_historico', _recalcular_historico)
+
+
+if __name__ == '__main__':
+    # Permite reconstruir todos os agregados manualmente (ex: após importar um histórico antigo).
+    db.init_db()
+    dias = atualizar_agregados(recalcular_tudo=True)
+    print(f"Agregados recalculados para {len(dias)} dias.")
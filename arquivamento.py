@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Arquivamento de períodos letivos encerrados.
+
+Os registros de 'presenca' de um período (ex: um ano letivo) são movidos para um
+arquivo SQLite próprio na pasta 'arquivo/', ao lado do banco principal, e o
+período é anotado na tabela 'presenca_arquivo'. Assim a tabela ativa guarda
+apenas o período corrente e as operações do dia (registro de presença, dashboard)
+não ficam mais lentas com o passar dos anos.
+
+- Os agregados do módulo analytics são atualizados antes do arquivamento e
+  continuam no banco principal, então /api/stats não precisa dos arquivos.
+- O histórico do aluno, a exportação e os relatórios anexam (ATTACH) os arquivos
+  necessários automaticamente (veja database.sql_presenca_com_arquivo).
+- A cópia é feita em lotes curtos, cada um em sua própria transação, para que
+  o leitor de QR Code continue registrando presenças durante o processo. O
+  arquivo final é compactado com VACUUM INTO, que só lê o arquivo temporário.
+- O espaço liberado no banco principal é reaproveitado por novos registros;
+  'compactar()' devolve as páginas livres ao sistema em pequenos passos.
+
+Uso:
+    python arquivamento.py --ano 2025
+    python arquivamento.py --de 2025-02-01 --ate 2025-07-15
+    python arquivamento.py --listar
+    python arquivamento.py --compactar
+"""
+
+import argparse
+import os
+import sqlite3
+import time
+from datetime import date, datetime, timedelta
+import database as db
+import analytics
+
+PASTA_ARQUIVO = "arquivo"
+TAMANHO_LOTE = 5000  # Registros movidos por transação
+PAUSA_ENTRE_LOTES = 0.05  # Segundos; dá vez aos registros de presença
+
+
+def _criar_tabela_arquivo(conn, esquema):
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {esquema}.presenca (
+        id INTEGER PRIMARY KEY,
+        aluno_id INTEGER NOT NULL,
+        timestamp DATETIME,
+        tipo_registro TEXT NOT NULL
+    )""")
+
+
+def arquivar_periodo(inicio, fim):
+    """
+    Move os registros de presença de [inicio, fim] (datas inclusivas) para um
+    arquivo em PASTA_ARQUIVO. Retorna o número de registros arquivados.
+    """
+    if fim < inicio:
+        raise ValueError("A data final deve ser posterior à inicial.")
+    if fim >= date.today():
+        raise ValueError("Só é possível arquivar períodos encerrados (anteriores a hoje).")
+
+    conn = db.get_db_connection()
+    sobreposto = conn.execute(
+        "SELECT caminho FROM presenca_arquivo WHERE inicio <= ? AND fim >= ?",
+        (fim.isoformat(), inicio.isoformat())
+    ).fetchone()
+    conn.close()
+    if sobreposto:
+        raise ValueError(f"O período se sobrepõe a um arquivo existente: {sobreposto['caminho']}")
+
+    # Os agregados precisam estar completos antes de os registros saírem da tabela ativa.
+    analytics.atualizar_agregados()
+
+    nome_arquivo = os.path.join(PASTA_ARQUIVO, f"presenca_{inicio:%Y%m%d}_{fim:%Y%m%d}.db")
+    caminho_final = db.caminho_arquivo_presenca(nome_arquivo)
+    caminho_temporario = caminho_final + ".tmp"
+    if os.path.exists(caminho_final):
+        raise ValueError(f"O arquivo {caminho_final} já existe.")
+    os.makedirs(os.path.dirname(caminho_final), exist_ok=True)
+
+    limite_inferior = inicio.isoformat()
+    limite_superior = (fim + timedelta(days=1)).isoformat()
+
+    conn = db.get_db_connection()
+    try:
+        conn.execute("ATTACH DATABASE ? AS arquivo_novo", (caminho_temporario,))
+        _criar_tabela_arquivo(conn, 'arquivo_novo')
+        conn.commit()
+
+        ids = [row[0] for row in conn.execute(
+            "SELECT id FROM presenca WHERE timestamp >= ? AND timestamp < ? ORDER BY id",
+            (limite_inferior, limite_superior)
+        )]
+        for i in range(0, len(ids), TAMANHO_LOTE):
+            lote = ids[i:i + TAMANHO_LOTE]
+            filtro = "id BETWEEN ? AND ? AND timestamp >= ? AND timestamp < ?"
+            params = (lote[0], lote[-1], limite_inferior, limite_superior)
+            # Copia e remove na mesma transação. 'OR IGNORE' torna o processo seguro
+            # para ser repetido se for interrompido entre a cópia e a remoção.
+            conn.execute(
+                f"INSERT OR IGNORE INTO arquivo_novo.presenca SELECT id, aluno_id, timestamp, tipo_registro FROM presenca WHERE {filtro}",
+                params
+            )
+            conn.execute(f"DELETE FROM presenca WHERE {filtro}", params)
+            conn.commit()
+            time.sleep(PAUSA_ENTRE_LOTES)
+
+        conn.execute("DETACH DATABASE arquivo_novo")
+    finally:
+        conn.close()
+
+    # Gera o arquivo definitivo, compacto e com índice, a partir do temporário.
+    temporario = sqlite3.connect(caminho_temporario)
+    try:
+        temporario.execute("CREATE INDEX IF NOT EXISTS idx_presenca_aluno_timestamp ON presenca (aluno_id, timestamp)")
+        temporario.commit()
+        temporario.execute("VACUUM INTO ?", (caminho_final,))
+    finally:
+        temporario.close()
+    os.remove(caminho_temporario)
+
+    conn = db.get_db_connection()
+    conn.execute(
+        "INSERT INTO presenca_arquivo (caminho, inicio, fim, registros, arquivado_em) VALUES (?, ?, ?, ?, ?)",
+        (nome_arquivo, inicio.isoformat(), fim.isoformat(), len(ids), datetime.now())
+    )
+    conn.commit()
+    conn.close()
+    print(f"{len(ids)} registros de {inicio} a {fim} arquivados em {caminho_final}.")
+    return len(ids)
+
+
+def listar_arquivos():
+    """Retorna os períodos arquivados, do mais antigo ao mais recente."""
+    conn = db.get_db_connection()
+    arquivos = conn.execute("SELECT * FROM presenca_arquivo ORDER BY inicio").fetchall()
+    conn.close()
+    return [dict(row) for row in arquivos]
+
+
+def compactar(paginas_por_passo=256, pausa=0.05):
+    """
+    Devolve ao sistema as páginas livres do banco principal em pequenos passos
+    (PRAGMA incremental_vacuum), cada um em uma transação curta, sem bloquear o
+    registro de presenças. Requer auto_vacuum = INCREMENTAL; para bancos criados
+    antes disso, use converter_auto_vacuum() uma vez, com a aplicação fechada.
+    Retorna o número de páginas liberadas.
+    """
+    conn = db.get_db_connection()
+    try:
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            print("AVISO: O banco não usa auto_vacuum incremental. Execute 'python arquivamento.py --converter' "
+                  "com a aplicação fechada.")
+            return 0
+        liberadas = 0
+        while True:
+            livres = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            if livres == 0:
+                break
+            conn.execute(f"PRAGMA incremental_vacuum({min(livres, paginas_por_passo)})").fetchall()
+            conn.commit()
+            liberadas += min(livres, paginas_por_passo)
+            time.sleep(pausa)
+        return liberadas
+    finally:
+        conn.close()
+
+
+def converter_auto_vacuum():
+    """Ativa o auto_vacuum incremental no banco principal. Executa um VACUUM completo (bloqueante)."""
+    conn = db.get_db_connection()
+    try:
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Arquiva períodos letivos encerrados da tabela de presença.")
+    parser.add_argument("--ano", type=int, help="Arquiva o ano inteiro.")
+    parser.add_argument("--de", help="Primeiro dia do período (AAAA-MM-DD).")
+    parser.add_argument("--ate", help="Último dia do período (AAAA-MM-DD).")
+    parser.add_argument("--listar", action="store_true", help="Lista os períodos já arquivados.")
+    parser.add_argument("--compactar", action="store_true", help="Libera as páginas vazias do banco principal.")
+    parser.add_argument("--converter", action="store_true",
+                        help="Ativa o auto_vacuum incremental (uma única vez, com a aplicação fechada).")
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.ano:
+        arquivar_periodo(date(args.ano, 1, 1), date(args.ano, 12, 31))
+    elif args.de and args.ate:
+        arquivar_periodo(date.fromisoformat(args.de), date.fromisoformat(args.ate))
+    if args.converter:
+        converter_auto_vacuum()
+        print("auto_vacuum incremental ativado.")
+    if args.compactar:
+        print(f"{compactar()} páginas liberadas.")
+    if args.listar:
+        for arquivo in listar_arquivos():
+            print(f"{arquivo['inicio']} a {arquivo['fim']}: {arquivo['registros']} registros em {arquivo['caminho']}")
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Cópias de segurança do banco de dados com a aplicação em funcionamento.
+
+O banco é copiado com a API de backup online do SQLite, em passos de algumas
+páginas: entre um passo e outro o banco fica livre, então o leitor de QR Code
+só espera, no máximo, a duração de um passo. Se o banco for alterado durante a
+cópia, o SQLite recomeça a cópia; depois de algumas tentativas, a cópia é feita
+em um único passo (uma pausa maior, porém única).
+
+Cada cópia é verificada com PRAGMA integrity_check, comprimida com gzip e
+guardada em PASTA_BACKUPS; apenas as MANTER_BACKUPS mais recentes são mantidas.
+A duração da cópia, a maior pausa imposta aos registros de presença e a latência
+de add_attendance_record durante a cópia são impressas e exportadas em /metrics.
+
+Uso:
+    python backup.py                        # Cria uma cópia agora
+    python backup.py --verificar ARQUIVO.gz  # Verifica uma cópia existente
+"""
+
+import argparse
+import gzip
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+import database as db
+import metricas
+
+PASTA_BACKUPS = Path("backups")
+MANTER_BACKUPS = 48
+INTERVALO_PADRAO_SEGUNDOS = 3600
+PAGINAS_POR_PASSO = 256
+PAUSA_ENTRE_PASSOS = 0.01  # Segundos em que o banco fica livre entre os passos
+MAX_REINICIOS = 3
+
+_lock = threading.Lock()  # Uma cópia por vez
+_ultimo_relatorio = {}
+
+
+def _medidas():
+    return [
+        (f'backup_{chave}', None, valor) for chave, valor in _ultimo_relatorio.items()
+        if isinstance(valor, (int, float)) and not isinstance(valor, bool)
+    ]
+
+metricas.registrar_coletor(_medidas)
+
+
+class _MuitosReinicios(Exception):
+    pass
+
+
+def _copiar(origem, destino):
+    """Executa a cópia em passos. Retorna (passos, reinicios, maior_pausa_s, paginas)."""
+    estado = {'passos': 0, 'reinicios': 0, 'restantes': None, 'paginas': 0, 'maior_pausa': 0.0, 'inicio_passo': None}
+
+    def progresso(status, restantes, total):
+        agora = time.perf_counter()
+        estado['maior_pausa'] = max(estado['maior_pausa'], agora - estado['inicio_passo'])
+        estado['passos'] += 1
+        estado['paginas'] = total
+        if status == sqlite3.SQLITE_OK and estado['restantes'] is not None and restantes >= estado['restantes']:
+            # O passo não avançou: o banco foi alterado por outra conexão e a cópia recomeçou.
+            estado['reinicios'] += 1
+            if estado['reinicios'] >= MAX_REINICIOS:
+                raise _MuitosReinicios()
+        estado['restantes'] = restantes
+        time.sleep(PAUSA_ENTRE_PASSOS)
+        estado['inicio_passo'] = time.perf_counter()
+
+    estado['inicio_passo'] = time.perf_counter()
+    try:
+        origem.backup(destino, pages=PAGINAS_POR_PASSO, progress=progresso)
+    except _MuitosReinicios:
+        # Copia tudo de uma vez: uma única pausa, do tamanho da cópia inteira.
+        inicio = time.perf_counter()
+        origem.backup(destino, pages=-1)
+        estado['maior_pausa'] = max(estado['maior_pausa'], time.perf_counter() - inicio)
+        estado['passos'] += 1
+    return estado['passos'], estado['reinicios'], estado['maior_pausa'], estado['paginas']
+
+
+def verificar_integridade(caminho):
+    """Retorna o resultado de PRAGMA integrity_check ('ok' se o banco estiver íntegro)."""
+    conn = sqlite3.connect(caminho)
+    try:
+        return conn.execute("PRAGMA integrity_check").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def _rotacionar(pasta, manter):
+    copias = sorted(pasta.glob("presenca_*.db.gz"))
+    for antiga in copias[:-manter] if manter > 0 else []:
+        antiga.unlink()
+
+
+def criar_backup(pasta=PASTA_BACKUPS, manter=MANTER_BACKUPS):
+    """
+    Cria uma cópia comprimida e verificada do banco. Retorna o relatório da cópia
+    (arquivo, duração, pausas e latência dos registros de presença no período).
+    Lança RuntimeError se a verificação de integridade falhar.
+    """
+    with _lock:
+        pasta = Path(pasta)
+        pasta.mkdir(parents=True, exist_ok=True)
+        nome = f"presenca_{datetime.now():%Y%m%d_%H%M%S}.db.gz"
+        registro_antes = metricas.histograma('db_funcao_duracao_segundos', {'funcao': 'add_attendance_record'})
+
+        inicio = time.perf_counter()
+        descritor, temporario = tempfile.mkstemp(suffix='.db', dir=pasta)
+        os.close(descritor)
+        try:
+            origem = db.get_db_connection()
+            destino = sqlite3.connect(temporario)
+            try:
+                passos, reinicios, maior_pausa, paginas = _copiar(origem, destino)
+            finally:
+                destino.close()
+                origem.close()
+            duracao_copia = time.perf_counter() - inicio
+
+            integridade = verificar_integridade(temporario)
+            if integridade != 'ok':
+                raise RuntimeError(f"Falha na verificação de integridade da cópia: {integridade}")
+
+            with open(temporario, 'rb') as entrada, gzip.open(pasta / nome, 'wb', compresslevel=6) as saida:
+                shutil.copyfileobj(entrada, saida, length=1024 * 1024)
+        finally:
+            os.remove(temporario)
+
+        _rotacionar(pasta, manter)
+
+        relatorio = {
+            'arquivo': str(pasta / nome),
+            'duracao_s': round(time.perf_counter() - inicio, 3),
+            'duracao_copia_s': round(duracao_copia, 3),
+            'passos': passos,
+            'reinicios': reinicios,
+            'maior_pausa_ms': round(maior_pausa * 1000, 2),
+            'paginas': paginas,
+            'tamanho_bytes': (pasta / nome).stat().st_size,
+            'integridade': integridade,
+            'concluido_em': datetime.now().isoformat(timespec='seconds'),
+        }
+
+        # Registros de presença feitos durante a cópia (se a instrumentação estiver ativa).
+        registro_depois = metricas.histograma('db_funcao_duracao_segundos', {'funcao': 'add_attendance_record'})
+        if registro_depois:
+            buckets = list(registro_depois[0])
+            contagem = registro_depois[2]
+            if registro_antes:
+                buckets = [depois - antes for depois, antes in zip(buckets, registro_antes[0])]
+                contagem -= registro_antes[2]
+            relatorio['registros_durante'] = contagem
+            if contagem:
+                relatorio['registro_p95_durante_ms'] = round(metricas.percentil(buckets, contagem, 0.95) * 1000, 2)
+
+        _ultimo_relatorio.clear()
+        _ultimo_relatorio.update(relatorio)
+        print(f"[BACKUP] Cópia criada em {relatorio['arquivo']} ({relatorio['duracao_s']} s, "
+              f"{passos} passos, maior pausa {relatorio['maior_pausa_ms']} ms).")
+        return relatorio
+
+
+def ultimo_relatorio():
+    """Retorna o relatório da última cópia feita por este processo."""
+    return dict(_ultimo_relatorio)
+
+
+def iniciar_agendador(intervalo_segundos=INTERVALO_PADRAO_SEGUNDOS):
+    """Cria uma cópia a cada 'intervalo_segundos' em uma thread daemon."""
+    def _loop():
+        while True:
+            time.sleep(intervalo_segundos)
+            try:
+                criar_backup()
+            except Exception as e:
+                print(f"[BACKUP] Erro ao criar a cópia de segurança: {e}")
+
+    thread = threading.Thread(target=_loop, name='backup', daemon=True)
+    thread.start()
+    return thread
+
+
+def verificar_backup(caminho_gz):
+    """Descomprime uma cópia em um arquivo temporário e verifica a integridade."""
+    descritor, temporario = tempfile.mkstemp(suffix='.db')
+    os.close(descritor)
+    try:
+        with gzip.open(caminho_gz, 'rb') as entrada, open(temporario, 'wb') as saida:
+            shutil.copyfileobj(entrada, saida, length=1024 * 1024)
+        return verificar_integridade(temporario)
+    finally:
+        os.remove(temporario)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Cópias de segurança do banco de dados.")
+    parser.add_argument("--verificar", help="Verifica a integridade de uma cópia (.db.gz).")
+    parser.add_argument("--pasta", default=str(PASTA_BACKUPS), help="Pasta das cópias.")
+    parser.add_argument("--manter", type=int, default=MANTER_BACKUPS, help="Quantidade de cópias mantidas.")
+    args = parser.parse_args()
+
+    if args.verificar:
+        print(f"{args.verificar}: {verificar_backup(args.verificar)}")
+    else:
+        for chave, valor in criar_backup(args.pasta, args.manter).items():
+            print(f"{chave}: {valor}")
@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""
+Benchmarks das funções do database.py sobre uma escola sintética.
+
+Cenários:
+- dashboard: get_all_students_with_latest_attendance (consulta do painel web).
+- registro_concorrente: add_attendance_record chamado por várias threads ao
+  mesmo tempo, como vários leitores de QR Code no horário de entrada.
+- historico_ra: get_student_attendance_history_by_ra para RAs aleatórios.
+- importacao: add_student + add_user por aluno, o mesmo caminho da importação
+  de arquivos JSON.
+
+O resultado (operações por segundo e latências p50/p95/p99 em ms) é impresso em
+JSON; com --comparar, é comparado com um resultado anterior, para medir o efeito
+de mudanças no database.py.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.bench_banco --saida antes.json
+    python -m benchmarks.bench_banco --saida depois.json --comparar antes.json
+"""
+
+import argparse
+import json
+import platform
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database as db
+from benchmarks.gerador import gerar_escola, adicionar_argumentos_escala
+
+
+def estatisticas(latencias, duracao_total, erros=0):
+    """Resume uma lista de latências (em segundos)."""
+    ordenadas = sorted(latencias)
+
+    def percentil(fracao):
+        if not ordenadas:
+            return None
+        indice = min(len(ordenadas) - 1, int(round(fracao * (len(ordenadas) - 1))))
+        return round(ordenadas[indice] * 1000, 3)
+
+    return {
+        'operacoes': len(ordenadas),
+        'erros': erros,
+        'duracao_s': round(duracao_total, 3),
+        'ops_por_segundo': round(len(ordenadas) / duracao_total, 1) if duracao_total > 0 else None,
+        'p50_ms': percentil(0.50),
+        'p95_ms': percentil(0.95),
+        'p99_ms': percentil(0.99),
+        'max_ms': round(ordenadas[-1] * 1000, 3) if ordenadas else None,
+    }
+
+
+def _medir_sequencial(funcao, argumentos):
+    latencias = []
+    inicio_total = time.perf_counter()
+    for args in argumentos:
+        inicio = time.perf_counter()
+        funcao(*args)
+        latencias.append(time.perf_counter() - inicio)
+    return estatisticas(latencias, time.perf_counter() - inicio_total)
+
+
+def cenario_dashboard(repeticoes, rng):
+    db.get_all_students_with_latest_attendance()  # Aquece o cache de páginas do SQLite
+    return _medir_sequencial(db.get_all_students_with_latest_attendance, [()] * repeticoes)
+
+
+def cenario_historico(repeticoes, rng, ras):
+    return _medir_sequencial(db.get_student_attendance_history_by_ra, [(rng.choice(ras),) for _ in range(repeticoes)])
+
+
+def cenario_registro_concorrente(escritores, leituras_por_escritor, rng, ids):
+    """Cada escritor registra entradas de alunos aleatórios às 7:25 de hoje."""
+    instante = datetime.combine(date.today(), datetime.min.time()).replace(hour=7, minute=25)
+    lotes = [[rng.choice(ids) for _ in range(leituras_por_escritor)] for _ in range(escritores)]
+    latencias = []
+    erros = [0]
+    lock = threading.Lock()
+    barreira = threading.Barrier(escritores)
+
+    def escritor(lote):
+        locais = []
+        barreira.wait()
+        for aluno_id in lote:
+            inicio = time.perf_counter()
+            try:
+                db.add_attendance_record(aluno_id, agora=instante)
+            except sqlite3.OperationalError:  # ex: "database is locked"
+                with lock:
+                    erros[0] += 1
+                continue
+            locais.append(time.perf_counter() - inicio)
+        with lock:
+            latencias.extend(locais)
+
+    inicio_total = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=escritores) as executor:
+        list(executor.map(escritor, lotes))
+    resultado = estatisticas(latencias, time.perf_counter() - inicio_total, erros[0])
+    resultado['escritores'] = escritores
+    return resultado
+
+
+def cenario_importacao(quantidade, rng):
+    """Importa 'quantidade' alunos novos, um a um, como a importação de JSON faz."""
+    base = 50_000_000 + rng.randint(0, 1_000_000) * 1000
+
+    def importar(ra):
+        db.add_student(ra, f"Aluno Importado {ra}", "999999", inep=None)
+        db.add_user(ra, ra, "aluno")
+
+    return _medir_sequencial(importar, [(str(base + i),) for i in range(quantidade)])
+
+
+def executar(args):
+    rng = random.Random(args.semente)
+    with tempfile.TemporaryDirectory() as pasta:
+        caminho = args.banco or str(Path(pasta) / 'bench.db')
+        inicio = time.perf_counter()
+        escala = gerar_escola(
+            caminho, args.turmas, args.alunos_por_turma, args.dias,
+            args.leituras_por_dia, args.taxa_presenca, args.semente
+        )
+        escala['geracao_s'] = round(time.perf_counter() - inicio, 2)
+
+        conn = db.get_db_connection()
+        alunos = conn.execute("SELECT id, ra FROM alunos").fetchall()
+        conn.close()
+        ids = [row['id'] for row in alunos]
+        ras = [row['ra'] for row in alunos]
+
+        cenarios = {}
+        print("Executando: dashboard...", file=sys.stderr)
+        cenarios['dashboard'] = cenario_dashboard(args.repeticoes, rng)
+        print("Executando: historico_ra...", file=sys.stderr)
+        cenarios['historico_ra'] = cenario_historico(args.repeticoes * 10, rng, ras)
+        print("Executando: registro_concorrente...", file=sys.stderr)
+        cenarios['registro_concorrente'] = cenario_registro_concorrente(args.escritores, args.leituras_por_escritor, rng, ids)
+        print("Executando: importacao...", file=sys.stderr)
+        cenarios['importacao'] = cenario_importacao(args.importacao, rng)
+
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'plataforma': platform.platform(),
+        'escala': escala,
+        'cenarios': cenarios,
+    }
+
+
+def comparar(anterior, atual):
+    """Imprime a variação de ops/s e p95 entre dois resultados."""
+    print(f"{'cenário':<24}{'ops/s antes':>14}{'ops/s depois':>14}{'p95 antes':>12}{'p95 depois':>12}{'variação p95':>14}")
+    for nome, depois in atual['cenarios'].items():
+        antes = anterior.get('cenarios', {}).get(nome)
+        if not antes:
+            continue
+        variacao = ''
+        if antes.get('p95_ms') and depois.get('p95_ms') is not None:
+            variacao = f"{(depois['p95_ms'] / antes['p95_ms'] - 1):+.1%}"
+        print(f"{nome:<24}{antes['ops_por_segundo'] or 0:>14}{depois['ops_por_segundo'] or 0:>14}"
+              f"{antes['p95_ms'] or 0:>12}{depois['p95_ms'] or 0:>12}{variacao:>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks das funções do banco de dados.")
+    adicionar_argumentos_escala(parser)
+    parser.add_argument("--banco", help="Arquivo do banco sintético (padrão: arquivo temporário).")
+    parser.add_argument("--repeticoes", type=int, default=50, help="Execuções da consulta do dashboard.")
+    parser.add_argument("--escritores", type=int, default=4, help="Threads registrando presença ao mesmo tempo.")
+    parser.add_argument("--leituras-por-escritor", type=int, default=200)
+    parser.add_argument("--importacao", type=int, default=50, help="Alunos importados no cenário de importação.")
+    parser.add_argument("--saida", help="Grava o resultado JSON neste arquivo (além de imprimir).")
+    parser.add_argument("--comparar", help="Resultado JSON anterior para comparação.")
+    args = parser.parse_args()
+
+    resultado = executar(args)
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    print(texto)
+    if args.saida:
+        Path(args.saida).write_text(texto, encoding='utf-8')
+    if args.comparar:
+        comparar(json.loads(Path(args.comparar).read_text(encoding='utf-8')), resultado)
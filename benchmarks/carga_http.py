@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+"""
+Teste de carga da API web (web/app.py) sobre uma escola sintética.
+
+Cada "usuário" simula um celular de professor: faz login uma vez e, até o fim do
+teste, escolhe ações pelos pesos configurados (polling do dashboard, página de
+histórico de um aluno, repopulação de alunos), com uma pausa entre elas. Ao
+mesmo tempo, "leitores" simulam a aplicação desktop registrando presenças
+diretamente no banco, como os leitores de QR Code no horário de entrada.
+
+O servidor é iniciado localmente: no modo "socket", um servidor HTTP com threads
+(o mesmo usado por app.run) em uma porta livre de 127.0.0.1; no modo
+"test_client", as requisições passam pelo cliente de testes do Flask, sem rede.
+
+Cenário e escala vêm de um arquivo JSON (veja benchmarks/carga_http.json), para
+que as execuções sejam repetíveis. O resultado (vazão, latências p50/p95/p99 e
+taxa de erros por endpoint) é impresso em JSON.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.carga_http --config benchmarks/carga_http.json --saida carga.json
+"""
+
+import argparse
+import http.cookiejar
+import json
+import logging
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database as db
+from benchmarks.gerador import gerar_escola
+from benchmarks.bench_banco import estatisticas
+
+CONFIG_PADRAO = Path(__file__).resolve().parent / 'carga_http.json'
+SENHA_PROFESSOR = 'carga123'
+
+# Ação -> (método, caminho). '{ra}' é trocado por um RA aleatório.
+ACOES = {
+    'dashboard': ('GET', '/api/presence_data?format=columnar'),
+    'historico': ('GET', '/aluno/{ra}'),
+    'repopulate': ('POST', '/api/repopulate_students'),
+}
+
+
+class ClienteSocket:
+    """Cliente HTTP real, com cookies de sessão, para o modo 'socket'."""
+
+    def __init__(self, url_base):
+        self.url_base = url_base
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def requisitar(self, metodo, caminho, dados=None):
+        corpo = urllib.parse.urlencode(dados).encode() if dados is not None else (b'' if metodo == 'POST' else None)
+        requisicao = urllib.request.Request(self.url_base + caminho, data=corpo, method=metodo)
+        try:
+            with self.opener.open(requisicao, timeout=30) as resposta:
+                resposta.read()
+                return resposta.status, urllib.parse.urlparse(resposta.url).path
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code, caminho
+
+
+class ClienteTeste:
+    """Cliente de testes do Flask, para o modo 'test_client'."""
+
+    def __init__(self, app):
+        self.cliente = app.test_client()
+
+    def requisitar(self, metodo, caminho, dados=None):
+        resposta = self.cliente.open(caminho, method=metodo, data=dados, follow_redirects=True)
+        resposta.get_data()
+        return resposta.status_code, resposta.request.path
+
+
+class Medicoes:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latencias = {}
+        self._erros = {}
+
+    def registrar(self, nome, segundos, erro):
+        with self._lock:
+            self._latencias.setdefault(nome, []).append(segundos)
+            if erro:
+                self._erros[nome] = self._erros.get(nome, 0) + 1
+
+    def resumo(self, duracao):
+        resultado = {}
+        for nome, latencias in sorted(self._latencias.items()):
+            erros = self._erros.get(nome, 0)
+            resultado[nome] = estatisticas(latencias, duracao, erros)
+            resultado[nome]['taxa_erros'] = round(erros / len(latencias), 4)
+        return resultado
+
+
+def _usuario(cliente, indice, config, ras, fim, medicoes, rng):
+    inicio = time.perf_counter()
+    try:
+        status, caminho_final = cliente.requisitar('POST', '/login', {'username': f'carga_prof{indice}', 'password': SENHA_PROFESSOR})
+        erro = status >= 400 or caminho_final.endswith('/login')
+    except Exception:
+        erro = True
+    medicoes.registrar('login', time.perf_counter() - inicio, erro)
+    if erro:
+        return
+
+    acoes = [nome for nome, peso in config['acoes'].items() if peso > 0]
+    pesos = [config['acoes'][nome] for nome in acoes]
+    while acoes and time.monotonic() < fim:
+        nome = rng.choices(acoes, pesos)[0]
+        metodo, caminho = ACOES[nome]
+        inicio = time.perf_counter()
+        try:
+            status, _ = cliente.requisitar(metodo, caminho.format(ra=rng.choice(ras)))
+            erro = status >= 400
+        except Exception:
+            erro = True
+        medicoes.registrar(nome, time.perf_counter() - inicio, erro)
+        time.sleep(config['pausa_segundos'] * rng.uniform(0.5, 1.5))
+
+
+def _leitor(ids, intervalo, fim, medicoes, rng):
+    instante = datetime.combine(date.today(), datetime.min.time()).replace(hour=7, minute=25)
+    while time.monotonic() < fim:
+        inicio = time.perf_counter()
+        try:
+            db.add_attendance_record(rng.choice(ids), agora=instante)
+            erro = False
+        except Exception:
+            erro = True
+        medicoes.registrar('leitor_qrcode', time.perf_counter() - inicio, erro)
+        time.sleep(intervalo)
+
+
+def executar(config):
+    rng = random.Random(config.get('semente', 42))
+    with tempfile.TemporaryDirectory() as pasta:
+        escala = gerar_escola(Path(pasta) / 'carga.db', semente=config.get('semente', 42), **config['escala'])
+        quantidade_usuarios = config['usuarios']['quantidade']
+        for i in range(quantidade_usuarios):
+            db.add_user(f'carga_prof{i}', SENHA_PROFESSOR, 'professor')
+
+        conn = db.get_db_connection()
+        alunos = conn.execute("SELECT id, ra FROM alunos").fetchall()
+        conn.close()
+        ids = [row['id'] for row in alunos]
+        ras = [row['ra'] for row in alunos]
+
+        # Importado só depois de apontar database.DB_FILE para o banco sintético.
+        from web.app import app
+
+        servidor = None
+        if config.get('modo', 'socket') == 'socket':
+            from werkzeug.serving import make_server
+            logging.getLogger('werkzeug').setLevel(logging.ERROR)  # Sem uma linha de log por requisição
+            servidor = make_server('127.0.0.1', 0, app, threaded=True)
+            threading.Thread(target=servidor.serve_forever, daemon=True).start()
+            url_base = f"http://127.0.0.1:{servidor.server_port}"
+            novo_cliente = lambda: ClienteSocket(url_base)
+        else:
+            novo_cliente = lambda: ClienteTeste(app)
+
+        medicoes = Medicoes()
+        duracao = config['duracao_segundos']
+        inicio = time.perf_counter()
+        fim = time.monotonic() + duracao
+        threads = [
+            threading.Thread(target=_usuario, args=(novo_cliente(), i, config['usuarios'], ras, fim, medicoes,
+                                                    random.Random(rng.random())))
+            for i in range(quantidade_usuarios)
+        ]
+        leitores = config.get('leitores', {})
+        threads += [
+            threading.Thread(target=_leitor, args=(ids, leitores.get('intervalo_segundos', 0.2), fim, medicoes,
+                                                   random.Random(rng.random())))
+            for _ in range(leitores.get('quantidade', 0))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duracao_real = time.perf_counter() - inicio
+        if servidor is not None:
+            servidor.shutdown()
+
+    return {
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+        'config': config,
+        'escala': escala,
+        'duracao_s': round(duracao_real, 2),
+        'endpoints': medicoes.resumo(duracao_real),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga da API web.")
+    parser.add_argument("--config", default=str(CONFIG_PADRAO), help="Arquivo JSON com o cenário e a escala.")
+    parser.add_argument("--saida", help="Grava o resultado JSON neste arquivo (além de imprimir).")
+    args = parser.parse_args()
+
+    config = json.loads(Path(args.config).read_text(encoding='utf-8'))
+    texto = json.dumps(executar(config), ensure_ascii=False, indent=2)
+    print(texto)
+    if args.saida:
+        Path(args.saida).write_text(texto, encoding='utf-8')
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Gerador de escolas sintéticas para os benchmarks.
+
+Cria um 'presenca.db' com o esquema real (database.init_db) e o preenche com
+turmas, alunos e leituras de QR Code em dias letivos (segunda a sexta), de forma
+determinística: a mesma semente e a mesma escala geram sempre o mesmo banco.
+
+Uso (a partir da raiz do projeto):
+    python -m benchmarks.gerador bench.db --turmas 20 --alunos-por-turma 35 --dias 60
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import database as db
+
+ESCALA_PADRAO = {
+    'turmas': 20,
+    'alunos_por_turma': 35,
+    'dias': 60,
+    'leituras_por_dia': 2,  # 1 = apenas entrada; 2 = entrada e saída
+    'taxa_presenca': 0.9,
+}
+
+NOMES = ['Ana', 'Bruno', 'Carla', 'Diego', 'Eduarda', 'Felipe', 'Gabriela', 'Heitor', 'Isabela', 'João',
+         'Larissa', 'Mateus', 'Natália', 'Otávio', 'Paula', 'Rafael', 'Sofia', 'Thiago', 'Vitória', 'Yuri']
+SOBRENOMES = ['Almeida', 'Barbosa', 'Cardoso', 'Dias', 'Ferreira', 'Gomes', 'Lima', 'Martins', 'Nunes',
+              'Oliveira', 'Pereira', 'Ribeiro', 'Santos', 'Souza', 'Teixeira']
+
+
+def dias_letivos(quantidade, ate=None):
+    """Retorna os 'quantidade' últimos dias úteis até 'ate' (inclusive), em ordem crescente."""
+    dia = ate or date.today()
+    dias = []
+    while len(dias) < quantidade:
+        if dia.weekday() < 5:
+            dias.append(dia)
+        dia -= timedelta(days=1)
+    return dias[::-1]
+
+
+def _instante(dia, hora, minuto_base, variacao, rng):
+    inicio = datetime.combine(dia, datetime.min.time()).replace(hour=hora, minute=minuto_base)
+    return inicio + timedelta(seconds=rng.randint(-variacao * 60, variacao * 60), microseconds=rng.randint(0, 999999))
+
+
+def gerar_escola(caminho, turmas=20, alunos_por_turma=35, dias=60, leituras_por_dia=2,
+                 taxa_presenca=0.9, semente=42, ate=None):
+    """
+    Cria (ou recria) o banco em 'caminho' e o preenche com dados sintéticos.
+    A partir desta chamada, database.DB_FILE aponta para o banco gerado.
+    Retorna um dicionário com a escala usada e os totais gerados.
+    """
+    rng = random.Random(semente)
+    caminho = str(caminho)
+    for sufixo in ('', '-wal', '-shm'):
+        if os.path.exists(caminho + sufixo):
+            os.remove(caminho + sufixo)
+    db.DB_FILE = caminho
+    db.init_db()
+
+    conn = db.get_db_connection()
+    codigos = [str(100000 + i) for i in range(turmas)]
+    conn.executemany(
+        "INSERT OR REPLACE INTO turmas (codigo_turma, nome_turma) VALUES (?, ?)",
+        [(codigo, f"{i % 3 + 1}º Ano {chr(65 + i // 3 % 26)} - Sintética") for i, codigo in enumerate(codigos)]
+    )
+
+    alunos = []
+    for i_turma, codigo in enumerate(codigos):
+        for i_aluno in range(alunos_por_turma):
+            ra = str(10_000_000 + i_turma * 1000 + i_aluno)
+            nome = f"{rng.choice(NOMES)} {rng.choice(SOBRENOMES)} {rng.choice(SOBRENOMES)}"
+            alunos.append((ra, nome, codigo, str(90_000_000 + i_turma * 1000 + i_aluno)))
+    conn.executemany("INSERT INTO alunos (ra, nome, codigo_turma, inep) VALUES (?, ?, ?, ?)", alunos)
+    ids = [row[0] for row in conn.execute("SELECT id FROM alunos ORDER BY id")]
+
+    total_leituras = 0
+    for dia in dias_letivos(dias, ate):
+        registros = []
+        for aluno_id in ids:
+            if rng.random() >= taxa_presenca:
+                continue
+            # A maioria chega entre 7:00 e 7:40; alguns chegam atrasados.
+            entrada = _instante(dia, 7, 20, 20 if rng.random() < 0.85 else 60, rng)
+            registros.append((aluno_id, 'entrada', entrada))
+            if leituras_por_dia >= 2 and rng.random() < 0.95:
+                registros.append((aluno_id, 'saida', _instante(dia, 16, 20, 30, rng)))
+        conn.executemany("INSERT INTO presenca (aluno_id, tipo_registro, timestamp) VALUES (?, ?, ?)", registros)
+        total_leituras += len(registros)
+    conn.commit()
+    conn.close()
+
+    return {
+        'turmas': turmas,
+        'alunos_por_turma': alunos_por_turma,
+        'dias': dias,
+        'leituras_por_dia': leituras_por_dia,
+        'taxa_presenca': taxa_presenca,
+        'semente': semente,
+        'total_alunos': len(ids),
+        'total_leituras': total_leituras,
+    }
+
+
+def adicionar_argumentos_escala(parser):
+    """Argumentos de escala compartilhados pelos scripts de benchmark."""
+    parser.add_argument("--turmas", type=int, default=ESCALA_PADRAO['turmas'])
+    parser.add_argument("--alunos-por-turma", type=int, default=ESCALA_PADRAO['alunos_por_turma'])
+    parser.add_argument("--dias", type=int, default=ESCALA_PADRAO['dias'], help="Dias letivos gerados (até hoje).")
+    parser.add_argument("--leituras-por-dia", type=int, choices=[1, 2], default=ESCALA_PADRAO['leituras_por_dia'],
+                        help="1 = apenas entrada; 2 = entrada e saída.")
+    parser.add_argument("--taxa-presenca", type=float, default=ESCALA_PADRAO['taxa_presenca'])
+    parser.add_argument("--semente", type=int, default=42)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Gera um banco de dados sintético para benchmarks.")
+    parser.add_argument("caminho", help="Arquivo do banco a ser criado (será sobrescrito).")
+    adicionar_argumentos_escala(parser)
+    args = parser.parse_args()
+
+    resumo = gerar_escola(
+        args.caminho, args.turmas, args.alunos_por_turma, args.dias,
+        args.leituras_por_dia, args.taxa_presenca, args.semente
+    )
+    print(f"Banco gerado em {args.caminho}: {resumo['total_alunos']} alunos, {resumo['total_leituras']} leituras.")
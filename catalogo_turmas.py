@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Catálogo de turmas compartilhado pelas aplicações web e desktop.
+
+O arquivo 'data/turmas-com-disciplinas.json' é lido uma única vez e mantido em
+memória como um mapeamento imutável (codigo_turma -> nome_turma). A data de
+modificação do arquivo é verificada no máximo a cada INTERVALO_VERIFICACAO
+segundos; se o arquivo mudou, um novo mapeamento é carregado e substitui o
+anterior de uma só vez, sem reiniciar a aplicação.
+
+A cada carga, o catálogo também é gravado na tabela 'turmas', para que as
+consultas SQL possam fazer JOIN com os nomes das turmas.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from types import MappingProxyType
+import database as db
+
+CAMINHO_PADRAO = Path(__file__).resolve().parent / 'data' / 'turmas-com-disciplinas.json'
+INTERVALO_VERIFICACAO = 5.0  # segundos
+
+
+class CatalogoTurmas:
+    def __init__(self, caminho=CAMINHO_PADRAO, intervalo=INTERVALO_VERIFICACAO):
+        self.caminho = Path(caminho)
+        self.intervalo = intervalo
+        self._turmas = MappingProxyType({})
+        self._mtime = None
+        self._proxima_verificacao = 0.0
+        self._lock = threading.Lock()
+
+    def nomes(self):
+        """Retorna o mapeamento atual codigo_turma -> nome_turma (somente leitura)."""
+        if time.monotonic() >= self._proxima_verificacao:
+            self.recarregar()
+        return self._turmas
+
+    def nome(self, codigo_turma, padrao=None):
+        """Retorna o nome da turma, ou 'padrao' (por padrão, o próprio código) se não existir."""
+        return self.nomes().get(codigo_turma, codigo_turma if padrao is None else padrao)
+
+    def __contains__(self, codigo_turma):
+        return codigo_turma in self.nomes()
+
+    def recarregar(self, forcar=False):
+        """
+        Relê o arquivo se a data de modificação mudou (ou sempre, com 'forcar').
+        Retorna True se um novo catálogo foi carregado.
+        """
+        with self._lock:
+            self._proxima_verificacao = time.monotonic() + self.intervalo
+            try:
+                mtime = os.stat(self.caminho).st_mtime_ns
+            except OSError as e:
+                if self._mtime is None:
+                    print(f"AVISO: Arquivo de turmas não encontrado: {self.caminho}. Erro: {e}")
+                    self._mtime = -1
+                return False
+            if not forcar and mtime == self._mtime:
+                return False
+
+            try:
+                with open(self.caminho, 'r', encoding='utf-8') as f:
+                    turmas_data = json.load(f)
+                turmas = {str(item['codigoTurma']): item['nomeTurma'] for item in turmas_data}
+            except Exception as e:
+                # Mantém o catálogo anterior se o arquivo estiver sendo editado ou for inválido.
+                print(f"AVISO: Não foi possível carregar as turmas do arquivo JSON. Erro: {e}")
+                self._mtime = mtime
+                return False
+
+            self._turmas = MappingProxyType(turmas)
+            self._mtime = mtime
+        print(f"Catálogo de turmas carregado: {len(turmas)} turmas.")
+        self._persistir(turmas)
+        return True
+
+    def _persistir(self, turmas):
+        """Sincroniza a tabela 'turmas' com o catálogo carregado."""
+        conn = db.get_db_connection()
+        try:
+            conn.executemany(
+                "INSERT INTO turmas (codigo_turma, nome_turma) VALUES (?, ?) "
+                "ON CONFLICT(codigo_turma) DO UPDATE SET nome_turma = excluded.nome_turma",
+                list(turmas.items())
+            )
+            placeholders = ', '.join('?' for _ in turmas)
+            conn.execute(f"DELETE FROM turmas WHERE codigo_turma NOT IN ({placeholders})", list(turmas))
+            conn.commit()
+        except sqlite3.OperationalError as e:
+            # A tabela ainda não existe (init_db não foi executado); tenta de novo na próxima carga.
+            print(f"AVISO: Não foi possível gravar as turmas no banco de dados. Erro: {e}")
+            self._mtime = None
+        finally:
+            conn.close()
+
+
+# Instância única usada por toda a aplicação.
+catalogo = CatalogoTurmas()
@@ -0,0 +1,205 @@
+# -*- coding: utf-8 -*-
+"""
+Contadores de ocupação do dia, mantidos em memória.
+
+Guardam, por turma e para a escola, quantos alunos estão em cada status de
+presença (database.STATUS_PRESENCA) e quantos estão dentro da escola agora
+(entraram e ainda não saíram). O estado de cada aluno fica em arrays
+compactos indexados pelo id do aluno (turma, horário da última entrada e da
+última saída em segundos desde a meia-noite, e status), então cada leitura
+atualiza os contadores em tempo constante, sem consultar o banco.
+
+- Os arrays são carregados do banco na primeira consulta do dia (e na virada
+  do dia) por carregar(). Uma carga por vez: consultas simultâneas esperam a
+  carga em andamento em vez de repeti-la, e as leituras gravadas durante a
+  carga são guardadas e reaplicadas no fim dela.
+- add_attendance_record, add_attendance_records_bulk e a sincronização entre
+  estações chamam registrar_leitura() depois de gravar cada leitura. Como fica
+  a leitura mais recente de cada tipo, aplicar a mesma leitura duas vezes não
+  altera os contadores.
+- Mudanças nos alunos (importação, troca de turma) e nas regras de horário
+  chamam invalidar(), e os arrays são recarregados na próxima consulta.
+
+resumo() é a base da rota /api/summary, feita para ser consultada a cada
+segundo por painéis de TV.
+"""
+
+import threading
+from array import array
+from datetime import date, datetime, timedelta
+import database as db
+import regras_horario
+
+# Posição de cada contador: os códigos de database.STATUS_PRESENCA e, depois deles, os alunos dentro da escola.
+DENTRO = len(db.STATUS_PRESENCA)
+CHAVES_STATUS = ('ausentes', 'apenas_entrada', 'pontuais', 'atrasos', 'saidas_antecipadas')
+
+_lock = threading.Lock()
+_lock_carga = threading.RLock()  # Uma carga por vez (veja resumo)
+_estado = {'dia': None, 'geracao': 0, 'carregando': False}
+_pendentes = []  # Leituras recebidas durante a carga: (aluno_id, tipo_registro, instante)
+
+
+def _segundos(timestamp):
+    """Segundos desde a meia-noite de um timestamp ('AAAA-MM-DD HH:MM:SS...' ou datetime)."""
+    texto = str(timestamp)
+    return int(texto[11:13]) * 3600 + int(texto[14:16]) * 60 + int(texto[17:19])
+
+
+def _timestamp(dia_iso, segundos):
+    if segundos < 0:
+        return None
+    return f"{dia_iso} {segundos // 3600:02d}:{segundos // 60 % 60:02d}:{segundos % 60:02d}"
+
+
+def _avaliar(i):
+    """Status (código) e se o aluno de índice 'i' está dentro da escola. Chamar com _lock."""
+    entrada, saida = _estado['entrada'][i], _estado['saida'][i]
+    status = regras_horario.status_presenca(
+        _estado['turmas'][_estado['turma'][i]], _timestamp(_estado['dia_iso'], entrada), _timestamp(_estado['dia_iso'], saida)
+    )
+    return db.STATUS_PRESENCA.index(status), int(entrada >= 0 and saida < entrada)
+
+
+def _aplicar(aluno_id, tipo_registro, instante):
+    """Aplica uma leitura aos arrays já carregados. Chamar com _lock."""
+    if aluno_id >= len(_estado['turma']) or _estado['turma'][aluno_id] < 0:
+        _estado['dia'] = None  # Aluno cadastrado depois da carga: recarrega na próxima consulta.
+        return
+    horarios = _estado[tipo_registro]
+    segundos = _segundos(instante)
+    if segundos <= horarios[aluno_id]:
+        return  # Já existe uma leitura igual ou mais recente.
+    _contar(aluno_id, -1)
+    horarios[aluno_id] = segundos
+    _estado['status'][aluno_id], _estado['dentro'][aluno_id] = _avaliar(aluno_id)
+    _contar(aluno_id, 1)
+
+
+def _contar(i, sinal):
+    """Soma (sinal=1) ou retira (sinal=-1) o aluno 'i' dos contadores da turma dele e da escola."""
+    por_turma = _estado['contagens'][_estado['turma'][i]]
+    total = _estado['total']
+    status = _estado['status'][i]
+    por_turma[status] += sinal
+    total[status] += sinal
+    if _estado['dentro'][i]:
+        por_turma[DENTRO] += sinal
+        total[DENTRO] += sinal
+
+
+def carregar(dia=None):
+    """Carrega do banco os alunos e as leituras do dia e recalcula todos os contadores."""
+    dia = dia or date.today()
+    inicio = datetime.combine(dia, datetime.min.time())
+    with _lock_carga:
+        with _lock:
+            geracao = _estado['geracao']
+            _estado['carregando'] = True
+            del _pendentes[:]
+        try:
+            conn = db.get_db_connection()
+            try:
+                alunos = conn.execute("SELECT id, codigo_turma FROM alunos").fetchall()
+                leituras = conn.execute(
+                    "SELECT aluno_id, tipo_registro, MAX(timestamp) AS timestamp FROM presenca "
+                    "WHERE timestamp >= ? AND timestamp < ? GROUP BY aluno_id, tipo_registro",
+                    (inicio, inicio + timedelta(days=1))
+                ).fetchall()
+            finally:
+                conn.close()
+
+            with _lock:
+                tamanho = max((row['id'] for row in alunos), default=0) + 1
+                turmas = sorted({row['codigo_turma'] for row in alunos}, key=lambda codigo: (codigo is None, codigo or ''))
+                indice_turma = {codigo: i for i, codigo in enumerate(turmas)}
+                _estado.update(
+                    # Se invalidar() foi chamada durante a leitura do banco, a carga já nasce vencida.
+                    dia=dia if geracao == _estado['geracao'] else None,
+                    dia_iso=dia.isoformat(),
+                    turmas=turmas,
+                    turma=array('i', [-1]) * tamanho,
+                    entrada=array('i', [-1]) * tamanho,
+                    saida=array('i', [-1]) * tamanho,
+                    status=array('b', [0]) * tamanho,
+                    dentro=array('b', [0]) * tamanho,
+                    contagens=[array('i', [0] * (DENTRO + 1)) for _ in turmas],
+                    total=array('i', [0] * (DENTRO + 1)),
+                )
+                for row in alunos:
+                    _estado['turma'][row['id']] = indice_turma[row['codigo_turma']]
+                for row in leituras:
+                    if row['aluno_id'] < tamanho and _estado['turma'][row['aluno_id']] >= 0:
+                        _estado[row['tipo_registro']][row['aluno_id']] = _segundos(row['timestamp'])
+                for row in alunos:
+                    i = row['id']
+                    _estado['status'][i], _estado['dentro'][i] = _avaliar(i)
+                    _contar(i, 1)
+                # Leituras gravadas durante a leitura do banco. As que a consulta já trouxe não mudam nada.
+                for aluno_id, tipo_registro, instante in _pendentes:
+                    if _estado['dia'] is not None and instante.date() == dia:
+                        _aplicar(aluno_id, tipo_registro, instante)
+        finally:
+            with _lock:
+                _estado['carregando'] = False
+                del _pendentes[:]
+
+
+def invalidar():
+    """Descarta os contadores; eles são recarregados do banco na próxima consulta."""
+    with _lock:
+        _estado['dia'] = None
+        _estado['geracao'] += 1
+
+
+def registrar_leitura(aluno_id, tipo_registro, instante):
+    """
+    Atualiza os contadores com uma leitura já gravada no banco. Leituras de
+    outros dias e de alunos desconhecidos (cadastrados depois da carga) são
+    ignoradas; no segundo caso, os contadores são recarregados na próxima consulta.
+    Durante uma carga, a leitura é guardada e aplicada no fim dela.
+    """
+    with _lock:
+        if _estado['carregando']:
+            _pendentes.append((aluno_id, tipo_registro, instante))
+            return
+        if _estado['dia'] is None or instante.date() != _estado['dia']:
+            return  # Ainda não carregados hoje: a carga já vai trazer esta leitura.
+        _aplicar(aluno_id, tipo_registro, instante)
+
+
+def _formatar(contagem):
+    resumo = dict(zip(CHAVES_STATUS, contagem))
+    resumo['alunos'] = sum(contagem[:DENTRO])
+    resumo['presentes'] = resumo['alunos'] - resumo['ausentes']
+    resumo['dentro'] = contagem[DENTRO]
+    return resumo
+
+
+def resumo():
+    """
+    Contadores do dia: 'escola' e 'turmas' (uma por código de turma), cada um
+    com alunos, presentes (status diferente de 'Ausente'), ausentes, pontuais
+    ('Presente'), atrasos, saidas_antecipadas, apenas_entrada e dentro.
+    """
+    if _estado['dia'] != date.today():
+        with _lock_carga:
+            # Quem esperou a carga de outra consulta já encontra os contadores prontos.
+            if _estado['dia'] != date.today():
+                carregar()
+    with _lock:
+        return {
+            'dia': _estado['dia_iso'],
+            'escola': _formatar(_estado['total']),
+            'turmas': [
+                dict(_formatar(contagem), codigo_turma=codigo)
+                for codigo, contagem in zip(_estado['turmas'], _estado['contagens'])
+            ],
+        }
+
+
+if __name__ == '__main__':
+    import json
+
+    db.init_db()
+    print(json.dumps(resumo(), indent=2, ensure_ascii=False))
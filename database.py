@@ -1,15 +1,23 @@
 # -*- coding: utf-8 -*-
 import sqlite3
 import os
+import json
+import re
 from datetime import datetime, time, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
+import regras_horario
 
-DB_FILE = "presenca.db"
+# O caminho pode ser trocado por PRESENCA_DB (ex: para rodar uma central e uma estação no mesmo computador).
+DB_FILE = os.environ.get("PRESENCA_DB", "presenca.db")
 
 def get_db_connection():
-    """Cria e retorna uma conexão com o banco de dados SQLite."""
+    """
+    Cria e retorna uma conexão com o banco de dados SQLite, com as funções de
+    avaliação de horário (status_presenca, regra_atraso, regra_saida_antecipada) registradas.
+    """
     conn = sqlite3.connect(DB_FILE, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    regras_horario.registrar_funcoes(conn)
     return conn
 
 def init_db():
@@ -21,6 +29,10 @@ def init_db():
     cursor = conn.cursor()
     print("Verificando e inicializando tabelas do banco de dados...")
 
+    # Em bancos novos, permite devolver páginas livres aos poucos (veja arquivamento.compactar).
+    # Em bancos já existentes o comando não tem efeito.
+    cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+
     # Verifica e cria a tabela 'alunos'
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='alunos'")
     if cursor.fetchone() is None:
@@ -31,7 +43,9 @@ def init_db():
             ra TEXT UNIQUE NOT NULL,
             inep TEXT UNIQUE,
             nome TEXT NOT NULL,
-            codigo_turma TEXT
+            codigo_turma TEXT,
+            origem TEXT NOT NULL DEFAULT 'manual', -- 'importacao' (pasta 'data') ou 'manual'
+            cadastrado_em DATE -- NULL nos alunos anteriores à coluna (veja fechamento.py)
         )""")
 
     # Verifica e cria a tabela 'presenca'
@@ -59,6 +73,213 @@ def init_db():
             role TEXT NOT NULL
         )""")
 
+    # Listagem paginada de usuários por função (tela de administração).
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_users_role_username ON users (role, username)")
+
+    # Tabela de turmas, sincronizada com 'data/turmas-com-disciplinas.json' pelo catálogo de turmas.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS turmas (
+        codigo_turma TEXT PRIMARY KEY,
+        nome_turma TEXT NOT NULL
+    )""")
+
+    # Tabelas de agregados pré-calculados (dia, semana e mês) usadas pelo módulo analytics.
+    # São WITHOUT ROWID e ordenadas pela chave de consulta (período, turma, início),
+    # para que as estatísticas de um ano inteiro não precisem varrer a tabela 'presenca'.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS agregado_aluno (
+        periodo TEXT NOT NULL, -- 'dia', 'semana' ou 'mes'
+        inicio DATE NOT NULL, -- Primeiro dia do período
+        codigo_turma TEXT NOT NULL,
+        aluno_id INTEGER NOT NULL,
+        presentes INTEGER NOT NULL DEFAULT 0,
+        atrasos INTEGER NOT NULL DEFAULT 0,
+        saidas_antecipadas INTEGER NOT NULL DEFAULT 0,
+        ausentes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (periodo, codigo_turma, inicio, aluno_id)
+    ) WITHOUT ROWID""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS agregado_turma (
+        periodo TEXT NOT NULL,
+        inicio DATE NOT NULL,
+        codigo_turma TEXT NOT NULL,
+        presentes INTEGER NOT NULL DEFAULT 0,
+        atrasos INTEGER NOT NULL DEFAULT 0,
+        saidas_antecipadas INTEGER NOT NULL DEFAULT 0,
+        ausentes INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (periodo, codigo_turma, inicio)
+    ) WITHOUT ROWID""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS agregado_estado (
+        chave TEXT PRIMARY KEY,
+        valor TEXT
+    )""")
+
+    # Índice usado pelo painel, que carrega e ordena os alunos turma a turma.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_alunos_turma_nome ON alunos (codigo_turma, nome)")
+
+    # Índice usado pelo registro de presença (remoção do registro anterior do dia) e pelo histórico.
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_presenca_aluno_timestamp ON presenca (aluno_id, timestamp)")
+
+    # Índice das consultas por intervalo de datas (agregados, fechamento do dia, contadores).
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_presenca_timestamp ON presenca (timestamp)")
+
+    # Períodos de 'presenca' já movidos para arquivos SQLite separados (veja arquivamento.py).
+    # 'caminho' é relativo à pasta do banco principal; 'inicio' e 'fim' são inclusivos.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS presenca_arquivo (
+        caminho TEXT PRIMARY KEY,
+        inicio DATE NOT NULL,
+        fim DATE NOT NULL,
+        registros INTEGER NOT NULL,
+        arquivado_em DATETIME NOT NULL
+    )""")
+
+    # Horários de entrada e saída por turma e dia da semana (veja regras_horario.py).
+    # codigo_turma '*' vale para todas as turmas; dia_semana -1 vale para todos os dias.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS regras_horario (
+        codigo_turma TEXT NOT NULL,
+        dia_semana INTEGER NOT NULL, -- 0 = segunda ... 6 = domingo
+        hora_entrada TEXT NOT NULL, -- 'HH:MM'
+        hora_saida TEXT NOT NULL,
+        tolerancia_minutos INTEGER NOT NULL,
+        PRIMARY KEY (codigo_turma, dia_semana)
+    )""")
+
+    # Chaves de idempotência das leituras recebidas por /api/scans e o resultado
+    # de cada uma, para que um lote reenviado não seja registrado duas vezes.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS leituras_processadas (
+        chave TEXT PRIMARY KEY,
+        resultado TEXT NOT NULL, -- JSON
+        processado_em DATETIME NOT NULL
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_leituras_processadas_data ON leituras_processadas (processado_em)")
+
+    # Status final de cada aluno por dia, gravado pelo fechamento do dia (veja fechamento.py).
+    # 'status' é a posição em STATUS_PRESENCA; 'entrada' e 'saida' são horários 'HH:MM:SS'.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS presenca_diaria (
+        dia DATE NOT NULL,
+        aluno_id INTEGER NOT NULL,
+        codigo_turma TEXT,
+        status INTEGER NOT NULL,
+        entrada TEXT,
+        saida TEXT,
+        PRIMARY KEY (dia, aluno_id)
+    ) WITHOUT ROWID""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_presenca_diaria_aluno ON presenca_diaria (aluno_id, dia)")
+
+    # Arquivos de turma já importados da pasta 'data' (veja importacao.py).
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS importacao_arquivos (
+        caminho TEXT PRIMARY KEY,
+        hash TEXT NOT NULL, -- SHA-256 do conteúdo
+        mtime_ns INTEGER NOT NULL,
+        tamanho INTEGER NOT NULL,
+        alunos INTEGER NOT NULL,
+        importado_em DATETIME NOT NULL
+    )""")
+
+    # Origem de cada aluno: 'importacao' (arquivos da pasta 'data') ou 'manual' (cadastro
+    # pelo desktop). A importação só mexe nos seus alunos e nunca remove ninguém.
+    if 'origem' not in {row['name'] for row in cursor.execute("PRAGMA table_info(alunos)")}:
+        print("Adicionando a coluna 'origem' à tabela 'alunos'...")
+        cursor.execute("ALTER TABLE alunos ADD COLUMN origem TEXT NOT NULL DEFAULT 'manual'")
+        # Em bancos anteriores, os alunos das turmas já importadas da pasta vieram da importação.
+        cursor.executemany(
+            "UPDATE alunos SET origem = 'importacao' WHERE codigo_turma = ?",
+            [(os.path.splitext(os.path.basename(row['caminho']))[0],)
+             for row in cursor.execute("SELECT caminho FROM importacao_arquivos").fetchall()]
+        )
+    # Dia do cadastro, para o fechamento não contar o aluno como ausente antes de existir.
+    if 'cadastrado_em' not in {row['name'] for row in cursor.execute("PRAGMA table_info(alunos)")}:
+        print("Adicionando a coluna 'cadastrado_em' à tabela 'alunos'...")
+        cursor.execute("ALTER TABLE alunos ADD COLUMN cadastrado_em DATE")
+
+    # Fila de tarefas em segundo plano (veja jobs.py).
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tipo TEXT NOT NULL,
+        estado TEXT NOT NULL, -- 'pendente', 'executando', 'concluido' ou 'erro'
+        processados INTEGER NOT NULL DEFAULT 0,
+        total INTEGER,
+        resultado TEXT, -- JSON
+        erro TEXT,
+        solicitado_por TEXT,
+        criado_em DATETIME NOT NULL,
+        iniciado_em DATETIME,
+        concluido_em DATETIME
+    )""")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_jobs_estado ON jobs (estado, tipo)")
+
+    # Sincronização entre estações (veja sincronizacao.py). Na estação: o log das
+    # leituras a enviar (preenchido por trigger) e a marca d'água do último envio.
+    # Na central: o último número de sequência recebido de cada estação.
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS log_sincronizacao (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        ra TEXT NOT NULL,
+        timestamp DATETIME NOT NULL,
+        tipo_registro TEXT NOT NULL
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sincronizacao_estado (
+        chave TEXT PRIMARY KEY,
+        valor TEXT NOT NULL
+    )""")
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sincronizacao_estacoes (
+        estacao TEXT PRIMARY KEY,
+        ultimo_seq INTEGER NOT NULL,
+        atualizado_em DATETIME NOT NULL
+    )""")
+    # Na central: registros recebidos de alunos ainda desconhecidos (ex: importação atrasada).
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS sincronizacao_pendentes (
+        estacao TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        ra TEXT NOT NULL,
+        timestamp DATETIME NOT NULL,
+        tipo_registro TEXT NOT NULL,
+        recebido_em DATETIME NOT NULL,
+        PRIMARY KEY (estacao, seq)
+    )""")
+
+    # Índice de busca textual (FTS5) sobre nome, RA e INEP dos alunos.
+    # 'remove_diacritics' permite encontrar "joao" em "João"; o índice de prefixos
+    # acelera a busca enquanto o usuário digita. Triggers mantêm o índice sincronizado.
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='alunos_fts'")
+    if cursor.fetchone() is None:
+        try:
+            print("Criando índice de busca 'alunos_fts'...")
+            cursor.execute("""
+            CREATE VIRTUAL TABLE alunos_fts USING fts5(
+                nome, ra, inep,
+                content='alunos', content_rowid='id',
+                tokenize='unicode61 remove_diacritics 2',
+                prefix='2 3'
+            )""")
+            cursor.executescript("""
+            CREATE TRIGGER IF NOT EXISTS alunos_fts_ai AFTER INSERT ON alunos BEGIN
+                INSERT INTO alunos_fts (rowid, nome, ra, inep) VALUES (new.id, new.nome, new.ra, new.inep);
+            END;
+            CREATE TRIGGER IF NOT EXISTS alunos_fts_ad AFTER DELETE ON alunos BEGIN
+                INSERT INTO alunos_fts (alunos_fts, rowid, nome, ra, inep) VALUES ('delete', old.id, old.nome, old.ra, old.inep);
+            END;
+            CREATE TRIGGER IF NOT EXISTS alunos_fts_au AFTER UPDATE OF nome, ra, inep ON alunos BEGIN
+                INSERT INTO alunos_fts (alunos_fts, rowid, nome, ra, inep) VALUES ('delete', old.id, old.nome, old.ra, old.inep);
+                INSERT INTO alunos_fts (rowid, nome, ra, inep) VALUES (new.id, new.nome, new.ra, new.inep);
+            END;
+            """)
+            # Indexa os alunos que já existiam antes da criação do índice.
+            cursor.execute("INSERT INTO alunos_fts (alunos_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError as e:
+            # Algumas distribuições do SQLite não incluem o FTS5; a busca usará LIKE.
+            print(f"AVISO: Não foi possível criar o índice de busca FTS5. Erro: {e}")
+
     conn.commit()
     # Add a default admin user for initial setup
     # Check if the 'users' table is empty before adding the default user
@@ -117,6 +338,78 @@ def delete_user_by_id(user_id):
     conn.close()
     return cursor.rowcount > 0
 
+# Funções (roles) de usuário aceitas pelo sistema.
+ROLES = ('aluno', 'professor', 'visitante', 'admin')
+
+def list_users(role=None, busca=None, pagina=1, por_pagina=50):
+    """
+    Lista os usuários de forma paginada, ordenados pelo nome de usuário.
+    'role' filtra pela função e 'busca' pelo início do nome de usuário (ex: parte do RA).
+    Retorna (lista_da_pagina, total_de_usuarios_no_filtro).
+    """
+    condicoes, params = [], []
+    if role:
+        condicoes.append("role = ?")
+        params.append(role)
+    if busca:
+        # Faixa de prefixo em vez de LIKE, para usar o índice (role, username).
+        condicoes.append("username >= ? AND username < ?")
+        params.extend([busca, busca + '\U0010ffff'])
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ""
+
+    conn = get_db_connection()
+    total = conn.execute(f"SELECT COUNT(*) FROM users {where}", params).fetchone()[0]
+    users = conn.execute(
+        f"SELECT id, username, role FROM users {where} ORDER BY username LIMIT ? OFFSET ?",
+        params + [por_pagina, (max(pagina, 1) - 1) * por_pagina]
+    ).fetchall()
+    conn.close()
+    return [dict(row) for row in users], total
+
+def bulk_update_users(user_ids, acao, valor=None, preservar=None):
+    """
+    Aplica uma ação a vários usuários em uma única transação:
+    'delete', 'reset_password' (valor = nova senha) ou 'role' (valor = nova função).
+    O usuário 'preservar' (o administrador logado) nunca é excluído nem rebaixado.
+    Retorna o número de usuários alterados. Lança ValueError se a ação ou o valor forem inválidos.
+    """
+    ids = [int(user_id) for user_id in user_ids]
+    if acao == 'delete':
+        sql, params_acao = "DELETE FROM users", []
+    elif acao == 'reset_password':
+        if not valor:
+            raise ValueError("Informe a nova senha.")
+        # Um único hash para o lote: todos recebem a mesma senha provisória.
+        sql, params_acao = "UPDATE users SET password = ?", [generate_password_hash(valor)]
+    elif acao == 'role':
+        if valor not in ROLES:
+            raise ValueError(f"Função inválida: {valor}")
+        sql, params_acao = "UPDATE users SET role = ?", [valor]
+    else:
+        raise ValueError(f"Ação inválida: {acao}")
+    if acao != 'reset_password' and preservar:
+        sql_preservar, params_preservar = " AND username <> ?", [preservar]
+    else:
+        sql_preservar, params_preservar = "", []
+
+    conn = get_db_connection()
+    try:
+        alterados = 0
+        for i in range(0, len(ids), 500):  # Respeita o limite de parâmetros do SQLite
+            parte = ids[i:i + 500]
+            cursor = conn.execute(
+                f"{sql} WHERE id IN ({','.join('?' * len(parte))}){sql_preservar}",
+                params_acao + parte + params_preservar
+            )
+            alterados += cursor.rowcount
+        conn.commit()
+        return alterados
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
 def check_user_password(hashed_password, password):
     """Verifica se a senha fornecida corresponde à senha hash."""
     return check_password_hash(hashed_password, password)
@@ -127,10 +420,11 @@ def add_student(ra, nome, codigo_turma, inep=None):
     cursor = conn.cursor()
     try:
         cursor.execute(
-            "INSERT INTO alunos (ra, nome, codigo_turma, inep) VALUES (?, ?, ?, ?)",
-            (ra, nome, codigo_turma, inep)
+            "INSERT INTO alunos (ra, nome, codigo_turma, inep, cadastrado_em) VALUES (?, ?, ?, ?, ?)",
+            (ra, nome, codigo_turma, inep, datetime.now().date().isoformat())
         )
         conn.commit()
+        _invalidar_contadores()
         return cursor.lastrowid
     except sqlite3.IntegrityError:
         return None # RA já existe
@@ -156,112 +450,538 @@ def get_student_by_identifier(identifier):
     conn.close()
     return student
 
+def _expressao_fts(termos):
+    """Expressão MATCH do FTS5 em que cada termo vira um prefixo entre aspas (o que também neutraliza a sintaxe do FTS5)."""
+    return ' '.join(f'"{termo}"*' for termo in termos)
+
+
+def search_students(query, limit=20):
+    """
+    Busca alunos por nome, RA ou INEP, ignorando acentos e casando prefixos
+    (ex: "joao sil" encontra "João da Silva"). Os resultados vêm ordenados por relevância.
+    """
+    termos = re.findall(r'\w+', query or '')
+    if not termos:
+        return []
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        match = _expressao_fts(termos)
+        cursor.execute(
+            """
+            SELECT a.id, a.ra, a.nome, a.inep, a.codigo_turma
+            FROM alunos_fts
+            JOIN alunos a ON a.id = alunos_fts.rowid
+            WHERE alunos_fts MATCH ?
+            ORDER BY bm25(alunos_fts)
+            LIMIT ?
+            """,
+            (match, limit)
+        )
+    except sqlite3.OperationalError:
+        # Sem FTS5: busca simples (sensível a acentos) pelo primeiro termo.
+        padrao = f"%{termos[0]}%"
+        cursor.execute(
+            """
+            SELECT id, ra, nome, inep, codigo_turma FROM alunos
+            WHERE nome LIKE ? OR ra LIKE ? OR inep LIKE ?
+            ORDER BY nome LIMIT ?
+            """,
+            (padrao, padrao, padrao, limit)
+        )
+    students = cursor.fetchall()
+    conn.close()
+    return [dict(row) for row in students]
+
 # --- Constantes de Horário ---
+# Horários usados quando não há regra cadastrada para a turma (veja regras_horario.py).
 HORA_ENTRADA_PADRAO = time(7, 20)
 HORA_SAIDA_PADRAO = time(16, 20)
 TOLERANCIA_MINUTOS = timedelta(minutes=20)
 
-def add_attendance_record(aluno_id):
+# Entre as janelas de entrada e saída, uma nova leitura só conta como saída antecipada
+# se vier depois deste intervalo desde a entrada (evita que uma leitura repetida seja uma saída).
+INTERVALO_MINIMO_SAIDA = timedelta(minutes=10)
+
+def _registrar_leitura(cursor, aluno_id, codigo_turma, agora):
+    """
+    Registra uma leitura de QR Code feita em 'agora', sem commit. Mantém apenas o
+    último registro do aluno por tipo e dia: os anteriores do mesmo dia são
+    apagados e, se já houver um registro mais recente, a leitura é ignorada.
+    Retorna (tipo_registro, status_detalhado, registrado).
+    """
+    inicio_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0)
+    fim_dia = inicio_dia + timedelta(days=1)
+    entrada_anterior = cursor.execute(
+        "SELECT MAX(timestamp) FROM presenca WHERE aluno_id = ? AND tipo_registro = 'entrada' AND timestamp >= ? AND timestamp <= ?",
+        (aluno_id, inicio_dia, agora)
+    ).fetchone()[0]
+    entrada_anterior = datetime.fromisoformat(entrada_anterior) if entrada_anterior else None
+
+    # Determina se a leitura é entrada ou saída pela janela de horários da turma
+    tipo_registro, status_detalhado = regras_horario.avaliar_leitura(codigo_turma, agora, entrada_anterior)
+    if not tipo_registro:
+        return tipo_registro, status_detalhado, False
+    if status_detalhado == "Saída antecipada" and agora - entrada_anterior < INTERVALO_MINIMO_SAIDA:
+        return 'entrada', "Entrada já registrada", False
+    mais_recente = cursor.execute(
+        "SELECT MAX(timestamp) FROM presenca WHERE aluno_id = ? AND tipo_registro = ? AND timestamp >= ? AND timestamp < ?",
+        (aluno_id, tipo_registro, inicio_dia, fim_dia)
+    ).fetchone()[0]
+    if mais_recente is not None and datetime.fromisoformat(mais_recente) > agora:
+        return tipo_registro, "Leitura mais recente já registrada", False
+
+    # Deleta registros anteriores do mesmo tipo no mesmo dia para garantir apenas o último
+    cursor.execute(
+        "DELETE FROM presenca WHERE aluno_id = ? AND tipo_registro = ? AND timestamp >= ? AND timestamp < ?",
+        (aluno_id, tipo_registro, inicio_dia, fim_dia)
+    )
+    # Insere o novo registro
+    cursor.execute(
+        "INSERT INTO presenca (aluno_id, tipo_registro, timestamp) VALUES (?, ?, ?)",
+        (aluno_id, tipo_registro, agora)
+    )
+    return tipo_registro, status_detalhado, True
+
+def _atualizar_contadores(leituras):
+    """Repassa as leituras gravadas [(aluno_id, tipo_registro, instante)] aos contadores do dia (veja contadores.py)."""
+    import contadores  # Importado aqui: o módulo contadores depende deste.
+    for aluno_id, tipo_registro, instante in leituras:
+        contadores.registrar_leitura(aluno_id, tipo_registro, instante)
+
+
+def _invalidar_contadores():
+    import contadores
+    contadores.invalidar()
+
+
+def add_attendance_record(aluno_id, agora=None):
     """
-    Adiciona um registro de entrada ou saída para um aluno com base no horário.
+    Adiciona um registro de entrada ou saída para um aluno com base no horário
+    e nas regras de horário da turma dele.
     Retorna uma tupla (tipo_registro, status_detalhado).
-    Ex: ('entrada', 'Entrada no horário') ou ('saida', 'Saída Antecipada')
+    Ex: ('entrada', 'Entrada no horário') ou ('saida', 'Saída no horário')
+    'agora' permite informar o instante da leitura (padrão: datetime.now()).
     """
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    agora = datetime.now()
-    hora_atual = agora.time()
-    hoje_inicio_dia = agora.replace(hour=0, minute=0, second=0, microsecond=0)
-
-    # Define as janelas de tempo
-    inicio_janela_entrada = (datetime.combine(agora.date(), HORA_ENTRADA_PADRAO) - TOLERANCIA_MINUTOS).time()
-    fim_janela_entrada = (datetime.combine(agora.date(), HORA_ENTRADA_PADRAO) + TOLERANCIA_MINUTOS).time()
-    inicio_janela_saida = (datetime.combine(agora.date(), HORA_SAIDA_PADRAO) - TOLERANCIA_MINUTOS).time()
-    
-    tipo_registro = None
-    status_detalhado = "Horário Inválido"
-
-    # Lógica para determinar se é entrada ou saída
-    if hora_atual < fim_janela_entrada:
-        tipo_registro = 'entrada'
-        status_detalhado = "Entrada no horário" if hora_atual <= fim_janela_entrada else "Entrada com Atraso"
-    elif hora_atual >= inicio_janela_saida:
-        tipo_registro = 'saida'
-        status_detalhado = "Saída no horário" if hora_atual >= inicio_janela_saida else "Saída Antecipada"
-
-    if tipo_registro:
-        # Deleta registros anteriores do mesmo tipo no mesmo dia para garantir apenas o último
-        cursor.execute(
-            "DELETE FROM presenca WHERE aluno_id = ? AND tipo_registro = ? AND timestamp >= ?",
-            (aluno_id, tipo_registro, hoje_inicio_dia)
-        )
-        # Insere o novo registro
-        cursor.execute(
-            "INSERT INTO presenca (aluno_id, tipo_registro, timestamp) VALUES (?, ?, ?)",
-            (aluno_id, tipo_registro, agora)
-        )
+    agora = agora or datetime.now()
+
+    aluno = cursor.execute("SELECT codigo_turma FROM alunos WHERE id = ?", (aluno_id,)).fetchone()
+    codigo_turma = aluno['codigo_turma'] if aluno else None
+
+    tipo_registro, status_detalhado, registrado = _registrar_leitura(cursor, aluno_id, codigo_turma, agora)
+    if registrado:
         conn.commit()
 
     conn.close()
+    if registrado:
+        _atualizar_contadores([(aluno_id, tipo_registro, agora)])
     return tipo_registro, status_detalhado
 
-def get_all_students_with_latest_attendance():
+# Tempo pelo qual as chaves de idempotência de /api/scans são guardadas.
+VALIDADE_CHAVE_LEITURA = timedelta(days=7)
+
+def _buscar_alunos_por_identificadores(cursor, identificadores):
+    """Resolve RAs e INEPs em lote. Retorna {identificador: Row do aluno}."""
+    identificadores = list(set(identificadores))
+    alunos = {}
+    for i in range(0, len(identificadores), 400):  # Respeita o limite de parâmetros do SQLite
+        parte = identificadores[i:i + 400]
+        marcadores = ','.join('?' * len(parte))
+        for row in cursor.execute(
+            f"SELECT id, ra, inep, nome, codigo_turma FROM alunos WHERE ra IN ({marcadores}) OR inep IN ({marcadores})",
+            parte + parte
+        ):
+            # Como em get_student_by_identifier, o RA tem prioridade sobre o INEP.
+            if row['inep'] is not None:
+                alunos.setdefault(row['inep'], row)
+            alunos[row['ra']] = row
+    return alunos
+
+def add_attendance_records_bulk(leituras):
     """
-    Busca todos os alunos e calcula o status de presença com base nos registros de entrada e saída do dia.
+    Registra um lote de leituras, cada uma um dicionário com 'identificador' (RA
+    ou INEP), 'timestamp' (datetime), 'estacao' e, opcionalmente, 'chave' de
+    idempotência. Os alunos são resolvidos em uma única consulta e o lote é
+    gravado em uma única transação, com as regras de add_attendance_record.
+    Leituras com uma chave já processada devolvem o resultado guardado.
+    Retorna uma lista de resultados, na ordem das leituras.
     """
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    # Define os horários de referência para a consulta SQL
-    fim_entrada_tolerancia = (datetime.combine(datetime.today(), HORA_ENTRADA_PADRAO) + TOLERANCIA_MINUTOS).time().strftime('%H:%M:%S')
-    inicio_saida_tolerancia = (datetime.combine(datetime.today(), HORA_SAIDA_PADRAO) - TOLERANCIA_MINUTOS).time().strftime('%H:%M:%S')
+    try:
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute("DELETE FROM leituras_processadas WHERE processado_em < ?", (datetime.now() - VALIDADE_CHAVE_LEITURA,))
+
+        chaves = [leitura['chave'] for leitura in leituras if leitura.get('chave')]
+        anteriores = {}
+        for i in range(0, len(chaves), 400):
+            parte = chaves[i:i + 400]
+            anteriores.update(
+                (row['chave'], json.loads(row['resultado']))
+                for row in cursor.execute(
+                    f"SELECT chave, resultado FROM leituras_processadas WHERE chave IN ({','.join('?' * len(parte))})", parte
+                )
+            )
+
+        alunos = _buscar_alunos_por_identificadores(cursor, [str(leitura['identificador']) for leitura in leituras])
+
+        resultados = []
+        gravadas = []  # Leituras gravadas, repassadas aos contadores depois do commit
+        for leitura in leituras:
+            chave = leitura.get('chave')
+            if chave and chave in anteriores:
+                resultados.append(dict(anteriores[chave], repetida=True))
+                continue
+
+            resultado = {'identificador': leitura['identificador'], 'estacao': leitura.get('estacao')}
+            aluno = alunos.get(str(leitura['identificador']))
+            if aluno is None:
+                resultado.update(resultado='nao_encontrado', status="Aluno não encontrado")
+            else:
+                tipo_registro, status_detalhado, registrado = _registrar_leitura(
+                    cursor, aluno['id'], aluno['codigo_turma'], leitura['timestamp']
+                )
+                if registrado:
+                    gravadas.append((aluno['id'], tipo_registro, leitura['timestamp']))
+                resultado.update(
+                    ra=aluno['ra'], nome=aluno['nome'], tipo_registro=tipo_registro, status=status_detalhado,
+                    resultado='registrado' if registrado else ('ignorado' if tipo_registro else 'fora_do_horario'),
+                )
+            if chave:
+                resultado['chave'] = chave
+                cursor.execute(
+                    "INSERT OR REPLACE INTO leituras_processadas (chave, resultado, processado_em) VALUES (?, ?, ?)",
+                    (chave, json.dumps(resultado, ensure_ascii=False), datetime.now())
+                )
+                anteriores[chave] = resultado
+            resultados.append(resultado)
+
+        conn.commit()
+        _atualizar_contadores(gravadas)
+        return resultados
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+# Status de presença possíveis. A posição na tupla é o código numérico usado
+# nos formatos compactos (ex: /api/presence_data?format=columnar).
+STATUS_PRESENCA = ('Ausente', 'Apenas Entrada', 'Presente', 'Atraso', 'Saída Antecipada')
+
+def _sql_status_presenca(coluna_turma, coluna_entrada, coluna_saida):
+    """
+    Monta a expressão SQL que calcula o status de presença do dia a partir dos
+    horários de entrada e saída, pelas regras de horário da turma. Usada pelo
+    dashboard e pela exportação; a função SQL 'status_presenca' é registrada
+    em get_db_connection (veja regras_horario.status_presenca).
+    """
+    return f"status_presenca({coluna_turma}, {coluna_entrada}, {coluna_saida})"
+
+# Ordenações aceitas por consultar_painel (parâmetro 'sort' de /api/presence_data).
+# Um '-' antes do nome inverte a ordem; o nome e o RA desempatam, para a paginação ser estável.
+ORDENACOES_PAINEL = {
+    'nome': 'nome',
+    'ra': 'ra',
+    'turma': 'nome_turma',
+    'status': 'status_presenca',
+    'entrada': 'timestamp_entrada',
+    'saida': 'timestamp_saida',
+}
+
+
+def _ordem_painel(ordem):
+    """Converte o parâmetro de ordenação em ORDER BY. Lança ValueError se for inválido."""
+    ordem = ordem or 'nome'
+    decrescente = ordem.startswith('-')
+    coluna = ORDENACOES_PAINEL.get(ordem.lstrip('-'))
+    if coluna is None:
+        raise ValueError(f"Ordenação inválida: {ordem}")
+    return f"{coluna} {'DESC' if decrescente else 'ASC'}, nome, ra"
+
+
+def _filtros_painel(codigo_turma=None, busca=None, ra=None, usar_fts=True):
+    """
+    Condições sobre a tabela 'alunos' (alias 'a') usadas pelo painel. Retorna
+    (lista de condições SQL, parâmetros). 'codigo_turma' vazio seleciona os
+    alunos sem turma; 'busca' procura prefixos no nome, RA ou INEP pelo FTS5
+    (ou, com usar_fts=False, o primeiro termo no nome ou RA com LIKE).
+    """
+    condicoes, params = [], []
+    if codigo_turma == '':
+        condicoes.append("a.codigo_turma IS NULL")
+    elif codigo_turma is not None:
+        condicoes.append("a.codigo_turma = ?")
+        params.append(codigo_turma)
+    if ra is not None:
+        condicoes.append("a.ra = ?")
+        params.append(ra)
+    termos = re.findall(r'\w+', busca or '')
+    if termos and usar_fts:
+        condicoes.append("a.id IN (SELECT rowid FROM alunos_fts WHERE alunos_fts MATCH ?)")
+        params.append(_expressao_fts(termos))
+    elif termos:
+        condicoes.append("(a.nome LIKE ? OR a.ra LIKE ?)")
+        params.extend([f"%{termos[0]}%"] * 2)
+    return condicoes, params
+
 
-    query = f"""
+def _sql_painel(condicoes, marcacoes=None):
+    """
+    SELECT dos alunos que atendem às 'condicoes' com a última entrada e a última
+    saída do dia. Os horários são buscados aluno a aluno pelo índice
+    (aluno_id, timestamp), então o custo depende só dos alunos selecionados.
+    A coluna 'encontrado' vale 1 para os alunos que atendem às 'marcacoes'.
+    Os parâmetros são o início e o fim do dia (duas vezes), os das marcações e
+    os das condições, nesta ordem.
+    """
+    where = f"WHERE {' AND '.join(condicoes)}" if condicoes else ''
+    encontrado = ' AND '.join(marcacoes) if marcacoes else '1'
+    return f"""
     SELECT
-        a.ra,
-        a.nome,
-        a.codigo_turma,
-        CASE
-            -- Se há registro de entrada, o aluno não está mais ausente.
-            WHEN entrada.id IS NOT NULL AND saida.id IS NULL THEN 'Apenas Entrada'
-            -- Saída antecipada
-            WHEN entrada.id IS NOT NULL AND saida.id IS NOT NULL AND TIME(saida.timestamp) < '{inicio_saida_tolerancia}' THEN 'Saída Antecipada'
-            -- Chegou atrasado, mas saiu no horário
-            WHEN entrada.id IS NOT NULL AND saida.id IS NOT NULL AND TIME(entrada.timestamp) > '{fim_entrada_tolerancia}' THEN 'Atraso'
-            -- Cenário ideal: Entrada e Saída corretas
-            WHEN entrada.id IS NOT NULL AND saida.id IS NOT NULL THEN 'Presente'
-            ELSE 'Ausente'
-        END as status_presenca,
-        entrada.timestamp as timestamp_entrada,
-        saida.timestamp as timestamp_saida
-    FROM
-        alunos a
-    LEFT JOIN (
-        SELECT aluno_id, id, MAX(timestamp) as timestamp FROM presenca
-        WHERE tipo_registro = 'entrada' AND DATE(timestamp) = DATE('now', 'localtime')
-        GROUP BY aluno_id
-    ) entrada ON a.id = entrada.aluno_id
-    LEFT JOIN (
-        SELECT aluno_id, id, MAX(timestamp) as timestamp FROM presenca
-        WHERE tipo_registro = 'saida' AND DATE(timestamp) = DATE('now', 'localtime')
-        GROUP BY aluno_id
-    ) saida ON a.id = saida.aluno_id
-    ORDER BY
-        a.nome;
+        *,
+        {_sql_status_presenca('codigo_turma', 'timestamp_entrada', 'timestamp_saida')} AS status_presenca
+    FROM (
+        SELECT
+            a.id AS aluno_id,
+            a.ra,
+            a.nome,
+            a.codigo_turma,
+            COALESCE(t.nome_turma, a.codigo_turma) AS nome_turma,
+            (SELECT MAX(p.timestamp) FROM presenca p
+             WHERE p.aluno_id = a.id AND p.tipo_registro = 'entrada' AND p.timestamp >= ? AND p.timestamp < ?) AS timestamp_entrada,
+            (SELECT MAX(p.timestamp) FROM presenca p
+             WHERE p.aluno_id = a.id AND p.tipo_registro = 'saida' AND p.timestamp >= ? AND p.timestamp < ?) AS timestamp_saida,
+            ({encontrado}) AS encontrado
+        FROM alunos a
+        LEFT JOIN turmas t ON t.codigo_turma = a.codigo_turma
+        {where}
+    )
     """
 
-    cursor.execute(
-        query
+
+def _limites_hoje():
+    inicio = datetime.combine(datetime.today().date(), time.min)
+    return [inicio, inicio + timedelta(days=1)] * 2
+
+
+def consultar_painel(codigo_turma=None, status=None, busca=None, ra=None, ordem='nome', pagina=None, por_pagina=None):
+    """
+    Alunos com o status de presença do dia, para o painel web. Filtros
+    (turma, status, busca por nome/RA e RA exato), ordenação (veja
+    ORDENACOES_PAINEL) e paginação são feitos no SQL.
+    Retorna (lista de alunos, total de alunos que atendem aos filtros).
+    Lança ValueError se o status ou a ordenação forem inválidos.
+    """
+    if status is not None and status not in STATUS_PRESENCA:
+        raise ValueError(f"Status inválido: {status}")
+    order_by = _ordem_painel(ordem)
+
+    def _consultar(cursor, usar_fts):
+        condicoes, params = _filtros_painel(codigo_turma, busca, ra, usar_fts)
+        sql = f"""
+        SELECT ra, nome, codigo_turma, nome_turma, status_presenca, timestamp_entrada, timestamp_saida
+        FROM ({_sql_painel(condicoes)})
+        """
+        params = _limites_hoje() + params
+        if status is not None:
+            sql += " WHERE status_presenca = ?"
+            params.append(status)
+        total = None
+        if por_pagina is not None:
+            total = cursor.execute(f"SELECT COUNT(*) FROM ({sql})", params).fetchone()[0]
+            sql += f" ORDER BY {order_by} LIMIT ? OFFSET ?"
+            params += [por_pagina, (max(pagina or 1, 1) - 1) * por_pagina]
+        else:
+            sql += f" ORDER BY {order_by}"
+        alunos = [dict(row) for row in cursor.execute(sql, params)]
+        return alunos, len(alunos) if total is None else total
+
+    conn = get_db_connection()
+    try:
+        try:
+            return _consultar(conn.cursor(), usar_fts=True)
+        except sqlite3.OperationalError:
+            if not busca:
+                raise
+            # Sem FTS5: busca simples (sensível a acentos), como em search_students.
+            return _consultar(conn.cursor(), usar_fts=False)
+    finally:
+        conn.close()
+
+
+def resumo_turmas(status=None, busca=None):
+    """
+    Resumo do dia por turma, para o painel carregar a lista de turmas antes dos
+    alunos: total de alunos, presentes (status diferente de 'Ausente') e quantos
+    atendem aos filtros de status e busca ('encontrados').
+    Lança ValueError se o status for inválido.
+    """
+    if status is not None and status not in STATUS_PRESENCA:
+        raise ValueError(f"Status inválido: {status}")
+
+    def _consultar(cursor, usar_fts):
+        marcacoes, params = _filtros_painel(busca=busca, usar_fts=usar_fts)
+        filtro_status = "status_presenca = ?" if status is not None else "1"
+        return [dict(row) for row in cursor.execute(f"""
+            SELECT
+                codigo_turma,
+                COALESCE(nome_turma, 'Sem Turma') AS nome_turma,
+                COUNT(*) AS alunos,
+                SUM(status_presenca != 'Ausente') AS presentes,
+                SUM(encontrado AND {filtro_status}) AS encontrados
+            FROM ({_sql_painel([], marcacoes)})
+            GROUP BY codigo_turma
+            ORDER BY nome_turma
+        """, ([status] if status is not None else []) + _limites_hoje() + params)]
+
+    conn = get_db_connection()
+    try:
+        try:
+            return _consultar(conn.cursor(), usar_fts=True)
+        except sqlite3.OperationalError:
+            if not busca:
+                raise
+            return _consultar(conn.cursor(), usar_fts=False)
+    finally:
+        conn.close()
+
+
+def get_all_students_with_latest_attendance():
+    """
+    Busca todos os alunos e calcula o status de presença com base nos registros de entrada e saída do dia.
+    """
+    alunos, _ = consultar_painel()
+    return alunos
+
+
+def iter_attendance_export(codigo_turma=None, data_inicio=None, data_fim=None, status=None, tamanho_lote=500):
+    """
+    Gera, linha a linha, o status de presença diário de cada aluno no intervalo
+    [data_inicio, data_fim] (objetos date). Os dias considerados são os que têm
+    ao menos um registro em 'presenca'; alunos sem entrada nesses dias aparecem como 'Ausente'.
+
+    As linhas são lidas do cursor em lotes com fetchmany, então a memória usada
+    não depende do tamanho da exportação. A validação, o ATTACH dos arquivos e a
+    consulta são feitos já na chamada: os erros (ValueError para status inválido
+    ou arquivos demais) aparecem antes de a resposta começar a ser enviada.
+    Retorna um iterador de dicionários.
+    """
+    if status is not None and status not in STATUS_PRESENCA:
+        raise ValueError(f"Status inválido: {status}")
+    data_fim = data_fim or datetime.today().date()
+    data_inicio = data_inicio or data_fim
+    limite_inferior = data_inicio.isoformat()
+    limite_superior = (data_fim + timedelta(days=1)).isoformat()
+
+    conn = get_db_connection()
+    try:
+        presenca = sql_presenca_com_arquivo(conn, data_inicio, data_fim)
+        cursor = conn.cursor()
+        cursor.execute(_sql_exportacao(presenca), (
+            limite_inferior, limite_superior,
+            limite_inferior, limite_superior,
+            codigo_turma, codigo_turma,
+            status, status,
+        ))
+    except Exception:
+        conn.close()
+        raise
+    return _iterar_lotes(conn, cursor, tamanho_lote)
+
+
+def _iterar_lotes(conn, cursor, tamanho_lote):
+    """Gera as linhas do cursor como dicionários, em lotes, e fecha a conexão no fim."""
+    try:
+        while True:
+            rows = cursor.fetchmany(tamanho_lote)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(row)
+    finally:
+        conn.close()
+
+
+def _sql_exportacao(presenca):
+    """Consulta de iter_attendance_export sobre 'presenca' (tabela ou união com os arquivos)."""
+    return f"""
+    SELECT * FROM (
+        SELECT
+            d.dia AS data,
+            a.ra,
+            a.nome,
+            a.codigo_turma,
+            {_sql_status_presenca('a.codigo_turma', 'r.timestamp_entrada', 'r.timestamp_saida')} AS status_presenca,
+            r.timestamp_entrada,
+            r.timestamp_saida
+        FROM (
+            SELECT DISTINCT DATE(timestamp) AS dia FROM {presenca}
+            WHERE timestamp >= ? AND timestamp < ?
+        ) d
+        CROSS JOIN alunos a
+        LEFT JOIN (
+            SELECT
+                aluno_id,
+                DATE(timestamp) AS dia,
+                MAX(CASE WHEN tipo_registro = 'entrada' THEN timestamp END) AS timestamp_entrada,
+                MAX(CASE WHEN tipo_registro = 'saida' THEN timestamp END) AS timestamp_saida
+            FROM {presenca}
+            WHERE timestamp >= ? AND timestamp < ?
+            GROUP BY aluno_id, DATE(timestamp)
+        ) r ON r.aluno_id = a.id AND r.dia = d.dia
+        WHERE (? IS NULL OR a.codigo_turma = ?)
     )
-    students = cursor.fetchall()
+    WHERE (? IS NULL OR status_presenca = ?)
+    ORDER BY data, codigo_turma, nome
+    """
+
+
+def caminho_arquivo_presenca(caminho):
+    """Resolve o caminho de um arquivo de 'presenca_arquivo' (relativo à pasta do banco principal)."""
+    return os.path.join(os.path.dirname(os.path.abspath(DB_FILE)), caminho)
+
+def data_limite_arquivo():
+    """Retorna o último dia já arquivado (date), ou None se nada foi arquivado."""
+    conn = get_db_connection()
+    row = conn.execute("SELECT MAX(fim) FROM presenca_arquivo").fetchone()
     conn.close()
-    student_list = [dict(row) for row in students]
-    return student_list
+    return datetime.strptime(row[0], '%Y-%m-%d').date() if row and row[0] else None
+
+def sql_presenca_com_arquivo(conn, data_inicio=None, data_fim=None):
+    """
+    Retorna a expressão SQL a ser usada no lugar de 'presenca' em consultas sobre
+    o intervalo [data_inicio, data_fim]. Os arquivos que cobrem parte do intervalo
+    são anexados (ATTACH) à conexão 'conn' e unidos à tabela ativa; se nenhum
+    arquivo for necessário, retorna simplesmente 'presenca'.
+    """
+    arquivos = conn.execute(
+        """SELECT caminho FROM presenca_arquivo
+        WHERE (? IS NULL OR fim >= ?) AND (? IS NULL OR inicio <= ?)
+        ORDER BY inicio""",
+        (data_inicio and data_inicio.isoformat(), data_inicio and data_inicio.isoformat(),
+         data_fim and data_fim.isoformat(), data_fim and data_fim.isoformat())
+    ).fetchall()
+    if not arquivos:
+        return "presenca"
+
+    # O SQLite limita o número de bancos anexados (10 por padrão).
+    limite = conn.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if hasattr(conn, 'getlimit') else 10
+    if len(arquivos) > limite:
+        raise ValueError(f"O intervalo abrange {len(arquivos)} arquivos de presença; o máximo é {limite}. Reduza o intervalo.")
 
+    partes = ["SELECT id, aluno_id, timestamp, tipo_registro FROM presenca"]
+    for i, row in enumerate(arquivos):
+        conn.execute(f"ATTACH DATABASE ? AS arquivo_{i}", (caminho_arquivo_presenca(row['caminho']),))
+        partes.append(f"SELECT id, aluno_id, timestamp, tipo_registro FROM arquivo_{i}.presenca")
+    return "(" + " UNION ALL ".join(partes) + ")"
 
 def get_student_attendance_history_by_id(aluno_id):
-    """Busca o histórico de presença de um aluno pelo seu ID interno."""
+    """Busca o histórico de presença de um aluno pelo seu ID interno, incluindo os períodos arquivados."""
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute(
@@ -269,9 +989,33 @@ def get_student_attendance_history_by_id(aluno_id):
         (aluno_id,)
     )
     history = cursor.fetchall()
+    # Um arquivo por vez, do mais recente ao mais antigo, para não esbarrar no limite de ATTACH.
+    arquivos = cursor.execute("SELECT caminho FROM presenca_arquivo ORDER BY inicio DESC").fetchall()
+    for row in arquivos:
+        cursor.execute("ATTACH DATABASE ? AS arquivo", (caminho_arquivo_presenca(row['caminho']),))
+        cursor.execute(
+            "SELECT timestamp, tipo_registro FROM arquivo.presenca WHERE aluno_id = ? ORDER BY timestamp DESC",
+            (aluno_id,)
+        )
+        history.extend(cursor.fetchall())
+        cursor.execute("DETACH DATABASE arquivo")
     conn.close()
     return [dict(row) for row in history]
 
+def get_student_daily_status(aluno_id, limite=60):
+    """
+    Status final do aluno nos últimos dias fechados (veja fechamento.py), do mais
+    recente ao mais antigo, inclusive as ausências.
+    """
+    conn = get_db_connection()
+    dias = conn.execute(
+        "SELECT dia, status, entrada, saida FROM presenca_diaria WHERE aluno_id = ? ORDER BY dia DESC LIMIT ?",
+        (aluno_id, limite)
+    ).fetchall()
+    conn.close()
+    return [dict(row, status=STATUS_PRESENCA[row['status']]) for row in dias]
+
+
 def get_student_attendance_history_by_ra(ra):
     """Busca o histórico de presença de um aluno pelo seu RA."""
     student = get_student_by_ra(ra)
@@ -281,41 +1025,173 @@ def get_student_attendance_history_by_ra(ra):
     return dict(student), [dict(h) for h in history]
 
 
+# Colunas de 'alunos' que podem ser alteradas por update_student e update_students_bulk.
+# O RA identifica o aluno (e o usuário dele) e não é alterado por estas funções.
+COLUNAS_EDITAVEIS_ALUNO = ('nome', 'codigo_turma', 'inep')
+
+def _validar_alteracoes_aluno(alteracoes):
+    """
+    Confere as colunas contra COLUNAS_EDITAVEIS_ALUNO e normaliza os valores
+    (textos sem espaços nas pontas; turma e INEP vazios viram NULL).
+    Retorna um novo dicionário. Lança ValueError se algo for inválido.
+    """
+    if not isinstance(alteracoes, dict) or not alteracoes:
+        raise ValueError("Nenhuma alteração informada.")
+    invalidas = sorted(set(alteracoes) - set(COLUNAS_EDITAVEIS_ALUNO), key=str)
+    if invalidas:
+        raise ValueError(f"Coluna(s) não editável(is): {', '.join(map(str, invalidas))}")
+    normalizadas = {}
+    for coluna, valor in alteracoes.items():
+        if valor is not None and not isinstance(valor, (str, int)):
+            raise ValueError(f"Valor inválido para '{coluna}'.")
+        valor = str(valor).strip() if valor is not None else None
+        if coluna == 'nome' and not valor:
+            raise ValueError("O nome não pode ficar vazio.")
+        normalizadas[coluna] = valor or None
+    return normalizadas
+
 def update_student_class(ra, codigo_turma):
     """Atualiza a turma de um aluno."""
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute(
-        "UPDATE alunos SET codigo_turma = ? WHERE ra = ?",
-        (codigo_turma, ra)
-    )
-    conn.commit()
-    updated_rows = cursor.rowcount
-    conn.close()
-    return updated_rows > 0
-    
+    return update_student(ra, {'codigo_turma': codigo_turma})
+
 def update_student(ra, data_dict):
     """
     Atualiza os dados de um aluno de forma genérica.
-    'data_dict' é um dicionário com as colunas a serem atualizadas.
-    Ex: {'codigo_turma': 'nova_turma', 'inep': '123'}
+    'data_dict' é um dicionário com as colunas a serem atualizadas (apenas as de
+    COLUNAS_EDITAVEIS_ALUNO). Ex: {'codigo_turma': 'nova_turma', 'inep': '123'}
+    O aluno passa a ter origem 'manual', e a importação não desfaz a alteração.
+    Lança ValueError se houver uma coluna não editável.
     """
     if not data_dict:
         return False
+    data_dict = _validar_alteracoes_aluno(data_dict)
 
     conn = get_db_connection()
     cursor = conn.cursor()
     
-    set_clause = ", ".join([f"{key} = ?" for key in data_dict.keys()])
-    values = list(data_dict.values())
+    # Os nomes das colunas vêm de COLUNAS_EDITAVEIS_ALUNO, nunca do dicionário recebido.
+    colunas = [coluna for coluna in COLUNAS_EDITAVEIS_ALUNO if coluna in data_dict]
+    set_clause = ", ".join([f"{coluna} = ?" for coluna in colunas])
+    values = [data_dict[coluna] for coluna in colunas]
     values.append(ra)
 
-    query = f"UPDATE alunos SET {set_clause} WHERE ra = ?"
+    query = f"UPDATE alunos SET {set_clause}, origem = 'manual' WHERE ra = ?"
     cursor.execute(query, tuple(values))
     conn.commit()
     updated_rows = cursor.rowcount
     conn.close()
+    _invalidar_contadores()
     return updated_rows > 0
 
+def update_students_bulk(alteracoes):
+    """
+    Aplica alterações a vários alunos em uma única transação (ex: a troca de
+    turmas no início do ano letivo). 'alteracoes' é uma lista de pares
+    (ra, {coluna: valor}), com as colunas de COLUNAS_EDITAVEIS_ALUNO.
+
+    Os alunos são buscados em uma única consulta, as linhas válidas são gravadas
+    com executemany (um comando por combinação de colunas) e os contadores do
+    dia são descartados uma única vez, no fim. Os alunos alterados passam a ter
+    origem 'manual', e a importação não desfaz a alteração. Uma linha inválida não impede as
+    demais. Retorna um resultado por linha, na mesma ordem: {'ra', 'resultado'}
+    com 'atualizado', 'inalterado', 'nao_encontrado' ou 'invalido' (este com 'erro').
+    """
+    resultados = []
+    pendentes = {}  # ra -> (índice do resultado, alterações normalizadas)
+    for item in alteracoes:
+        try:
+            ra, mudancas = item
+            ra = str(ra).strip()
+            if not ra:
+                raise ValueError("RA não informado.")
+            if ra in pendentes:
+                raise ValueError("RA repetido no lote.")
+            pendentes[ra] = (len(resultados), _validar_alteracoes_aluno(mudancas))
+            resultados.append({'ra': ra, 'resultado': None})
+        except (TypeError, ValueError) as e:
+            erro = str(e) if isinstance(e, ValueError) else "Use o formato (ra, alterações)."
+            resultados.append({'ra': str(item[0]) if isinstance(item, (list, tuple)) and item else None,
+                               'resultado': 'invalido', 'erro': erro})
+    if not pendentes:
+        return resultados
+
+    conn = get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")  # Nenhuma outra escrita entre a validação e a gravação
+        ras = list(pendentes)
+        atuais = {}
+        for i in range(0, len(ras), 500):  # Respeita o limite de parâmetros do SQLite
+            parte = ras[i:i + 500]
+            atuais.update(
+                (row['ra'], row) for row in conn.execute(
+                    f"SELECT ra, nome, codigo_turma, inep FROM alunos WHERE ra IN ({','.join('?' * len(parte))})", parte
+                )
+            )
+
+        # O INEP é único: confere o estado final do lote contra os alunos que ficam com o INEP atual.
+        ineps_novos = {}
+        for ra, (indice, mudancas) in pendentes.items():
+            if ra in atuais and mudancas.get('inep') and mudancas['inep'] != atuais[ra]['inep']:
+                ineps_novos.setdefault(mudancas['inep'], []).append(ra)
+        donos = {}
+        ineps = list(ineps_novos)
+        for i in range(0, len(ineps), 500):
+            parte = ineps[i:i + 500]
+            donos.update(
+                (row['inep'], row['ra']) for row in conn.execute(
+                    f"SELECT inep, ra FROM alunos WHERE inep IN ({','.join('?' * len(parte))})", parte
+                )
+            )
+        conflitos = {ra for ras_inep in ineps_novos.values() if len(ras_inep) > 1 for ra in ras_inep}
+        while True:
+            # Um aluno só libera o INEP atual se a alteração dele também for aplicada.
+            novos = {
+                ra for inep, ras_inep in ineps_novos.items() for ra in ras_inep
+                if donos.get(inep) is not None and (
+                    donos[inep] not in pendentes or pendentes[donos[inep]][1].get('inep', inep) == inep
+                    or donos[inep] in conflitos
+                )
+            } - conflitos
+            if not novos:
+                break
+            conflitos |= novos
+
+        grupos = {}  # colunas alteradas -> parâmetros do executemany
+        for ra, (indice, mudancas) in pendentes.items():
+            resultado = resultados[indice]
+            atual = atuais.get(ra)
+            if atual is None:
+                resultado['resultado'] = 'nao_encontrado'
+            elif ra in conflitos:
+                resultado.update(resultado='invalido', erro=f"INEP já usado por outro aluno: {mudancas['inep']}")
+            else:
+                colunas = tuple(coluna for coluna in COLUNAS_EDITAVEIS_ALUNO
+                                if coluna in mudancas and mudancas[coluna] != atual[coluna])
+                if not colunas:
+                    resultado['resultado'] = 'inalterado'
+                    continue
+                grupos.setdefault(colunas, []).append([mudancas[coluna] for coluna in colunas] + [ra])
+                resultado['resultado'] = 'atualizado'
+
+        if any('inep' in colunas for colunas in grupos):
+            # Libera primeiro os INEPs que mudam de dono, para permitir trocas dentro do lote.
+            conn.executemany(
+                "UPDATE alunos SET inep = NULL WHERE ra = ?",
+                [(parametros[-1],) for colunas, linhas in grupos.items() if 'inep' in colunas for parametros in linhas]
+            )
+        for colunas, linhas in grupos.items():
+            conn.executemany(
+                f"UPDATE alunos SET {', '.join(f'{coluna} = ?' for coluna in colunas)}, origem = 'manual' WHERE ra = ?", linhas
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    if grupos:
+        _invalidar_contadores()
+    return resultados
+
 if __name__ == '__main__':
     init_db()
@@ -1,7 +1,6 @@
 # -*- coding: utf-8 -*-
 import customtkinter as ctk
 import cv2
-from pyzbar.pyzbar import decode, ZBarSymbol
 from PIL import Image, ImageTk
 import threading
 import queue
@@ -12,16 +11,28 @@ import json
 from pathlib import Path
 import socket
 import database as db
+import metricas
+import profiler
 import webbrowser
 import requests
 from desktop.page_create import PaginaCadastro
 from desktop.page_user_create import PaginaCadastroUsuario
+from desktop import scanner_core
 
 
 # =============================================================================
 # --- CLASSE PRINCIPAL DA APLICAÇÃO DESKTOP ---
 # =============================================================================
 class App(ctk.CTk):
+    # Cor do texto de status para cada categoria de leitura (veja desktop/scanner_core.py)
+    CORES_LEITURA = {
+        scanner_core.REGISTRADO: "green",
+        scanner_core.FORA_DO_HORARIO: "orange",
+        scanner_core.USUARIO: "cyan",
+        scanner_core.NAO_RECONHECIDO: "red",
+        scanner_core.ERRO: "red",
+    }
+
     def __init__(self):
         super().__init__()
         # --- Configurações Iniciais da Janela ---
@@ -74,10 +85,6 @@ class App(ctk.CTk):
         
         self.on_tab_change()
 
-        # --- Carregamento de Dados Iniciais ---
-        self.class_codes = {}
-        self.load_class_data()
-        
         self.logged_in_user_token = None # Store token after professor login
 
     # =============================================================================
@@ -144,20 +151,6 @@ class App(ctk.CTk):
             error_label = ctk.CTkLabel(self.apresentacao_qr_frame, text=f"Erro ao gerar QR Code da web:\n{e}", text_color="red")
             error_label.pack(padx=10, pady=10)
 
-    def load_class_data(self):
-        class_data_path = Path("data/turmas-com-disciplinas.json")
-        if class_data_path.exists():
-            try:
-                with open(class_data_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    for class_info in data:
-                        self.class_codes[class_info['codigoTurma']] = class_info['nomeTurma']
-                print(f"Turmas carregadas: {self.class_codes}")
-            except Exception as e:
-                print(f"Erro ao carregar dados das turmas: {e}")
-        else:
-            print(f"Arquivo de dados das turmas não encontrado: {class_data_path}")
-
     def setup_ler_qrcode_tab(self):
         tab = self.tab_view.tab("Ler QR Code")
         tab.grid_columnconfigure(0, weight=1)
@@ -185,6 +178,8 @@ class App(ctk.CTk):
         import_button.grid(row=0, column=0, padx=20, pady=20)
         self.import_status_label = ctk.CTkLabel(tab, text="", font=ctk.CTkFont(size=14))
         self.import_status_label.grid(row=1, column=0, padx=20, pady=10)
+        profiler_button = ctk.CTkButton(tab, text="Gerar Perfil de Desempenho (30 s)", command=self.start_profiler)
+        profiler_button.grid(row=2, column=0, padx=20, pady=20)
 
     # =============================================================================
     # --- GERENCIAMENTO DE EVENTOS E ESTADO DA APLICAÇÃO ---
@@ -234,17 +229,15 @@ class App(ctk.CTk):
                 if self.camera_running: # Só processa se a câmera estiver "ativa"
                     if self.cap is None or not self.cap.isOpened():
                         break
-                    ret, frame = self.cap.read()
+                    with metricas.cronometro('scanner_etapa_duracao_segundos', {'etapa': 'captura'}):
+                        ret, frame = self.cap.read()
                     if not ret:
                         time.sleep(0.1)
                         continue
 
-                    # Decodifica apenas QR Codes para evitar warnings de outros formatos (ex: PDF417)
-                    decoded_objects = decode(frame, symbols=[ZBarSymbol.QRCODE])
-                    if decoded_objects:
-                        for obj in decoded_objects:
-                            (x, y, w, h) = obj.rect
-                            cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
+                    decoded_objects = scanner_core.decodificar(frame)
+                    for _, (x, y, w, h) in decoded_objects:
+                        cv2.rectangle(frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
                     try:
                         self.queue.put_nowait((frame, decoded_objects))
                     except queue.Full:
@@ -276,8 +269,7 @@ class App(ctk.CTk):
 
             current_time = time.time()
             if decoded_objects and (current_time - self.last_qr_time > self.qr_cooldown):
-                for obj in decoded_objects:
-                    qr_data = obj.data.decode('utf-8')
+                for qr_data, _ in decoded_objects:
                     # NÃO execute o processamento pesado na thread da GUI.
                     # Inicie uma nova thread para isso.
                     processing_thread = threading.Thread(target=self._process_qr_in_thread, args=(qr_data,))
@@ -300,29 +292,8 @@ class App(ctk.CTk):
         """
         Processa o QR code em uma thread separada para não bloquear a interface.
         """
-        try:
-            # 1. Tenta encontrar um aluno pelo RA/INEP lido do QR Code
-            student = db.get_student_by_identifier(ra)
-            if student:
-                # Se encontrou o aluno, registra a presença
-                tipo_registro, status_detalhado = db.add_attendance_record(student['id'])
-                if tipo_registro:
-                    feedback_msg = f"{status_detalhado}: {student['nome']}"
-                    self.status_label.configure(text=feedback_msg, text_color="green")
-                else:
-                    self.status_label.configure(text=f"Fora do horário de registro para {student['nome']}", text_color="orange")
-            else:
-                # 2. Se não encontrou um aluno, verifica se é um usuário (professor/admin)
-                user = db.get_user_by_username(ra)
-                if user and user['role'] in ['professor', 'admin']:
-                    # Lógica futura para login de professor pode ser adicionada aqui
-                    self.status_label.configure(text=f"QR Code de usuário: {user['username']}", text_color="cyan")
-                else:
-                    # 3. Se não for nem aluno nem usuário, o QR Code é inválido
-                    self.status_label.configure(text=f"QR Code não reconhecido: {ra}", text_color="red")
-        
-        except Exception as e:
-            self.status_label.configure(text=f"Erro ao processar QR Code: {e}", text_color="red")
+        leitura = scanner_core.processar_leitura(ra)
+        self.status_label.configure(text=leitura.mensagem, text_color=self.CORES_LEITURA[leitura.categoria])
 
     def update_mobile_login_qr(self):
         """Atualiza o QR Code da aba 'Apresentação' para um QR de login de professor."""
@@ -416,6 +387,15 @@ class App(ctk.CTk):
         else:
             self.import_status_label.configure(text=status_message, text_color="green")
 
+    def start_profiler(self):
+        """Liga o profiler por amostragem por 30 segundos (veja profiler.py)."""
+        try:
+            arquivo = profiler.iniciar(segundos=30)
+        except RuntimeError as e:
+            self.import_status_label.configure(text=str(e), text_color="orange")
+            return
+        self.import_status_label.configure(text=f"Coletando perfil por 30 s. Resultado em: {arquivo}", text_color="green")
+
     # =============================================================================
     # --- FINALIZAÇÃO DA APLICAÇÃO ---
     # =============================================================================
@@ -2,6 +2,7 @@ import customtkinter as ctk
 from PIL import Image
 import qrcode
 import database as db
+from catalogo_turmas import catalogo
 
 class PaginaCadastro:
     def __init__(self, tab, app):
@@ -68,7 +69,7 @@ class PaginaCadastro:
             self.register_status_label.configure(text="Nome, RA e Código da Turma são obrigatórios.", text_color="red") # INEP é opcional
             return
         
-        if codigo_turma not in self.app.class_codes:
+        if codigo_turma not in catalogo:
             self.register_status_label.configure(text=f"Código da Turma '{codigo_turma}' não encontrado.", text_color="red")
             return
 
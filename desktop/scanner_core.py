@@ -0,0 +1,305 @@
+# -*- coding: utf-8 -*-
+"""
+Leitor de QR Code sem interface gráfica, para computadores de portaria.
+
+Reúne o caminho captura -> decodificação -> registro usado pela aba "Ler QR
+Code" do desktop (desktop/main.py), sem Tk: o resultado de cada leitura é
+entregue a uma ou mais saídas plugáveis (qualquer função que receba uma
+Leitura). Só os módulos necessários são carregados: o OpenCV e o pyzbar
+apenas quando a fonte é uma câmera ou são imagens, e nunca o customtkinter.
+
+Fontes:
+    FonteCamera    Câmera (índice do dispositivo) ou arquivo de vídeo.
+    FonteImagens   Arquivos de imagem (ou pastas com imagens), em ordem de nome.
+    FonteTexto     Identificadores já decodificados, um por linha (ex: leitores
+                   USB que funcionam como teclado, ou '-' para a entrada padrão).
+
+Saídas (--saida, pode ser repetida):
+    texto            Uma linha legível por leitura na saída padrão (padrão).
+    json             Uma linha JSON por leitura na saída padrão.
+    udp://HOST:PORTA Um datagrama JSON por leitura (ex: painel ou sinalizador na rede).
+    modulo:funcao    Função importada de um módulo (ex: um buzzer ligado ao GPIO).
+
+Uso:
+    python -m desktop.scanner_core --camera 0
+    python -m desktop.scanner_core --imagens fotos/ --saida json
+    python -m desktop.scanner_core --texto - --saida udp://192.168.0.20:9999
+"""
+
+import argparse
+import importlib
+import json
+import signal
+import socket
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from pathlib import Path
+import database as db
+import metricas
+
+REGISTRADO = 'registrado'
+FORA_DO_HORARIO = 'fora_do_horario'
+USUARIO = 'usuario'
+NAO_RECONHECIDO = 'nao_reconhecido'
+ERRO = 'erro'
+
+INTERVALO_REPETICAO_SEGUNDOS = 3  # Leituras do mesmo código dentro deste intervalo são ignoradas
+EXTENSOES_IMAGEM = {'.png', '.jpg', '.jpeg', '.bmp', '.tif', '.tiff', '.webp'}
+
+Leitura = namedtuple('Leitura', ['instante', 'identificador', 'categoria', 'mensagem', 'nome', 'tipo_registro'])
+
+
+# =============================================================================
+# --- DECODIFICAÇÃO E REGISTRO ---
+# =============================================================================
+def decodificar(frame):
+    """Decodifica os QR Codes de um frame (imagem do OpenCV). Retorna [(texto, (x, y, largura, altura))]."""
+    from pyzbar.pyzbar import decode, ZBarSymbol  # Carregado só por quem decodifica imagens.
+
+    # Decodifica apenas QR Codes para evitar warnings de outros formatos (ex: PDF417)
+    with metricas.cronometro('scanner_etapa_duracao_segundos', {'etapa': 'decodificacao'}):
+        objetos = decode(frame, symbols=[ZBarSymbol.QRCODE])
+    return [(obj.data.decode('utf-8'), tuple(obj.rect)) for obj in objetos]
+
+
+def processar_leitura(identificador, instante=None):
+    """
+    Registra a presença do aluno cujo RA/INEP foi lido. Se o código não for de um
+    aluno, verifica se é de um usuário (professor/admin). Retorna uma Leitura.
+    """
+    instante = instante or datetime.now()
+    inicio = time.perf_counter()
+    try:
+        student = db.get_student_by_identifier(identificador)
+        if student:
+            tipo_registro, status_detalhado = db.add_attendance_record(student['id'], instante)
+            if tipo_registro:
+                return Leitura(instante, identificador, REGISTRADO, f"{status_detalhado}: {student['nome']}",
+                               student['nome'], tipo_registro)
+            return Leitura(instante, identificador, FORA_DO_HORARIO,
+                           f"Fora do horário de registro para {student['nome']}", student['nome'], None)
+
+        user = db.get_user_by_username(identificador)
+        if user and user['role'] in ['professor', 'admin']:
+            return Leitura(instante, identificador, USUARIO, f"QR Code de usuário: {user['username']}", None, None)
+        return Leitura(instante, identificador, NAO_RECONHECIDO, f"QR Code não reconhecido: {identificador}", None, None)
+    except Exception as e:
+        metricas.incrementar('scanner_erros_total')
+        return Leitura(instante, identificador, ERRO, f"Erro ao processar QR Code: {e}", None, None)
+    finally:
+        metricas.observar('scanner_etapa_duracao_segundos', {'etapa': 'registro'}, time.perf_counter() - inicio)
+
+
+# =============================================================================
+# --- FONTES ---
+# =============================================================================
+class FonteCamera:
+    """Frames de uma câmera (índice do dispositivo) ou de um arquivo de vídeo."""
+    decodificada = False
+
+    def __init__(self, dispositivo=0, backend=None):
+        import cv2  # Carregado só quando há uma câmera.
+        self.cap = cv2.VideoCapture(dispositivo) if backend is None else cv2.VideoCapture(dispositivo, backend)
+        if not self.cap.isOpened():
+            raise RuntimeError(f"Não foi possível acessar a câmera: {dispositivo}")
+        self.arquivo = isinstance(dispositivo, str)
+
+    def __iter__(self):
+        while self.cap.isOpened():
+            with metricas.cronometro('scanner_etapa_duracao_segundos', {'etapa': 'captura'}):
+                ret, frame = self.cap.read()
+            if not ret:
+                if self.arquivo:
+                    return  # Fim do vídeo
+                time.sleep(0.1)
+                continue
+            yield frame
+
+    def fechar(self):
+        self.cap.release()
+
+
+class FonteImagens:
+    """Frames lidos de arquivos de imagem; pastas são expandidas em ordem de nome."""
+    decodificada = False
+
+    def __init__(self, caminhos):
+        self.arquivos = []
+        for caminho in map(Path, caminhos):
+            if caminho.is_dir():
+                self.arquivos.extend(sorted(p for p in caminho.iterdir() if p.suffix.lower() in EXTENSOES_IMAGEM))
+            else:
+                self.arquivos.append(caminho)
+
+    def __iter__(self):
+        import cv2
+        for arquivo in self.arquivos:
+            frame = cv2.imread(str(arquivo))
+            if frame is None:
+                print(f"[SCANNER] Imagem ignorada (não foi possível ler): {arquivo}", file=sys.stderr)
+                continue
+            yield frame
+
+    def fechar(self):
+        pass
+
+
+class FonteTexto:
+    """Identificadores já decodificados, um por linha, de um arquivo ou da entrada padrão ('-')."""
+    decodificada = True
+
+    def __init__(self, caminho='-'):
+        self.arquivo = sys.stdin if caminho == '-' else open(caminho, 'r', encoding='utf-8')
+
+    def __iter__(self):
+        for linha in self.arquivo:
+            if linha.strip():
+                yield linha.strip()
+
+    def fechar(self):
+        if self.arquivo is not sys.stdin:
+            self.arquivo.close()
+
+
+# =============================================================================
+# --- SAÍDAS ---
+# =============================================================================
+def saida_texto(leitura):
+    """Escreve uma linha legível por leitura na saída padrão."""
+    print(f"[SCANNER] {leitura.instante:%H:%M:%S} {leitura.categoria}: {leitura.mensagem}", flush=True)
+
+
+def _como_json(leitura):
+    return json.dumps(dict(leitura._asdict(), instante=leitura.instante.isoformat()), ensure_ascii=False)
+
+
+def saida_json(leitura):
+    """Escreve uma linha JSON por leitura na saída padrão."""
+    print(_como_json(leitura), flush=True)
+
+
+class SaidaUDP:
+    """Envia um datagrama JSON por leitura para HOST:PORTA. Falhas de rede não interrompem o leitor."""
+
+    def __init__(self, host, porta):
+        self.destino = (host, int(porta))
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def __call__(self, leitura):
+        self.socket.sendto(_como_json(leitura).encode('utf-8'), self.destino)
+
+
+def carregar_saida(especificacao):
+    """Cria a saída descrita por 'texto', 'json', 'udp://HOST:PORTA' ou 'modulo:funcao'."""
+    if especificacao == 'texto':
+        return saida_texto
+    if especificacao == 'json':
+        return saida_json
+    if especificacao.startswith('udp://'):
+        host, _, porta = especificacao[len('udp://'):].rpartition(':')
+        if not host or not porta.isdigit():
+            raise ValueError(f"Saída UDP inválida: {especificacao}. Use udp://HOST:PORTA.")
+        return SaidaUDP(host, porta)
+    modulo, _, funcao = especificacao.partition(':')
+    if not funcao:
+        raise ValueError(f"Saída inválida: {especificacao}")
+    return getattr(importlib.import_module(modulo), funcao)
+
+
+# =============================================================================
+# --- LEITOR ---
+# =============================================================================
+class Leitor:
+    """
+    Liga uma fonte às saídas: decodifica os frames, ignora o mesmo código lido de
+    novo dentro de 'intervalo_repeticao' segundos, registra a presença e entrega
+    cada Leitura a todas as saídas.
+    """
+
+    def __init__(self, saidas, intervalo_repeticao=INTERVALO_REPETICAO_SEGUNDOS):
+        self.saidas = list(saidas)
+        self.intervalo_repeticao = intervalo_repeticao
+        self._ultima_leitura = {}  # identificador -> time.monotonic() da última leitura aceita
+        self.parar = threading.Event()
+
+    def tratar_identificador(self, identificador):
+        """Processa um código lido e o entrega às saídas. Retorna a Leitura, ou None se repetida."""
+        agora = time.monotonic()
+        if agora - self._ultima_leitura.get(identificador, float('-inf')) < self.intervalo_repeticao:
+            return None
+        self._ultima_leitura = {
+            codigo: instante for codigo, instante in self._ultima_leitura.items()
+            if agora - instante < self.intervalo_repeticao
+        }
+        self._ultima_leitura[identificador] = agora
+
+        leitura = processar_leitura(identificador)
+        for saida in self.saidas:
+            try:
+                saida(leitura)
+            except Exception as e:
+                print(f"[SCANNER] Erro na saída {saida!r}: {e}", file=sys.stderr)
+        return leitura
+
+    def executar(self, fonte):
+        """Lê a fonte até ela terminar ou até 'parar' ser sinalizado. Retorna o número de leituras processadas."""
+        processadas = 0
+        try:
+            for item in fonte:
+                if self.parar.is_set():
+                    break
+                codigos = [item] if fonte.decodificada else [texto for texto, _ in decodificar(item)]
+                for codigo in codigos:
+                    if self.tratar_identificador(codigo) is not None:
+                        processadas += 1
+        finally:
+            fonte.fechar()
+        return processadas
+
+
+# =============================================================================
+# --- PONTO DE ENTRADA ---
+# =============================================================================
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Leitor de QR Code sem interface gráfica (portaria).")
+    fontes = parser.add_mutually_exclusive_group(required=True)
+    fontes.add_argument("--camera", help="Índice da câmera (ex: 0) ou arquivo de vídeo.")
+    fontes.add_argument("--imagens", nargs='+', help="Arquivos de imagem ou pastas com imagens.")
+    fontes.add_argument("--texto", help="Arquivo com um identificador por linha ('-' para a entrada padrão).")
+    parser.add_argument("--saida", action="append",
+                        help="texto, json, udp://HOST:PORTA ou modulo:funcao. Pode ser repetida (padrão: texto).")
+    parser.add_argument("--intervalo", type=float, default=INTERVALO_REPETICAO_SEGUNDOS,
+                        help="Segundos em que o mesmo código lido de novo é ignorado.")
+    parser.add_argument("--sem-sincronizacao", action="store_true",
+                        help="Não inicia o envio à central, mesmo com PRESENCA_SYNC_URL definido.")
+    args = parser.parse_args()
+
+    try:
+        saidas = [carregar_saida(especificacao) for especificacao in (args.saida or ['texto'])]
+    except (ValueError, ImportError, AttributeError) as e:
+        parser.error(str(e))
+
+    db.init_db()
+    if not args.sem_sincronizacao:
+        import sincronizacao
+        # Envia as leituras desta estação para a central, se PRESENCA_SYNC_URL estiver definido
+        sincronizacao.iniciar_agente()
+
+    if args.camera is not None:
+        fonte = FonteCamera(int(args.camera) if args.camera.isdigit() else args.camera)
+    elif args.imagens:
+        fonte = FonteImagens(args.imagens)
+    else:
+        fonte = FonteTexto(args.texto)
+
+    leitor = Leitor(saidas, intervalo_repeticao=args.intervalo)
+    signal.signal(signal.SIGTERM, lambda *_: leitor.parar.set())
+    try:
+        total = leitor.executar(fonte)
+    except KeyboardInterrupt:
+        total = None
+    if total is not None:
+        print(f"[SCANNER] Fonte encerrada: {total} leitura(s) processada(s).", file=sys.stderr)
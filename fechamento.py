@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+"""
+Fechamento do dia: grava o status final de presença de todos os alunos.
+
+Depois do horário de saída (mais a tolerância) de todas as turmas, o status
+de cada aluno no dia (um dos valores de database.STATUS_PRESENCA, inclusive
+'Ausente') é calculado em um único comando SQL e gravado na tabela compacta
+'presenca_diaria' (dia, aluno, turma, código do status, horários de entrada e
+saída com a precisão das leituras). O histórico do aluno e os relatórios leem
+os dias fechados dessa tabela, sem reprocessar as leituras.
+
+- O fechamento de um dia apaga e regrava as linhas do dia na mesma transação,
+  então pode ser repetido sem efeitos colaterais.
+- finalizar_pendentes() fecha todos os dias desde o último fechado (recuperando
+  dias perdidos, ex: com o computador desligado) e refaz os dias fechados que
+  receberam leituras depois do fechamento (ex: lotes de /api/scans ou de uma
+  estação sincronizada).
+- Fins de semana só são fechados se tiverem leituras. Dias já arquivados
+  (veja arquivamento.py) nunca são refeitos.
+- Cada dia só inclui os alunos que já existiam nele: cadastrados até o dia
+  (coluna 'cadastrado_em') ou, nos alunos anteriores a essa coluna, com alguma
+  leitura até o dia (ou sem leitura nenhuma, quando não há como saber).
+- Ao refazer um dia, cada aluno continua na turma em que foi fechado. Na
+  primeira vez, vale a turma atual do aluno: quem trocou de turma antes do
+  fechamento (ex: os dias recuperados na primeira execução) fica com a nova.
+
+Uso:
+    python fechamento.py                 # Fecha os dias pendentes
+    python fechamento.py --dia 2026-03-02
+"""
+
+import argparse
+import threading
+import time
+from datetime import date, datetime, timedelta
+import database as db
+import regras_horario
+
+INTERVALO_PADRAO_SEGUNDOS = 600
+PAUSA_ENTRE_DIAS = 0.05  # Segundos; dá vez aos registros de presença entre os dias fechados
+
+_lock = threading.Lock()
+
+
+def _sql_codigo_status(coluna_turma):
+    """Expressão SQL que converte o status de presença do dia no código numérico."""
+    casos = ' '.join(f"WHEN '{status}' THEN {codigo}" for codigo, status in enumerate(db.STATUS_PRESENCA))
+    return f"CASE status_presenca({coluna_turma}, entrada.timestamp, saida.timestamp) {casos} END"
+
+
+def horario_fechamento():
+    """Horário a partir do qual o dia pode ser fechado: a maior saída, com tolerância, entre as regras de horário."""
+    saidas = [datetime.combine(date.today(), db.HORA_SAIDA_PADRAO) + db.TOLERANCIA_MINUTOS]
+    for regra in regras_horario.listar_regras():
+        saidas.append(datetime.combine(date.today(), datetime.strptime(regra['hora_saida'], '%H:%M').time())
+                      + timedelta(minutes=regra['tolerancia_minutos']))
+    return max(saidas).time()
+
+
+def finalizar_dia(dia, conn=None):
+    """
+    Calcula e grava o status final de todos os alunos no dia. Retorna o número de
+    alunos gravados. Com 'conn', não faz commit (usado por finalizar_pendentes).
+    """
+    propria = conn is None
+    if propria:
+        conn = db.get_db_connection()
+    try:
+        inicio, fim = datetime.combine(dia, datetime.min.time()), datetime.combine(dia + timedelta(days=1), datetime.min.time())
+        dia_iso = dia.isoformat()
+        # Turma em que cada aluno foi fechado neste dia, para refazer o dia sem trocar as turmas.
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS turma_fechada (aluno_id INTEGER PRIMARY KEY, codigo_turma TEXT)")
+        conn.execute("DELETE FROM temp.turma_fechada")
+        conn.execute("INSERT INTO temp.turma_fechada SELECT aluno_id, codigo_turma FROM presenca_diaria WHERE dia = ?", (dia_iso,))
+        conn.execute("DELETE FROM presenca_diaria WHERE dia = ?", (dia_iso,))
+        cursor = conn.execute(f"""
+        INSERT INTO presenca_diaria (dia, aluno_id, codigo_turma, status, entrada, saida)
+        SELECT ?, a.id, a.turma, {_sql_codigo_status('a.turma')}, SUBSTR(entrada.timestamp, 12), SUBSTR(saida.timestamp, 12)
+        FROM (
+            SELECT al.id, al.cadastrado_em,
+                   CASE WHEN f.aluno_id IS NULL THEN al.codigo_turma ELSE f.codigo_turma END AS turma
+            FROM alunos al LEFT JOIN temp.turma_fechada f ON f.aluno_id = al.id
+        ) a
+        LEFT JOIN (
+            SELECT aluno_id, MAX(timestamp) AS timestamp FROM presenca
+            WHERE tipo_registro = 'entrada' AND timestamp >= ? AND timestamp < ?
+            GROUP BY aluno_id
+        ) entrada ON a.id = entrada.aluno_id
+        LEFT JOIN (
+            SELECT aluno_id, MAX(timestamp) AS timestamp FROM presenca
+            WHERE tipo_registro = 'saida' AND timestamp >= ? AND timestamp < ?
+            GROUP BY aluno_id
+        ) saida ON a.id = saida.aluno_id
+        WHERE entrada.timestamp IS NOT NULL OR saida.timestamp IS NOT NULL
+           OR a.cadastrado_em <= ?
+           OR (a.cadastrado_em IS NULL AND (
+                EXISTS (SELECT 1 FROM presenca p WHERE p.aluno_id = a.id AND p.timestamp < ?)
+                OR EXISTS (SELECT 1 FROM presenca_diaria d WHERE d.aluno_id = a.id AND d.dia < ? AND d.entrada IS NOT NULL)
+                OR NOT EXISTS (SELECT 1 FROM presenca p WHERE p.aluno_id = a.id)
+           ))
+        """, (dia_iso, inicio, fim, inicio, fim, dia_iso, fim, dia_iso))
+        if propria:
+            conn.commit()
+        return cursor.rowcount
+    finally:
+        if propria:
+            conn.close()
+
+
+def _estado(conn, chave):
+    row = conn.execute("SELECT valor FROM agregado_estado WHERE chave = ?", (chave,)).fetchone()
+    return row['valor'] if row else None
+
+
+def _gravar_estado(conn, chave, valor):
+    conn.execute("INSERT OR REPLACE INTO agregado_estado (chave, valor) VALUES (?, ?)", (chave, valor))
+
+
+def ultimo_dia_finalizado():
+    """Último dia fechado (date) ou None."""
+    conn = db.get_db_connection()
+    valor = _estado(conn, 'fechamento_ultimo_dia')
+    conn.close()
+    return date.fromisoformat(valor) if valor else None
+
+
+def finalizar_pendentes(agora=None):
+    """
+    Fecha os dias pendentes até o último dia encerrado (hoje, se já passou do
+    horário de fechamento) e refaz os dias fechados que receberam leituras
+    depois do fechamento. Retorna a lista de dias fechados.
+    """
+    agora = agora or datetime.now()
+    ultimo_encerrado = agora.date() if agora.time() >= horario_fechamento() else agora.date() - timedelta(days=1)
+    limite_arquivo = db.data_limite_arquivo()
+
+    with _lock:
+        conn = db.get_db_connection()
+        try:
+            ultimo_dia = _estado(conn, 'fechamento_ultimo_dia')
+            ultimo_id = int(_estado(conn, 'fechamento_ultimo_id') or 0)
+            novo_ultimo_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM presenca").fetchone()[0]
+
+            if ultimo_dia:
+                inicio = date.fromisoformat(ultimo_dia) + timedelta(days=1)
+            else:
+                primeiro = conn.execute("SELECT MIN(timestamp) FROM presenca").fetchone()[0]
+                inicio = datetime.fromisoformat(primeiro).date() if primeiro else ultimo_encerrado + timedelta(days=1)
+
+            # Dias com leituras: os fins de semana só são fechados se aparecerem aqui.
+            dias_com_leituras = {
+                date.fromisoformat(row[0]) for row in conn.execute(
+                    "SELECT DISTINCT DATE(timestamp) FROM presenca WHERE timestamp >= ? AND id <= ?",
+                    (inicio.isoformat(), novo_ultimo_id)
+                ) if row[0]
+            }
+            dias = []
+            dia = inicio
+            while dia <= ultimo_encerrado:
+                if dia.weekday() < 5 or dia in dias_com_leituras:
+                    dias.append(dia)
+                dia += timedelta(days=1)
+
+            # Dias já fechados que receberam leituras depois do fechamento.
+            if ultimo_dia:
+                dias.extend(
+                    date.fromisoformat(row[0]) for row in conn.execute(
+                        "SELECT DISTINCT DATE(timestamp) FROM presenca WHERE id > ? AND id <= ? AND timestamp < ?",
+                        (ultimo_id, novo_ultimo_id, inicio.isoformat())
+                    ) if row[0]
+                )
+            if limite_arquivo is not None:
+                dias = [dia for dia in dias if dia > limite_arquivo]
+
+            # Um commit por dia, com uma pausa em seguida, para que a recuperação de um
+            # histórico longo não trave as leituras de QR Code. O último dia fechado avança
+            # junto, então uma interrupção retoma do dia seguinte ao último gravado.
+            for dia in sorted(set(dias)):
+                finalizar_dia(dia, conn)
+                if dia >= inicio:
+                    _gravar_estado(conn, 'fechamento_ultimo_dia', dia.isoformat())
+                conn.commit()
+                time.sleep(PAUSA_ENTRE_DIAS)
+            if ultimo_encerrado >= inicio:
+                _gravar_estado(conn, 'fechamento_ultimo_dia', ultimo_encerrado.isoformat())
+            _gravar_estado(conn, 'fechamento_ultimo_id', str(novo_ultimo_id))
+            conn.commit()
+            return sorted(set(dias))
+        finally:
+            conn.close()
+
+
+def refazer_fechados():
+    """Refaz todos os dias fechados e não arquivados (ex: após mudar as regras de horário). Retorna o número de dias."""
+    limite_arquivo = db.data_limite_arquivo()
+    with _lock:
+        conn = db.get_db_connection()
+        try:
+            dias = [
+                date.fromisoformat(row[0]) for row in conn.execute(
+                    "SELECT DISTINCT dia FROM presenca_diaria WHERE dia > ?",
+                    ((limite_arquivo or date.min).isoformat(),)
+                )
+            ]
+            # Um commit por dia, com uma pausa em seguida, para não travar as leituras
+            # de QR Code durante todo o recálculo.
+            for dia in dias:
+                finalizar_dia(dia, conn)
+                conn.commit()
+                time.sleep(PAUSA_ENTRE_DIAS)
+            return len(dias)
+        finally:
+            conn.close()
+
+
+def iniciar_agendador(intervalo_segundos=INTERVALO_PADRAO_SEGUNDOS):
+    """Executa finalizar_pendentes() a cada 'intervalo_segundos' em uma thread daemon."""
+    def _loop():
+        while True:
+            try:
+                dias = finalizar_pendentes()
+                if dias:
+                    print(f"[FECHAMENTO] {len(dias)} dia(s) fechado(s): {', '.join(dia.isoformat() for dia in dias[-5:])}")
+            except Exception as e:
+                print(f"[FECHAMENTO] Erro ao fechar os dias pendentes: {e}")
+            time.sleep(intervalo_segundos)
+
+    thread = threading.Thread(target=_loop, name='fechamento', daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Fecha o status de presença dos dias encerrados.")
+    parser.add_argument("--dia", type=date.fromisoformat, help="Fecha (ou refaz) apenas este dia (AAAA-MM-DD).")
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.dia:
+        print(f"{finalizar_dia(args.dia)} alunos gravados em {args.dia}.")
+    else:
+        dias = finalizar_pendentes()
+        print(f"{len(dias)} dia(s) fechado(s).")
@@ -0,0 +1,294 @@
+# -*- coding: utf-8 -*-
+"""
+Importação de alunos a partir dos arquivos JSON da pasta 'data'.
+
+Cada arquivo 'data/<codigo_turma>.json' traz a lista de alunos de uma turma
+({"nome", "ra", "inep"}). Em vez de apagar e recarregar tudo, a importação
+compara os arquivos com o banco e aplica apenas as diferenças:
+- alunos novos são inseridos com origem 'importacao' (e ganham um usuário
+  'aluno' com o RA como senha);
+- alunos da importação com nome, INEP ou turma diferentes são atualizados.
+  Alunos cadastrados ou alterados à mão (origem 'manual', ex: uma troca de
+  turma por /api/students/bulk) não são alterados; voltam a ser da importação
+  quando os dados deles coincidem com os do arquivo;
+- nenhum aluno é removido: a repopulação completa apenas relata, em
+  'ausentes', os alunos vindos da importação que não estão em nenhum arquivo.
+  Alunos cadastrados à mão (origem 'manual') nunca aparecem nessa lista, e o
+  histórico de presença é sempre preservado.
+
+A tabela 'importacao_arquivos' guarda o tamanho, a data de modificação e o hash
+SHA-256 de cada arquivo já importado. sincronizar_pasta() só relê os arquivos
+cujo tamanho ou data mudaram (e só os aplica se o conteúdo mudou), então
+verificar a pasta sem alterações custa apenas um 'stat' por arquivo. O run.py
+sincroniza a pasta ao iniciar e a verifica periodicamente (iniciar_monitoramento).
+
+Os arquivos são processados um a um, cada um em uma transação curta, para não
+bloquear o leitor de QR Code: as consultas e os hashes de senha (lentos de
+propósito) são feitos antes da primeira escrita, e as gravações usam executemany. repopular() relê todos os arquivos e é executada
+como tarefa em segundo plano (veja jobs.py) pela rota /api/repopulate_students.
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from werkzeug.security import generate_password_hash
+import contadores
+import database as db
+import jobs
+import sincronizacao
+
+PASTA_DADOS = Path("data")
+ARQUIVOS_IGNORADOS = {"turmas-com-disciplinas.json"}
+INTERVALO_MONITORAMENTO_SEGUNDOS = 60
+
+_lock = threading.Lock()  # Uma sincronização por vez (monitoramento e tarefa de repopulação)
+
+
+def arquivos_de_turma(pasta=PASTA_DADOS):
+    """Arquivos JSON de turmas da pasta, em ordem de nome."""
+    return sorted(arquivo for arquivo in Path(pasta).glob("*.json") if arquivo.name not in ARQUIVOS_IGNORADOS)
+
+
+def ler_alunos(caminho, erros):
+    """
+    Lê um arquivo de turma. Retorna {ra: (nome, inep)}; entradas incompletas são
+    anotadas em 'erros'. Lança ValueError se o arquivo não for um JSON válido.
+    """
+    caminho = Path(caminho)
+    with open(caminho, 'r', encoding='utf-8') as f:
+        try:
+            dados = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Erro de JSON em {caminho.name}: {e}")
+    alunos = {}
+    for aluno in dados:
+        nome = aluno.get('nome')
+        ra = str(aluno['ra']) if aluno.get('ra') else None
+        if not nome or not ra:
+            erros.append(f"Dados incompletos no arquivo {caminho.name}")
+            continue
+        alunos[ra] = (nome, str(aluno['inep']) if aluno.get('inep') else None)
+    return alunos
+
+
+def aplicar_turma(conn, codigo_turma, alunos, erros):
+    """
+    Aplica ao banco as diferenças entre os alunos lidos de um arquivo e os já
+    cadastrados, sem commit. As consultas e os hashes das senhas dos novos
+    usuários são feitos antes da primeira escrita, então a transação (que
+    bloqueia o leitor de QR Code) dura só o tempo dos comandos.
+    Alunos cujo INEP já pertence a outro aluno (do arquivo ou do banco) são
+    ignorados e relatados em 'erros'; os demais são gravados.
+    Retorna um dicionário com as contagens.
+    """
+    contagem = {'inseridos': 0, 'atualizados': 0, 'inalterados': 0, 'manuais': 0}
+    if not alunos:
+        return contagem
+    ras = list(alunos)
+    existentes = {}
+    com_usuario = set()
+    ineps = sorted({inep for _, inep in alunos.values() if inep})
+    dono_inep = {}
+    for i in range(0, len(ineps), 500):
+        parte = ineps[i:i + 500]
+        dono_inep.update(
+            (row['inep'], row['ra']) for row in conn.execute(
+                f"SELECT ra, inep FROM alunos WHERE inep IN ({','.join('?' * len(parte))})", parte
+            )
+        )
+    for i in range(0, len(ras), 500):  # Respeita o limite de parâmetros do SQLite
+        parte = ras[i:i + 500]
+        marcadores = ','.join('?' * len(parte))
+        existentes.update(
+            (row['ra'], row) for row in conn.execute(
+                f"SELECT ra, nome, inep, codigo_turma, origem FROM alunos WHERE ra IN ({marcadores})", parte
+            )
+        )
+        com_usuario.update(
+            row['username'] for row in conn.execute(f"SELECT username FROM users WHERE username IN ({marcadores})", parte)
+        )
+
+    inserir, atualizar, adotar = [], [], []
+    ignorados = set()
+    hoje = datetime.now().date().isoformat()
+    for ra in ras:
+        nome, inep = alunos[ra]
+        atual = existentes.get(ra)
+        gravar_inep = atual is None or (atual['origem'] == 'importacao' and atual['inep'] != inep)
+        if inep and gravar_inep and dono_inep.setdefault(inep, ra) != ra:
+            # O INEP é único: um conflito ignora só este aluno, não o arquivo inteiro.
+            erros.append(f"INEP {inep} do RA {ra} (arquivo {codigo_turma}) já pertence ao RA {dono_inep[inep]}. Aluno ignorado.")
+            ignorados.add(ra)
+            continue
+        if atual is None:
+            inserir.append((ra, nome, codigo_turma, inep, hoje))
+            continue
+        igual = (atual['nome'], atual['inep'], atual['codigo_turma']) == (nome, inep, codigo_turma)
+        if atual['origem'] != 'importacao':
+            # Alterações feitas à mão prevalecem sobre o arquivo.
+            if igual:
+                adotar.append((ra,))
+                contagem['inalterados'] += 1
+            else:
+                contagem['manuais'] += 1
+        elif not igual:
+            atualizar.append((nome, inep, codigo_turma, ra))
+        else:
+            contagem['inalterados'] += 1
+    # O RA é o usuário e a senha padrão do aluno na web.
+    usuarios = [(ra, generate_password_hash(ra)) for ra in ras if ra not in com_usuario and ra not in ignorados]
+
+    conn.executemany(
+        "INSERT INTO alunos (ra, nome, codigo_turma, inep, cadastrado_em, origem) VALUES (?, ?, ?, ?, ?, 'importacao')", inserir
+    )
+    conn.executemany("UPDATE alunos SET nome = ?, inep = ?, codigo_turma = ? WHERE ra = ?", atualizar)
+    conn.executemany("UPDATE alunos SET origem = 'importacao' WHERE ra = ?", adotar)
+    conn.executemany("INSERT OR IGNORE INTO users (username, password, role) VALUES (?, ?, 'aluno')", usuarios)
+    contagem['inseridos'] = len(inserir)
+    contagem['atualizados'] = len(atualizar)
+    return contagem
+
+
+def listar_ausentes(conn, ras_presentes):
+    """RAs dos alunos vindos da importação que não estão em 'ras_presentes', em ordem."""
+    return sorted(
+        row['ra'] for row in conn.execute("SELECT ra FROM alunos WHERE origem = 'importacao'")
+        if row['ra'] not in ras_presentes
+    )
+
+
+def _hash_arquivo(caminho):
+    return hashlib.sha256(Path(caminho).read_bytes()).hexdigest()
+
+
+def sincronizar_pasta(pasta=PASTA_DADOS, completo=False, progresso=None):
+    """
+    Aplica ao banco as alterações dos arquivos da pasta desde a última sincronização.
+    Com 'completo', relê todos os arquivos e relata em 'ausentes' os RAs dos
+    alunos da importação que não estão em nenhum deles (nenhum aluno é
+    removido); sem ele, só os arquivos alterados ou novos são relidos.
+    'progresso' recebe (processados, total) após cada arquivo.
+    Retorna as contagens e os erros.
+    """
+    with _lock:
+        arquivos = arquivos_de_turma(pasta)
+        resultado = {'arquivos': len(arquivos), 'alterados': 0, 'inseridos': 0, 'atualizados': 0,
+                     'inalterados': 0, 'manuais': 0, 'ausentes': [], 'erros': []}
+
+        conn = db.get_db_connection()
+        manifesto = {row['caminho']: row for row in conn.execute("SELECT * FROM importacao_arquivos")}
+        conn.close()
+
+        ras_presentes = set()
+        arquivos_com_erro = 0
+        for i, arquivo in enumerate(arquivos, start=1):
+            caminho = arquivo.as_posix()
+            anterior = manifesto.pop(caminho, None)
+            if progresso:
+                progresso(i - 1, len(arquivos))
+            try:
+                info = arquivo.stat()
+                if not completo and anterior and (anterior['mtime_ns'], anterior['tamanho']) == (info.st_mtime_ns, info.st_size):
+                    continue  # Não mudou desde a última sincronização
+                hash_atual = _hash_arquivo(arquivo)
+                if not completo and anterior and anterior['hash'] == hash_atual:
+                    conn = db.get_db_connection()
+                    conn.execute("UPDATE importacao_arquivos SET mtime_ns = ?, tamanho = ? WHERE caminho = ?",
+                                 (info.st_mtime_ns, info.st_size, caminho))
+                    conn.commit()
+                    conn.close()
+                    continue
+                alunos = ler_alunos(arquivo, resultado['erros'])
+            except (OSError, ValueError) as e:
+                resultado['erros'].append(str(e))
+                arquivos_com_erro += 1
+                continue
+
+            ras_presentes.update(alunos)
+            conn = db.get_db_connection()
+            try:
+                contagem = aplicar_turma(conn, arquivo.stem, alunos, resultado['erros'])
+                conn.execute(
+                    "INSERT OR REPLACE INTO importacao_arquivos (caminho, hash, mtime_ns, tamanho, alunos, importado_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (caminho, hash_atual, info.st_mtime_ns, info.st_size, len(alunos), datetime.now())
+                )
+                conn.commit()
+            except sqlite3.Error as e:
+                # Ex: um aluno cadastrado à mão com o mesmo INEP entre a consulta e a gravação.
+                # O arquivo fica fora do manifesto e é tentado de novo na próxima verificação.
+                conn.rollback()
+                resultado['erros'].append(f"Erro ao importar {arquivo.name}: {e}")
+                arquivos_com_erro += 1
+                continue
+            finally:
+                conn.close()
+            for chave, valor in contagem.items():
+                resultado[chave] += valor
+            resultado['alterados'] += 1
+        if progresso:
+            progresso(len(arquivos), len(arquivos))
+
+        # O que sobrou no manifesto são arquivos apagados da pasta. Os alunos deles
+        # ficam como estão; só a repopulação completa os relata como ausentes.
+        conn = db.get_db_connection()
+        try:
+            if completo and arquivos_com_erro:
+                # Um arquivo ilegível faria seus alunos parecerem ausentes.
+                resultado['erros'].append("Os alunos ausentes não foram verificados porque há arquivos com erro.")
+            elif completo and arquivos:
+                resultado['ausentes'] = listar_ausentes(conn, ras_presentes)
+            conn.executemany("DELETE FROM importacao_arquivos WHERE caminho = ?", [(caminho,) for caminho in manifesto])
+            conn.commit()
+        finally:
+            conn.close()
+        if resultado['inseridos'] or resultado['atualizados']:
+            contadores.invalidar()
+        if resultado['inseridos']:
+            # Leituras de estações que chegaram antes dos alunos novos (veja sincronizacao.py).
+            sincronizacao.aplicar_pendentes()
+        return resultado
+
+
+def repopular(progresso=None, pasta=PASTA_DADOS):
+    """Sincroniza a tabela de alunos com todos os arquivos da pasta (veja sincronizar_pasta)."""
+    return sincronizar_pasta(pasta, completo=True, progresso=progresso)
+
+
+def iniciar_monitoramento(pasta=PASTA_DADOS, intervalo_segundos=INTERVALO_MONITORAMENTO_SEGUNDOS):
+    """Verifica a pasta a cada 'intervalo_segundos' em uma thread daemon e aplica as alterações."""
+    def _loop():
+        while True:
+            time.sleep(intervalo_segundos)
+            try:
+                resultado = sincronizar_pasta(pasta)
+                if resultado['alterados'] or resultado['erros']:
+                    print(f"[IMPORTACAO] {resultado['alterados']} arquivo(s) alterado(s): {resultado['inseridos']} novos, "
+                          f"{resultado['atualizados']} atualizados, {len(resultado['erros'])} erro(s).")
+            except Exception as e:
+                print(f"[IMPORTACAO] Erro ao verificar a pasta '{pasta}': {e}")
+
+    thread = threading.Thread(target=_loop, name='importacao', daemon=True)
+    thread.start()
+    return thread
+
+
+jobs.registrar('repopular_alunos', repopular)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Importa os alunos dos arquivos JSON da pasta 'data'.")
+    parser.add_argument("--pasta", default=str(PASTA_DADOS), help="Pasta com os arquivos das turmas.")
+    parser.add_argument("--completo", action="store_true",
+                        help="Relê todos os arquivos e relata (sem removê-los) os alunos que não estão em nenhum deles.")
+    args = parser.parse_args()
+
+    db.init_db()
+    for chave, valor in sincronizar_pasta(args.pasta, completo=args.completo).items():
+        print(f"{chave}: {valor}")
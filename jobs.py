@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Tarefas em segundo plano, para operações longas demais para uma requisição web.
+
+- enfileirar() grava a tarefa na tabela 'jobs' e devolve o id. Se já houver
+  uma tarefa do mesmo tipo aguardando na fila, o pedido é agrupado com ela
+  (o mesmo id é devolvido), então vários cliques no mesmo botão executam a
+  tarefa uma única vez.
+- Um único worker (thread daemon) executa as tarefas em ordem de chegada. A
+  função da tarefa recebe um callback progresso(processados, total) e devolve
+  um dicionário com o resultado, que é gravado em JSON.
+- Como a fila fica no banco, tarefas pendentes ou interrompidas por um
+  reinício da aplicação voltam a ser executadas quando o worker é iniciado.
+
+As funções das tarefas são registradas por tipo com registrar().
+"""
+
+import json
+import threading
+import traceback
+from datetime import datetime
+import database as db
+
+PENDENTE = 'pendente'
+EXECUTANDO = 'executando'
+CONCLUIDO = 'concluido'
+ERRO = 'erro'
+
+_tarefas = {}
+_lock = threading.Lock()
+_nova_tarefa = threading.Event()
+_worker = None
+
+
+def registrar(tipo, funcao):
+    """Registra a função executada pelas tarefas do tipo informado."""
+    _tarefas[tipo] = funcao
+
+
+def enfileirar(tipo, solicitado_por=None):
+    """
+    Coloca uma tarefa na fila e inicia o worker, se necessário.
+    Retorna (id, agrupada), em que 'agrupada' indica que já havia uma tarefa
+    do mesmo tipo aguardando na fila e o pedido foi agrupado com ela.
+    """
+    if tipo not in _tarefas:
+        raise ValueError(f"Tipo de tarefa desconhecido: {tipo}")
+    conn = db.get_db_connection()
+    try:
+        conn.execute("BEGIN IMMEDIATE")
+        pendente = conn.execute(
+            "SELECT id FROM jobs WHERE tipo = ? AND estado = ? ORDER BY id LIMIT 1", (tipo, PENDENTE)
+        ).fetchone()
+        if pendente:
+            conn.commit()
+            return pendente['id'], True
+        cursor = conn.execute(
+            "INSERT INTO jobs (tipo, estado, solicitado_por, criado_em) VALUES (?, ?, ?, ?)",
+            (tipo, PENDENTE, solicitado_por, datetime.now())
+        )
+        conn.commit()
+        job_id = cursor.lastrowid
+    finally:
+        conn.close()
+    iniciar_worker()
+    _nova_tarefa.set()
+    return job_id, False
+
+
+def consultar(job_id):
+    """Retorna o estado de uma tarefa (com 'resultado' decodificado) ou None."""
+    conn = db.get_db_connection()
+    row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    conn.close()
+    if row is None:
+        return None
+    job = dict(row)
+    job['resultado'] = json.loads(job['resultado']) if job['resultado'] else None
+    return job
+
+
+def _atualizar(job_id, **campos):
+    conn = db.get_db_connection()
+    conn.execute(
+        f"UPDATE jobs SET {', '.join(f'{campo} = ?' for campo in campos)} WHERE id = ?",
+        list(campos.values()) + [job_id]
+    )
+    conn.commit()
+    conn.close()
+
+
+def _proxima():
+    conn = db.get_db_connection()
+    row = conn.execute("SELECT id, tipo FROM jobs WHERE estado = ? ORDER BY id LIMIT 1", (PENDENTE,)).fetchone()
+    conn.close()
+    return row
+
+
+def _executar(job_id, tipo):
+    _atualizar(job_id, estado=EXECUTANDO, iniciado_em=datetime.now())
+
+    def progresso(processados, total):
+        _atualizar(job_id, processados=processados, total=total)
+
+    try:
+        resultado = _tarefas[tipo](progresso=progresso)
+        _atualizar(job_id, estado=CONCLUIDO, concluido_em=datetime.now(),
+                   resultado=json.dumps(resultado, ensure_ascii=False, default=str))
+    except Exception as e:
+        print(f"[JOBS] Erro na tarefa {job_id} ({tipo}): {e}")
+        traceback.print_exc()
+        _atualizar(job_id, estado=ERRO, concluido_em=datetime.now(), erro=str(e))
+
+
+def _loop():
+    while True:
+        _nova_tarefa.clear()
+        proxima = _proxima()
+        if proxima is None:
+            _nova_tarefa.wait(timeout=60)
+            continue
+        if proxima['tipo'] not in _tarefas:
+            _atualizar(proxima['id'], estado=ERRO, concluido_em=datetime.now(),
+                       erro=f"Tipo de tarefa desconhecido: {proxima['tipo']}")
+            continue
+        _executar(proxima['id'], proxima['tipo'])
+
+
+def iniciar_worker():
+    """
+    Inicia o worker, uma única vez por processo. Tarefas que estavam em execução
+    quando a aplicação foi encerrada voltam para a fila.
+    """
+    global _worker
+    with _lock:
+        if _worker is not None:
+            return _worker
+        conn = db.get_db_connection()
+        conn.execute("UPDATE jobs SET estado = ? WHERE estado = ?", (PENDENTE, EXECUTANDO))
+        conn.commit()
+        conn.close()
+        _worker = threading.Thread(target=_loop, name='jobs', daemon=True)
+        _worker.start()
+        return _worker
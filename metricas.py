@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+Instrumentação leve da aplicação (tempos, contagens e histogramas).
+
+Cada thread grava suas medições em uma estrutura própria (threading.local), sem
+travas no caminho quente; as estruturas só são combinadas quando alguém lê as
+métricas (rota /metrics ou resumo periódico). Quando uma thread termina, os
+seus números são incorporados a um acumulado geral, então nada se perde mesmo
+com o servidor Flask criando uma thread por requisição.
+
+Uso:
+    metricas.observar('nome_da_metrica', {'rotulo': 'valor'}, segundos)
+    metricas.incrementar('nome_do_contador', {'rotulo': 'valor'})
+    metricas.instrumentar_modulo(database)  # mede todas as funções públicas do módulo
+"""
+
+import bisect
+import functools
+import inspect
+import sqlite3
+import threading
+import time
+
+# Limites superiores (em segundos) dos intervalos dos histogramas.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_local = threading.local()
+_por_thread = []  # [(thread, dados)]
+_acumulado = {'contadores': {}, 'histogramas': {}}
+_coletores = []  # Funções que devolvem medições instantâneas (gauges)
+_descricoes = {}
+
+
+def _novos_dados():
+    return {'contadores': {}, 'histogramas': {}}
+
+
+def _mesclar(destino, origem):
+    for chave, valor in origem['contadores'].items():
+        destino['contadores'][chave] = destino['contadores'].get(chave, 0) + valor
+    for chave, (buckets, soma, contagem) in origem['histogramas'].items():
+        atual = destino['histogramas'].get(chave)
+        if atual is None:
+            destino['histogramas'][chave] = [list(buckets), soma, contagem]
+        else:
+            for i, n in enumerate(buckets):
+                atual[0][i] += n
+            atual[1] += soma
+            atual[2] += contagem
+
+
+def _recolher_threads_encerradas():
+    """Incorpora ao acumulado os dados das threads que já terminaram. Chamar com _lock."""
+    vivos = []
+    for thread, dados in _por_thread:
+        if thread.is_alive():
+            vivos.append((thread, dados))
+        else:
+            _mesclar(_acumulado, dados)
+    _por_thread[:] = vivos
+
+
+def _dados_da_thread():
+    dados = getattr(_local, 'dados', None)
+    if dados is None:
+        dados = _local.dados = _novos_dados()
+        with _lock:
+            _recolher_threads_encerradas()
+            _por_thread.append((threading.current_thread(), dados))
+    return dados
+
+
+def _chave(nome, rotulos):
+    return (nome, tuple(sorted(rotulos.items())) if rotulos else ())
+
+
+def descrever(nome, descricao):
+    """Registra o texto de ajuda (# HELP) de uma métrica."""
+    _descricoes[nome] = descricao
+
+
+def incrementar(nome, rotulos=None, valor=1):
+    """Soma 'valor' a um contador."""
+    contadores = _dados_da_thread()['contadores']
+    chave = _chave(nome, rotulos)
+    contadores[chave] = contadores.get(chave, 0) + valor
+
+
+def observar(nome, rotulos, segundos):
+    """Registra uma duração (em segundos) em um histograma."""
+    histogramas = _dados_da_thread()['histogramas']
+    chave = _chave(nome, rotulos)
+    histograma = histogramas.get(chave)
+    if histograma is None:
+        histograma = histogramas[chave] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+    histograma[0][bisect.bisect_left(BUCKETS, segundos)] += 1
+    histograma[1] += segundos
+    histograma[2] += 1
+
+
+class cronometro:
+    """Gerenciador de contexto que mede o bloco e grava em um histograma."""
+
+    def __init__(self, nome, rotulos=None):
+        self.nome = nome
+        self.rotulos = rotulos
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        observar(self.nome, self.rotulos, time.perf_counter() - self.inicio)
+        return False
+
+
+def registrar_coletor(funcao):
+    """
+    Registra uma função chamada a cada leitura das métricas. Ela deve devolver
+    uma lista de tuplas (nome, rotulos, valor) com medições instantâneas.
+    """
+    _coletores.append(funcao)
+
+
+def _contar_linhas(resultado):
+    """Linhas de um resultado de consulta; None se o retorno não for uma consulta (ex: conexão)."""
+    if isinstance(resultado, list):
+        return len(resultado)
+    if resultado is None:
+        return 0
+    if isinstance(resultado, (sqlite3.Row, dict)):
+        return 1
+    return None
+
+
+def _instrumentar_funcao(funcao, nome_funcao):
+    rotulos = {'funcao': nome_funcao}
+
+    if inspect.isgeneratorfunction(funcao):
+        @functools.wraps(funcao)
+        def wrapper_gerador(*args, **kwargs):
+            inicio = time.perf_counter()
+            linhas = 0
+            try:
+                for item in funcao(*args, **kwargs):
+                    linhas += 1
+                    yield item
+            finally:
+                observar('db_funcao_duracao_segundos', rotulos, time.perf_counter() - inicio)
+                incrementar('db_linhas_total', rotulos, linhas)
+        wrapper_gerador.__instrumentado__ = True
+        return wrapper_gerador
+
+    @functools.wraps(funcao)
+    def wrapper(*args, **kwargs):
+        inicio = time.perf_counter()
+        try:
+            resultado = funcao(*args, **kwargs)
+        except Exception:
+            incrementar('db_erros_total', rotulos)
+            raise
+        finally:
+            observar('db_funcao_duracao_segundos', rotulos, time.perf_counter() - inicio)
+        linhas = _contar_linhas(resultado)
+        if linhas is not None:
+            incrementar('db_linhas_total', rotulos, linhas)
+        return resultado
+    wrapper.__instrumentado__ = True
+    return wrapper
+
+
+def instrumentar_modulo(modulo):
+    """
+    Substitui cada função pública definida em 'modulo' por uma versão que mede
+    tempo de execução e número de linhas retornadas. Pode ser chamada mais de uma vez.
+    """
+    for nome, objeto in list(vars(modulo).items()):
+        if (nome.startswith('_') or not inspect.isfunction(objeto)
+                or objeto.__module__ != modulo.__name__ or getattr(objeto, '__instrumentado__', False)):
+            continue
+        setattr(modulo, nome, _instrumentar_funcao(objeto, nome))
+
+
+def instrumentar_flask(app):
+    """Mede a latência de cada rota, por endpoint, método e status HTTP."""
+    from flask import g, request
+
+    @app.before_request
+    def _iniciar_cronometro():
+        g._metricas_inicio = time.perf_counter()
+
+    @app.after_request
+    def _registrar_requisicao(response):
+        inicio = g.pop('_metricas_inicio', None)
+        if inicio is not None:
+            observar('http_requisicao_duracao_segundos', {
+                'endpoint': request.endpoint or 'desconhecido',
+                'metodo': request.method,
+                'status': str(response.status_code),
+            }, time.perf_counter() - inicio)
+        return response
+
+
+def instantaneo():
+    """Combina os dados de todas as threads. Retorna (contadores, histogramas, medidas)."""
+    total = _novos_dados()
+    with _lock:
+        _recolher_threads_encerradas()
+        _mesclar(total, _acumulado)
+        for _thread, dados in _por_thread:
+            # Cópias rasas para evitar "dictionary changed size during iteration".
+            _mesclar(total, {'contadores': dict(dados['contadores']), 'histogramas': dict(dados['histogramas'])})
+    medidas = []
+    for coletor in list(_coletores):
+        try:
+            medidas.extend(coletor())
+        except Exception as e:
+            print(f"[METRICAS] Erro em coletor de métricas: {e}")
+    return total['contadores'], total['histogramas'], medidas
+
+
+def histograma(nome, rotulos=None):
+    """Retorna uma cópia (buckets, soma, contagem) de um histograma, ou None se não existir."""
+    _contadores, histogramas, _medidas = instantaneo()
+    dados = histogramas.get(_chave(nome, rotulos))
+    return (list(dados[0]), dados[1], dados[2]) if dados else None
+
+
+def _formatar_rotulos(rotulos, extra=None):
+    itens = list(rotulos) + ([extra] if extra else [])
+    if not itens:
+        return ''
+    partes = []
+    for chave, valor in itens:
+        valor = str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        partes.append(f'{chave}="{valor}"')
+    return '{' + ','.join(partes) + '}'
+
+
+def formato_prometheus():
+    """Exporta todas as métricas no formato de texto do Prometheus."""
+    contadores, histogramas, medidas = instantaneo()
+    linhas = []
+    tipos_emitidos = set()
+
+    def cabecalho(nome, tipo):
+        if nome in tipos_emitidos:
+            return
+        tipos_emitidos.add(nome)
+        if nome in _descricoes:
+            linhas.append(f"# HELP {nome} {_descricoes[nome]}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+
+    for (nome, rotulos), valor in sorted(contadores.items()):
+        cabecalho(nome, 'counter')
+        linhas.append(f"{nome}{_formatar_rotulos(rotulos)} {valor}")
+
+    for (nome, rotulos), (buckets, soma, contagem) in sorted(histogramas.items()):
+        cabecalho(nome, 'histogram')
+        acumulado = 0
+        for limite, n in zip(BUCKETS, buckets):
+            acumulado += n
+            linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, ('le', limite))} {acumulado}")
+        linhas.append(f"{nome}_bucket{_formatar_rotulos(rotulos, ('le', '+Inf'))} {contagem}")
+        linhas.append(f"{nome}_sum{_formatar_rotulos(rotulos)} {soma:.6f}")
+        linhas.append(f"{nome}_count{_formatar_rotulos(rotulos)} {contagem}")
+
+    for nome, rotulos, valor in medidas:
+        cabecalho(nome, 'gauge')
+        linhas.append(f"{nome}{_formatar_rotulos(_chave(nome, rotulos)[1])} {valor}")
+
+    return '\n'.join(linhas) + '\n'
+
+
+def percentil(buckets, contagem, fracao):
+    """Estimativa do percentil a partir dos intervalos do histograma (limite superior)."""
+    alvo = contagem * fracao
+    acumulado = 0
+    for limite, n in zip(BUCKETS + (float('inf'),), buckets):
+        acumulado += n
+        if acumulado >= alvo:
+            return limite
+    return float('inf')
+
+
+def resumo(limite=10):
+    """Texto curto com as medições mais custosas (maior tempo total)."""
+    _contadores, histogramas, _medidas = instantaneo()
+    ordenados = sorted(histogramas.items(), key=lambda item: item[1][1], reverse=True)[:limite]
+    linhas = ["[METRICAS] Resumo (tempo total, chamadas, média, p95):"]
+    for (nome, rotulos), (buckets, soma, contagem) in ordenados:
+        media_ms = soma / contagem * 1000 if contagem else 0
+        p95 = percentil(buckets, contagem, 0.95)
+        p95_txt = f"<= {p95 * 1000:.1f} ms" if p95 != float('inf') else f"> {BUCKETS[-1]} s"
+        rotulos_txt = ','.join(f"{k}={v}" for k, v in rotulos)
+        linhas.append(f"  {nome}[{rotulos_txt}] total={soma:.3f}s n={contagem} media={media_ms:.1f}ms p95{p95_txt}")
+    return '\n'.join(linhas)
+
+
+def iniciar_resumo_periodico(intervalo_segundos=300):
+    """Imprime o resumo das métricas periodicamente em uma thread daemon."""
+    def _loop():
+        while True:
+            time.sleep(intervalo_segundos)
+            print(resumo())
+
+    thread = threading.Thread(target=_loop, name='metricas-resumo', daemon=True)
+    thread.start()
+    return thread
+
+
+descrever('db_funcao_duracao_segundos', 'Tempo de execução das funções de database.py.')
+descrever('db_linhas_total', 'Linhas retornadas pelas funções de database.py.')
+descrever('db_erros_total', 'Exceções lançadas pelas funções de database.py.')
+descrever('http_requisicao_duracao_segundos', 'Latência das rotas Flask por endpoint, método e status.')
+descrever('scanner_etapa_duracao_segundos', 'Tempo de cada etapa do leitor de QR Code.')
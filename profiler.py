@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Profiler por amostragem, ligado sob demanda.
+
+Enquanto uma sessão está ativa, uma thread amostra as pilhas de execução de todas
+as threads do processo (threads do Flask, câmera, registro de presença...) em
+intervalos fixos, usando sys._current_frames(). Nada é instalado no código
+observado: com o profiler desligado não existe custo algum, e ligado o custo é
+apenas o da thread de amostragem.
+
+Ao final, são gravados em PASTA_PERFIS:
+- '<nome>.folded': pilhas no formato "collapsed" (uma linha por pilha, com a
+  contagem no final), com o nome da thread como primeiro quadro. Pode ser aberto
+  em ferramentas de flame graph (ex: speedscope.app, flamegraph.pl).
+- '<nome>.txt': resumo com amostras por thread e as funções mais frequentes.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+
+PASTA_PERFIS = Path("perfis")
+DURACAO_MAXIMA_SEGUNDOS = 300
+INTERVALO_PADRAO_MS = 10
+PROFUNDIDADE_MAXIMA = 64  # Quadros por pilha (os mais externos são descartados)
+
+_lock = threading.Lock()
+_sessao = None  # Dados da sessão ativa, ou None
+_ultimo_arquivo = None
+
+
+def _rotulo_quadro(frame):
+    code = frame.f_code
+    nome = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+    # ';' separa os quadros e o último espaço separa a contagem no formato collapsed.
+    return nome.replace(';', '_').replace(' ', '_')
+
+
+def _pilha(frame):
+    quadros = []
+    while frame is not None and len(quadros) < PROFUNDIDADE_MAXIMA:
+        quadros.append(_rotulo_quadro(frame))
+        frame = frame.f_back
+    quadros.reverse()
+    return ';'.join(quadros)
+
+
+def _amostrar(sessao):
+    """Loop da thread de amostragem."""
+    id_proprio = threading.get_ident()
+    nomes_threads = {}
+    proxima_atualizacao_nomes = 0.0
+    intervalo = sessao['intervalo_ms'] / 1000
+
+    while not sessao['parar'].is_set() and time.monotonic() < sessao['termina_em']:
+        agora = time.monotonic()
+        if agora >= proxima_atualizacao_nomes:
+            nomes_threads = {t.ident: t.name.replace(' ', '_') for t in threading.enumerate()}
+            proxima_atualizacao_nomes = agora + 1.0
+
+        for ident, frame in sys._current_frames().items():
+            if ident == id_proprio:
+                continue
+            nome_thread = nomes_threads.get(ident, f"thread-{ident}")
+            sessao['pilhas'][(nome_thread, _pilha(frame))] += 1
+        sessao['amostras'] += 1
+        sessao['parar'].wait(intervalo)
+
+    _gravar(sessao)
+
+
+def _gravar(sessao):
+    global _sessao, _ultimo_arquivo
+    pilhas = sessao['pilhas']
+    base = sessao['arquivo']
+    try:
+        base.parent.mkdir(parents=True, exist_ok=True)
+        with open(base.with_suffix('.folded'), 'w', encoding='utf-8') as f:
+            for (nome_thread, pilha), contagem in pilhas.most_common():
+                f.write(f"{nome_thread};{pilha} {contagem}\n")
+
+        por_thread = Counter()
+        funcoes = Counter()  # Amostras em que a função estava no topo da pilha
+        for (nome_thread, pilha), contagem in pilhas.items():
+            por_thread[nome_thread] += contagem
+            funcoes[pilha.rsplit(';', 1)[-1]] += contagem
+        total = sum(por_thread.values()) or 1
+
+        with open(base.with_suffix('.txt'), 'w', encoding='utf-8') as f:
+            duracao = time.monotonic() - sessao['inicio']
+            f.write(f"Perfil gerado em {datetime.now():%Y-%m-%d %H:%M:%S}\n")
+            f.write(f"Duração: {duracao:.1f} s | Intervalo: {sessao['intervalo_ms']} ms | "
+                    f"Rodadas de amostragem: {sessao['amostras']}\n\n")
+            f.write("Amostras por thread:\n")
+            for nome_thread, contagem in por_thread.most_common():
+                f.write(f"  {contagem:8d}  {contagem / total:6.1%}  {nome_thread}\n")
+            f.write("\nFunções mais frequentes no topo da pilha:\n")
+            for funcao, contagem in funcoes.most_common(30):
+                f.write(f"  {contagem:8d}  {contagem / total:6.1%}  {funcao}\n")
+        print(f"[PROFILER] Perfil gravado em {base.with_suffix('.folded')}")
+    except OSError as e:
+        print(f"[PROFILER] Não foi possível gravar o perfil. Erro: {e}")
+    finally:
+        with _lock:
+            _ultimo_arquivo = str(base.with_suffix('.folded'))
+            _sessao = None
+
+
+def iniciar(segundos=30, intervalo_ms=INTERVALO_PADRAO_MS):
+    """
+    Inicia uma sessão de amostragem de 'segundos' (limitado a DURACAO_MAXIMA_SEGUNDOS).
+    Retorna o caminho do arquivo .folded que será gravado ao final.
+    Lança RuntimeError se já houver uma sessão ativa.
+    """
+    global _sessao
+    segundos = max(1, min(int(segundos), DURACAO_MAXIMA_SEGUNDOS))
+    intervalo_ms = max(1, int(intervalo_ms))
+    with _lock:
+        if _sessao is not None:
+            raise RuntimeError("Já existe uma sessão do profiler em andamento.")
+        agora = time.monotonic()
+        _sessao = {
+            'inicio': agora,
+            'termina_em': agora + segundos,
+            'intervalo_ms': intervalo_ms,
+            'amostras': 0,
+            'pilhas': Counter(),
+            'parar': threading.Event(),
+            'arquivo': PASTA_PERFIS / f"perfil_{datetime.now():%Y%m%d_%H%M%S}",
+        }
+        sessao = _sessao
+    threading.Thread(target=_amostrar, args=(sessao,), name='profiler', daemon=True).start()
+    print(f"[PROFILER] Amostragem iniciada por {segundos} s (intervalo de {intervalo_ms} ms).")
+    return str(sessao['arquivo'].with_suffix('.folded'))
+
+
+def parar():
+    """Encerra antecipadamente a sessão ativa (o perfil parcial é gravado)."""
+    with _lock:
+        if _sessao is not None:
+            _sessao['parar'].set()
+
+
+def estado():
+    """Retorna se há uma sessão ativa, quanto falta para terminar e o último arquivo gravado."""
+    with _lock:
+        if _sessao is None:
+            return {'ativo': False, 'ultimo_arquivo': _ultimo_arquivo}
+        return {
+            'ativo': True,
+            'segundos_restantes': round(max(0.0, _sessao['termina_em'] - time.monotonic()), 1),
+            'arquivo': str(_sessao['arquivo'].with_suffix('.folded')),
+            'ultimo_arquivo': _ultimo_arquivo,
+        }
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Regras de horário por turma e dia da semana.
+
+Cada regra define o horário de entrada, o de saída e a tolerância (em minutos)
+de uma turma em um dia da semana (0 = segunda ... 6 = domingo). O código de turma
+'*' vale para todas as turmas e o dia -1 vale para todos os dias. Na falta de
+regra, valem as constantes HORA_ENTRADA_PADRAO, HORA_SAIDA_PADRAO e
+TOLERANCIA_MINUTOS do database.py.
+
+As regras são lidas do banco e compiladas em uma tabela de consulta
+(turma, dia da semana) -> janela uma vez por dia, ou quando são alteradas. Toda
+avaliação de horário passa por este módulo:
+- avaliar_leitura(): decide se uma leitura de QR Code é entrada ou saída
+  (usada por add_attendance_record). Entre o fim da tolerância de entrada e o
+  início da janela de saída, a primeira leitura do dia é uma entrada com
+  atraso e uma leitura depois da entrada é uma saída antecipada;
+- status_presenca(), e_atraso() e e_saida_antecipada(): registradas como
+  funções SQL em cada conexão (veja database.get_db_connection), usadas pelo
+  dashboard, pela exportação e pelos agregados do analytics;
+- janelas_por_turma(): a tabela compilada, para cálculos vetoriais (relatórios).
+
+Quando as regras mudam, recalcular_historico() refaz os agregados históricos.
+"""
+
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+import database as db
+
+TODAS_TURMAS = '*'
+TODOS_OS_DIAS = -1
+
+# Horários no formato 'HH:MM:SS', comparáveis diretamente com TIME(timestamp).
+Janela = namedtuple('Janela', ['hora_entrada', 'hora_saida', 'fim_entrada', 'inicio_saida'])
+
+_lock = threading.Lock()
+_estado = {'dia': None, 'regras': {}, 'janelas': {}}
+
+
+def _formatar(hora):
+    return hora.strftime('%H:%M:%S')
+
+
+def _compilar_janela(hora_entrada, hora_saida, tolerancia):
+    base = date.today()
+    return Janela(
+        _formatar(hora_entrada),
+        _formatar(hora_saida),
+        _formatar((datetime.combine(base, hora_entrada) + tolerancia).time()),
+        _formatar((datetime.combine(base, hora_saida) - tolerancia).time()),
+    )
+
+
+def _carregar():
+    """Lê as regras do banco e descarta a tabela compilada. Chamar com _lock."""
+    regras = {}
+    conn = db.get_db_connection()
+    try:
+        for row in conn.execute("SELECT * FROM regras_horario"):
+            regras[(row['codigo_turma'], row['dia_semana'])] = _compilar_janela(
+                datetime.strptime(row['hora_entrada'], '%H:%M').time(),
+                datetime.strptime(row['hora_saida'], '%H:%M').time(),
+                timedelta(minutes=row['tolerancia_minutos']),
+            )
+    except sqlite3.OperationalError:
+        pass  # Tabela ainda não criada (init_db não executado): valem os horários padrão.
+    finally:
+        conn.close()
+    _estado['regras'] = regras
+    _estado['janelas'] = {}
+    _estado['dia'] = date.today()
+
+
+def invalidar():
+    """Força a releitura das regras na próxima avaliação (e a recarga dos contadores do dia)."""
+    import contadores  # Importado aqui: depende deste módulo.
+    with _lock:
+        _estado['dia'] = None
+    contadores.invalidar()
+
+
+def janela(codigo_turma, dia_semana):
+    """Retorna a Janela de horários da turma no dia da semana (0 = segunda)."""
+    janelas = _estado['janelas']
+    if _estado['dia'] != date.today():
+        with _lock:
+            if _estado['dia'] != date.today():
+                _carregar()
+            janelas = _estado['janelas']
+    chave = (codigo_turma, dia_semana)
+    resultado = janelas.get(chave)
+    if resultado is None:
+        regras = _estado['regras']
+        for candidata in ((codigo_turma, dia_semana), (codigo_turma, TODOS_OS_DIAS),
+                          (TODAS_TURMAS, dia_semana), (TODAS_TURMAS, TODOS_OS_DIAS)):
+            if candidata in regras:
+                resultado = regras[candidata]
+                break
+        else:
+            resultado = _compilar_janela(db.HORA_ENTRADA_PADRAO, db.HORA_SAIDA_PADRAO, db.TOLERANCIA_MINUTOS)
+        janelas[chave] = resultado
+    return resultado
+
+
+@lru_cache(maxsize=512)
+def _dia_semana(data_iso):
+    return date.fromisoformat(data_iso).weekday()
+
+
+def _janela_do_registro(codigo_turma, timestamp):
+    """Janela aplicável a um timestamp ('AAAA-MM-DD HH:MM:SS...') e o horário 'HH:MM:SS' dele."""
+    texto = str(timestamp)
+    return janela(codigo_turma, _dia_semana(texto[:10])), texto[11:19]
+
+
+def avaliar_leitura(codigo_turma, instante, entrada_anterior=None):
+    """
+    Decide o tipo de uma leitura de QR Code feita em 'instante' (datetime).
+    'entrada_anterior' é a entrada do aluno no mesmo dia, se houver: entre as
+    janelas, ela separa a entrada com atraso da saída antecipada.
+    Retorna (tipo_registro, status_detalhado), coerentes com e_atraso e e_saida_antecipada.
+    """
+    regra = janela(codigo_turma, instante.weekday())
+    hora = _formatar(instante.time())
+    if hora < regra.fim_entrada:
+        return 'entrada', "Entrada no horário"
+    if hora >= regra.inicio_saida:
+        return 'saida', "Saída no horário"
+    if entrada_anterior is None:
+        return 'entrada', "Entrada com atraso"
+    return 'saida', "Saída antecipada"
+
+
+def e_atraso(codigo_turma, timestamp_entrada):
+    """1 se a entrada foi no fim da tolerância ou depois; 0 caso contrário (ou sem entrada)."""
+    if timestamp_entrada is None:
+        return 0
+    regra, hora = _janela_do_registro(codigo_turma, timestamp_entrada)
+    return int(hora >= regra.fim_entrada)
+
+
+def e_saida_antecipada(codigo_turma, timestamp_saida):
+    """1 se a saída foi antes do início da janela de saída; 0 caso contrário (ou sem saída)."""
+    if timestamp_saida is None:
+        return 0
+    regra, hora = _janela_do_registro(codigo_turma, timestamp_saida)
+    return int(hora < regra.inicio_saida)
+
+
+def status_presenca(codigo_turma, timestamp_entrada, timestamp_saida):
+    """Status do dia (um dos valores de database.STATUS_PRESENCA) a partir da entrada e da saída."""
+    if timestamp_entrada is None:
+        return 'Ausente'
+    if timestamp_saida is None:
+        return 'Apenas Entrada'
+    if e_saida_antecipada(codigo_turma, timestamp_saida):
+        return 'Saída Antecipada'
+    if e_atraso(codigo_turma, timestamp_entrada):
+        return 'Atraso'
+    return 'Presente'
+
+
+def registrar_funcoes(conn):
+    """
+    Registra as funções de avaliação como funções SQL na conexão. Elas não são
+    marcadas como determinísticas: o resultado depende das regras em vigor, que
+    mudam com definir_regra(), então não podem ser usadas em índices nem em
+    colunas geradas.
+    """
+    conn.create_function('status_presenca', 3, status_presenca)
+    conn.create_function('regra_atraso', 2, e_atraso)
+    conn.create_function('regra_saida_antecipada', 2, e_saida_antecipada)
+
+
+def janelas_por_turma(codigos_turma):
+    """
+    Tabela compilada para cálculos vetoriais: lista de dicionários com
+    codigo_turma, dia_semana, fim_entrada e inicio_saida (strings 'HH:MM:SS').
+    """
+    return [
+        {'codigo_turma': codigo, 'dia_semana': dia,
+         'fim_entrada': janela(codigo, dia).fim_entrada, 'inicio_saida': janela(codigo, dia).inicio_saida}
+        for codigo in codigos_turma for dia in range(7)
+    ]
+
+
+def listar_regras():
+    """Retorna as regras cadastradas."""
+    conn = db.get_db_connection()
+    regras = conn.execute("SELECT * FROM regras_horario ORDER BY codigo_turma, dia_semana").fetchall()
+    conn.close()
+    return [dict(row) for row in regras]
+
+
+def definir_regra(codigo_turma, dia_semana, hora_entrada, hora_saida, tolerancia_minutos):
+    """
+    Cria ou substitui a regra de uma turma ('*' para todas) em um dia da semana
+    (0 = segunda ... 6 = domingo, -1 para todos). Horários no formato 'HH:MM'.
+    Lança ValueError se os valores forem inválidos.
+    """
+    dia_semana = int(dia_semana)
+    tolerancia_minutos = int(tolerancia_minutos)
+    if not codigo_turma:
+        raise ValueError("Informe o código da turma (ou '*' para todas).")
+    if dia_semana not in range(TODOS_OS_DIAS, 7):
+        raise ValueError("Dia da semana inválido. Use 0 (segunda) a 6 (domingo), ou -1 para todos.")
+    entrada = datetime.strptime(hora_entrada, '%H:%M')
+    saida = datetime.strptime(hora_saida, '%H:%M')
+    if not 0 <= tolerancia_minutos < 180:
+        raise ValueError("Tolerância inválida.")
+    if entrada + timedelta(minutes=tolerancia_minutos) >= saida - timedelta(minutes=tolerancia_minutos):
+        raise ValueError("As janelas de entrada e saída se sobrepõem.")
+
+    conn = db.get_db_connection()
+    conn.execute(
+        "INSERT OR REPLACE INTO regras_horario (codigo_turma, dia_semana, hora_entrada, hora_saida, tolerancia_minutos) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (str(codigo_turma), dia_semana, entrada.strftime('%H:%M'), saida.strftime('%H:%M'), tolerancia_minutos)
+    )
+    conn.commit()
+    conn.close()
+    invalidar()
+
+
+def remover_regra(codigo_turma, dia_semana):
+    """Remove uma regra. Retorna True se ela existia."""
+    conn = db.get_db_connection()
+    cursor = conn.execute(
+        "DELETE FROM regras_horario WHERE codigo_turma = ? AND dia_semana = ?", (str(codigo_turma), int(dia_semana))
+    )
+    conn.commit()
+    conn.close()
+    invalidar()
+    return cursor.rowcount > 0
+
+
+def recalcular_historico():
+    """
+    Refaz os agregados e os dias fechados (veja fechamento.py) de todo o histórico
+    não arquivado com as regras atuais. O recálculo é feito em SQL, um dia
+    inteiro por comando. Retorna o número de dias dos agregados.
+    """
+    import analytics  # Importados aqui: dependem do database, que depende deste módulo.
+    import fechamento
+    invalidar()
+    fechamento.refazer_fechados()
+    return len(analytics.atualizar_agregados(recalcular_tudo=True))
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gerencia as regras de horário por turma.")
+    parser.add_argument("--turma", help="Código da turma ('*' para todas).")
+    parser.add_argument("--dia", type=int, default=TODOS_OS_DIAS, help="0 = segunda ... 6 = domingo; -1 = todos.")
+    parser.add_argument("--entrada", help="Horário de entrada (HH:MM).")
+    parser.add_argument("--saida", help="Horário de saída (HH:MM).")
+    parser.add_argument("--tolerancia", type=int, default=20, help="Tolerância em minutos.")
+    parser.add_argument("--remover", action="store_true", help="Remove a regra da turma/dia informados.")
+    parser.add_argument("--recalcular", action="store_true", help="Refaz os agregados históricos.")
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.turma and args.remover:
+        remover_regra(args.turma, args.dia)
+    elif args.turma:
+        definir_regra(args.turma, args.dia, args.entrada, args.saida, args.tolerancia)
+    if args.recalcular or args.turma:
+        print(f"Agregados recalculados para {recalcular_historico()} dias.")
+    for regra in listar_regras():
+        print(regra)
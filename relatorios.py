@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+"""
+Motor de relatórios de fim de período (bimestre, semestre, ano letivo).
+
+Os registros de 'presenca' são lidos em blocos com 'read_sql_query' e reduzidos
+bloco a bloco para um registro por aluno/dia, de modo que a memória usada
+depende do número de alunos e de dias letivos, e não do número de leituras.
+Todos os cálculos são feitos com operações vetorizadas (groupby/pivot) do pandas.
+
+Uso pela linha de comando:
+    python relatorios.py --de 2026-02-01 --ate 2026-12-15 --formato xlsx --saida relatorios
+"""
+
+import argparse
+import io
+import zipfile
+from importlib.util import find_spec
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import pandas as pd
+
+import database as db
+import fechamento
+import regras_horario
+
+# Quantidade de linhas de 'presenca' lidas por vez do banco de dados.
+TAMANHO_BLOCO = 50_000
+
+# O Parquet é opcional: só é oferecido se o pandas tiver um motor (pyarrow ou fastparquet) instalado.
+MOTOR_PARQUET = next((motor for motor in ('pyarrow', 'fastparquet') if find_spec(motor)), None)
+MENSAGEM_SEM_PARQUET = "O formato 'parquet' requer o pacote 'pyarrow' ou 'fastparquet', que não está instalado."
+
+FORMATOS = ('xlsx', 'csv', 'parquet') if MOTOR_PARQUET else ('xlsx', 'csv')
+
+DIAS_SEMANA = ['Segunda', 'Terça', 'Quarta', 'Quinta', 'Sexta', 'Sábado', 'Domingo']
+
+# Faixas (em minutos após o fim da tolerância de entrada) para a distribuição de atrasos.
+FAIXAS_ATRASO = [0, 5, 15, 30, 60, float('inf')]
+ROTULOS_ATRASO = ['até 5 min', '5-15 min', '15-30 min', '30-60 min', 'mais de 60 min']
+
+
+def _carregar_alunos(conn):
+    """Carrega a tabela de alunos com tipos compactos."""
+    alunos = pd.read_sql_query(
+        "SELECT id AS aluno_id, ra, nome, COALESCE(codigo_turma, '') AS codigo_turma FROM alunos",
+        conn,
+        dtype={'aluno_id': 'int64', 'ra': 'string', 'nome': 'string', 'codigo_turma': 'category'},
+    )
+    return alunos.set_index('aluno_id')
+
+
+def _carregar_dias_fechados(conn, inicio, fim):
+    """
+    Lê os dias já fechados (tabela 'presenca_diaria', veja fechamento.py) no
+    mesmo formato de _carregar_registros_diarios, sem reprocessar as leituras.
+    """
+    diarios = pd.read_sql_query(
+        "SELECT aluno_id, dia, entrada, saida FROM presenca_diaria "
+        "WHERE dia BETWEEN ? AND ? AND (entrada IS NOT NULL OR saida IS NOT NULL)",
+        conn, params=(inicio.isoformat(), fim.isoformat()),
+        dtype={'aluno_id': 'int64', 'dia': 'string', 'entrada': 'string', 'saida': 'string'},
+    )
+    diarios['dia'] = pd.to_datetime(diarios['dia'])
+    for coluna in ('entrada', 'saida'):
+        diarios[coluna] = diarios['dia'] + pd.to_timedelta(diarios[coluna])
+    return diarios.astype({'dia': 'datetime64[ns]', 'entrada': 'datetime64[ns]', 'saida': 'datetime64[ns]'})
+
+
+def _carregar_registros_diarios(conn, inicio, fim):
+    """
+    Lê os registros de presença do intervalo em blocos e devolve um DataFrame com
+    um registro por (aluno_id, dia), com as colunas 'entrada' e 'saida' contendo
+    o último horário de cada tipo no dia. Os dias já fechados são lidos da tabela
+    'presenca_diaria'; só os demais são calculados a partir das leituras.
+    """
+    fechado_ate = fechamento.ultimo_dia_finalizado()
+    fechado_desde = conn.execute("SELECT MIN(dia) FROM presenca_diaria").fetchone()[0]
+    if fechado_ate is None or fechado_desde is None:
+        return _reduzir_leituras(conn, inicio, fim)
+    fechado_desde = date.fromisoformat(fechado_desde)
+    partes = []
+    if inicio < fechado_desde:
+        partes.append(_reduzir_leituras(conn, inicio, min(fim, fechado_desde - timedelta(days=1))))
+    if inicio <= fechado_ate and fim >= fechado_desde:
+        partes.append(_carregar_dias_fechados(conn, max(inicio, fechado_desde), min(fim, fechado_ate)))
+    if fim > fechado_ate:
+        partes.append(_reduzir_leituras(conn, max(inicio, fechado_ate + timedelta(days=1)), fim))
+    return pd.concat(partes, ignore_index=True) if len(partes) > 1 else partes[0]
+
+
+def _reduzir_leituras(conn, inicio, fim):
+    """Reduz as leituras de 'presenca' do intervalo a um registro por (aluno_id, dia)."""
+    # Períodos já arquivados são lidos dos arquivos anexados (veja arquivamento.py).
+    query = f"""
+        SELECT aluno_id, timestamp, tipo_registro FROM {db.sql_presenca_com_arquivo(conn, inicio, fim)}
+        WHERE timestamp >= ? AND timestamp < ?
+    """
+    params = (inicio.isoformat(), (fim + timedelta(days=1)).isoformat())
+    reduzidos = []
+    for bloco in pd.read_sql_query(
+        query, conn, params=params, chunksize=TAMANHO_BLOCO,
+        dtype={'aluno_id': 'int64', 'timestamp': 'string', 'tipo_registro': 'category'},
+    ):
+        bloco['timestamp'] = pd.to_datetime(bloco['timestamp'], format='ISO8601')
+        bloco['dia'] = bloco['timestamp'].dt.normalize()
+        reduzidos.append(
+            bloco.groupby(['aluno_id', 'dia', 'tipo_registro'], observed=True)['timestamp'].max()
+        )
+
+    if not reduzidos:
+        return pd.DataFrame(
+            columns=['aluno_id', 'dia', 'entrada', 'saida']
+        ).astype({'aluno_id': 'int64', 'dia': 'datetime64[ns]', 'entrada': 'datetime64[ns]', 'saida': 'datetime64[ns]'})
+
+    # Um mesmo aluno/dia pode aparecer em dois blocos; uma segunda redução resolve isso.
+    serie = pd.concat(reduzidos)
+    serie = serie.groupby(level=['aluno_id', 'dia', 'tipo_registro'], observed=True).max()
+    diarios = serie.unstack('tipo_registro')
+    for coluna in ('entrada', 'saida'):
+        if coluna not in diarios.columns:
+            diarios[coluna] = pd.NaT
+    return diarios[['entrada', 'saida']].reset_index()
+
+
+def _classificar(diarios, alunos):
+    """
+    Acrescenta as colunas booleanas de presença, atraso e saída antecipada, com
+    os horários de cada turma e dia da semana (tabela compilada de regras_horario).
+    """
+    janelas = pd.DataFrame(regras_horario.janelas_por_turma(alunos['codigo_turma'].dropna().unique()))
+    if janelas.empty:
+        janelas = pd.DataFrame(columns=['codigo_turma', 'dia_semana', 'fim_entrada', 'inicio_saida'])
+    janelas['fim_entrada'] = pd.to_timedelta(janelas['fim_entrada'])
+    janelas['inicio_saida'] = pd.to_timedelta(janelas['inicio_saida'])
+
+    chaves = pd.DataFrame({
+        'codigo_turma': diarios['aluno_id'].map(alunos['codigo_turma']).astype('object'),
+        'dia_semana': diarios['dia'].dt.dayofweek,
+    })
+    limites = chaves.merge(janelas, on=['codigo_turma', 'dia_semana'], how='left')
+    padrao = regras_horario.janela(None, 0)
+    fim_entrada = limites['fim_entrada'].fillna(pd.to_timedelta(padrao.fim_entrada)).to_numpy()
+    inicio_saida = limites['inicio_saida'].fillna(pd.to_timedelta(padrao.inicio_saida)).to_numpy()
+
+    diarios['presente'] = diarios['entrada'].notna()
+    diarios['minutos_atraso'] = (
+        (diarios['entrada'] - diarios['dia'] - fim_entrada).dt.total_seconds() / 60
+    )
+    diarios['atraso'] = diarios['minutos_atraso'] > 0
+    diarios['saida_antecipada'] = (diarios['saida'] - diarios['dia']) < inicio_saida
+    return diarios
+
+
+def relatorio_frequencia(alunos, diarios, dias_letivos):
+    """Percentual de presença por aluno, agrupado por turma."""
+    totais = diarios.groupby('aluno_id')[['presente', 'atraso', 'saida_antecipada']].sum()
+    relatorio = alunos.join(totais, how='left').fillna(
+        {'presente': 0, 'atraso': 0, 'saida_antecipada': 0}
+    )
+    total_dias = len(dias_letivos)
+    relatorio['dias_letivos'] = total_dias
+    relatorio['ausencias'] = total_dias - relatorio['presente']
+    relatorio['percentual_presenca'] = (
+        (relatorio['presente'] / total_dias * 100).round(1) if total_dias else 0.0
+    )
+    relatorio = relatorio.astype({'presente': 'int64', 'atraso': 'int64', 'saida_antecipada': 'int64'})
+    return relatorio.reset_index().sort_values(['codigo_turma', 'nome'])[
+        ['codigo_turma', 'ra', 'nome', 'dias_letivos', 'presente', 'ausencias',
+         'atraso', 'saida_antecipada', 'percentual_presenca']
+    ]
+
+
+def relatorio_ausencias_dia_semana(alunos, diarios, dias_letivos):
+    """Número de ausências por turma e dia da semana."""
+    alunos_por_turma = alunos.groupby('codigo_turma', observed=True).size()
+    dias_por_semana = pd.Series(dias_letivos.dayofweek).value_counts()
+    # Ausências esperadas se ninguém viesse: alunos da turma x dias letivos daquele dia da semana.
+    esperado = pd.DataFrame(
+        alunos_por_turma.to_numpy()[:, None] * dias_por_semana.reindex(range(7), fill_value=0).to_numpy()[None, :],
+        index=alunos_por_turma.index, columns=range(7),
+    )
+    presencas = diarios[diarios['presente']].join(alunos['codigo_turma'], on='aluno_id')
+    presencas = pd.crosstab(presencas['codigo_turma'], presencas['dia'].dt.dayofweek)
+    presencas = presencas.reindex(index=esperado.index, columns=range(7), fill_value=0)
+    relatorio = esperado - presencas
+    relatorio.columns = DIAS_SEMANA
+    # Remove os dias da semana sem nenhum dia letivo (normalmente o fim de semana).
+    relatorio = relatorio.loc[:, dias_por_semana.reindex(range(7), fill_value=0).to_numpy() > 0]
+    return relatorio.reset_index()
+
+
+def relatorio_distribuicao_atrasos(alunos, diarios):
+    """Distribuição dos atrasos por faixa de minutos, por turma."""
+    atrasos = diarios[diarios['atraso']].join(alunos['codigo_turma'], on='aluno_id')
+    faixas = pd.cut(atrasos['minutos_atraso'], bins=FAIXAS_ATRASO, labels=ROTULOS_ATRASO)
+    relatorio = pd.crosstab(atrasos['codigo_turma'], faixas, dropna=False)
+    relatorio = relatorio.reindex(columns=ROTULOS_ATRASO, fill_value=0)
+    relatorio.columns = pd.Index(relatorio.columns.astype(str), name=None)
+    return relatorio.reset_index()
+
+
+def gerar_relatorios(inicio, fim):
+    """
+    Gera todos os relatórios do intervalo [inicio, fim].
+    Retorna um dicionário {nome_do_relatorio: DataFrame}.
+    """
+    conn = db.get_db_connection()
+    try:
+        alunos = _carregar_alunos(conn)
+        diarios = _classificar(_carregar_registros_diarios(conn, inicio, fim), alunos)
+    finally:
+        conn.close()
+
+    dias_letivos = pd.DatetimeIndex(diarios['dia'].unique()).sort_values()
+    return {
+        'frequencia': relatorio_frequencia(alunos, diarios, dias_letivos),
+        'ausencias_dia_semana': relatorio_ausencias_dia_semana(alunos, diarios, dias_letivos),
+        'distribuicao_atrasos': relatorio_distribuicao_atrasos(alunos, diarios),
+    }
+
+
+def exportar(relatorios, formato, destino):
+    """
+    Grava os relatórios no formato pedido.
+    'destino' pode ser um diretório (CLI) ou um objeto binário como io.BytesIO (endpoint web).
+    XLSX gera uma planilha com uma aba por relatório; CSV e Parquet geram um arquivo
+    por relatório (dentro de um .zip quando o destino é um objeto em memória).
+    """
+    if formato == 'parquet' and not MOTOR_PARQUET:
+        raise ValueError(MENSAGEM_SEM_PARQUET)
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato}")
+
+    if formato == 'xlsx':
+        if isinstance(destino, (str, Path)):
+            Path(destino).mkdir(parents=True, exist_ok=True)
+            destino = Path(destino) / 'relatorios.xlsx'
+        with pd.ExcelWriter(destino) as writer:
+            for nome, df in relatorios.items():
+                df.to_excel(writer, sheet_name=nome[:31], index=False)
+        return
+
+    def _gravar(df, alvo):
+        if formato == 'csv':
+            df.to_csv(alvo, index=False, encoding='utf-8-sig')
+        else:
+            df.to_parquet(alvo, index=False, engine=MOTOR_PARQUET)
+
+    if isinstance(destino, (str, Path)):
+        Path(destino).mkdir(parents=True, exist_ok=True)
+        for nome, df in relatorios.items():
+            _gravar(df, Path(destino) / f"{nome}.{formato}")
+        return
+
+    with zipfile.ZipFile(destino, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        for nome, df in relatorios.items():
+            buffer = io.BytesIO()
+            _gravar(df, buffer)
+            zf.writestr(f"{nome}.{formato}", buffer.getvalue())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Gera os relatórios de presença de um período.")
+    parser.add_argument("--de", required=True, type=date.fromisoformat, help="Data inicial (AAAA-MM-DD).")
+    parser.add_argument("--ate", required=True, type=date.fromisoformat, help="Data final (AAAA-MM-DD).")
+    parser.add_argument("--formato", choices=FORMATOS, default='xlsx', help="Formato de saída.")
+    parser.add_argument("--saida", default='relatorios', help="Diretório onde os arquivos serão gravados.")
+    args = parser.parse_args()
+
+    relatorios = gerar_relatorios(args.de, args.ate)
+    exportar(relatorios, args.formato, args.saida)
+    print(f"Relatórios gravados em '{args.saida}' ({args.formato}).")
@@ -8,12 +8,11 @@ para a feira de profissões.
 """
 
 import threading
+import multiprocessing
 import os
 import sys
-import json
 import webbrowser
 import time
-from pathlib import Path
 import database as db # Importa o módulo de banco de dados
 
 # Adiciona o diretório do projeto ao sys.path
@@ -24,72 +23,18 @@ try:
     from desktop.main import start_desktop_app
     from web.app import start_web_server
     from database import init_db
+    from catalogo_turmas import catalogo
+    import metricas
+    import backup
+    import sincronizacao
+    import jobs
+    import importacao
+    import fechamento
+    import analytics
 except ImportError as e:
     print(f"Erro de importação: {e}")
     sys.exit(1)
 
-def populate_students_if_empty():
-    """
-    Verifica se a tabela de alunos está vazia e, se estiver, popula-a
-    a partir dos arquivos JSON na pasta 'data'.
-    """
-    conn = db.get_db_connection()
-    cursor = conn.cursor()
-    cursor.execute("SELECT COUNT(*) FROM alunos")
-    student_count = cursor.fetchone()[0]
-    conn.close()
-
-    if student_count > 0:
-        print(f"Banco de dados já contém {student_count} alunos. Nenhum aluno importado.")
-        return
-
-    print("Tabela 'alunos' está vazia. Iniciando importação a partir de arquivos JSON...")
-    
-    data_dir = Path("data")
-    if not data_dir.exists():
-        print("Erro: Pasta 'data' não encontrada. Não é possível importar alunos.")
-        return
-
-    imported_count = 0
-    errors = []
-
-    for json_file in data_dir.glob("*.json"):
-        if json_file.name == "turmas-com-disciplinas.json":
-            continue
-
-        codigo_turma_from_file = json_file.stem
-        try:
-            with open(json_file, 'r', encoding='utf-8') as f:
-                students_data = json.load(f)
-            
-            for student_data in students_data:
-                nome = student_data.get('nome')
-                ra = str(student_data.get('ra'))
-                inep = str(student_data.get('inep')) if student_data.get('inep') else None
-
-                if not nome or not ra:
-                    errors.append(f"Dados incompletos no arquivo {json_file.name}")
-                    continue
-                
-                # Adiciona o aluno à tabela 'alunos'
-                student_id = db.add_student(ra, nome, codigo_turma_from_file, inep=inep)
-                # Cria também um usuário para o aluno poder logar, com o RA como senha padrão
-                db.add_user(ra, ra, "aluno")
-                imported_count += 1
-
-        except json.JSONDecodeError:
-            errors.append(f"Erro de JSON em {json_file.name}.")
-        except Exception as e:
-            errors.append(f"Erro ao processar {json_file.name}: {e}")
-    
-    if errors:
-        print(f"Importação concluída com {len(errors)} erros.")
-        for err in errors:
-            print(f" - {err}")
-    
-    print(f"Importação concluída. {imported_count} alunos foram adicionados ao banco de dados.")
-
-
 def run_web_server():
     """Função alvo para a thread do servidor web."""
     print("Iniciando a thread do servidor web...")
@@ -101,20 +46,55 @@ def run_desktop_app():
     start_desktop_app()
 
 if __name__ == "__main__":
+    # Necessário para o pool de processos do login (web/auth.py) no executável do PyInstaller.
+    multiprocessing.freeze_support()
     print("Lançador principal iniciado.")
     
     # Inicializa o banco de dados (cria tabelas se não existirem)
     init_db()
+
+    # Carrega o catálogo de turmas e o grava na tabela 'turmas'
+    catalogo.recarregar(forcar=True)
     
-    # Popula o banco de dados com alunos se estiver vazio
-    populate_students_if_empty()
+    # Importa as alterações dos arquivos de turmas da pasta 'data' e passa a verificá-la a cada minuto
+    if importacao.PASTA_DADOS.exists():
+        try:
+            resultado = importacao.sincronizar_pasta()
+            print(f"Pasta 'data' sincronizada: {resultado['alterados']} arquivo(s) alterado(s), {resultado['inseridos']} "
+                  f"alunos novos, {resultado['atualizados']} atualizados.")
+            for erro in resultado['erros']:
+                print(f" - {erro}")
+        except Exception as e:
+            # Um arquivo de turma com problema não pode impedir a aplicação de iniciar.
+            print(f"[IMPORTACAO] Erro ao sincronizar a pasta 'data': {e}")
+        importacao.iniciar_monitoramento()
+    else:
+        print("Erro: Pasta 'data' não encontrada. Não é possível importar alunos.")
     
+    # Imprime periodicamente um resumo das métricas (tempo das consultas, rotas e leitor de QR Code)
+    metricas.iniciar_resumo_periodico()
+
+    # Cria uma cópia de segurança do banco a cada hora, sem parar o leitor de QR Code
+    backup.iniciar_agendador()
+
+    # Retoma as tarefas em segundo plano que ficaram na fila (ex: repopulação de alunos)
+    jobs.iniciar_worker()
+
+    # Fecha o status de presença de cada dia encerrado (inclusive os dias perdidos com o computador desligado)
+    fechamento.iniciar_agendador()
+
+    # Atualiza os agregados históricos de /api/stats a cada minuto, fora das requisições
+    analytics.iniciar_agendador()
+
+    # Envia as leituras desta estação para a central, se PRESENCA_SYNC_URL estiver definido
+    sincronizacao.iniciar_agente()
+
     # Configura e inicia o servidor web em uma thread separada
     web_thread = threading.Thread(target=run_web_server, daemon=True)
     web_thread.start()
     
     # Aguarda um momento para o servidor web iniciar e abre o navegador na página inicial.
-    web_url = "http://127.0.0.1:5000"
+    web_url = f"http://127.0.0.1:{os.environ.get('PRESENCA_PORTA_WEB', 5000)}"
     print(f"Aguardando o servidor web e abrindo o navegador em {web_url}...")
     time.sleep(2)  # Dá 2 segundos para o servidor Flask inicializar completamente.
     webbrowser.open(web_url)
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Sincronização entre estações: cada estação (um computador com leitor de QR Code
+em uma entrada da escola) grava no seu próprio presenca.db e envia as leituras
+para uma central, que é outra instância desta mesma aplicação.
+
+- Na estação, um trigger anota cada registro de presença em 'log_sincronizacao'
+  (RA do aluno, horário e tipo). O agente de sincronização envia o log em lotes
+  de JSON comprimidos com gzip para POST /api/sync/push da central.
+- A central aplica cada lote em uma única transação e responde com o maior
+  número de sequência recebido daquela estação (a "marca d'água"). A estação
+  guarda a marca e apaga do log o que já foi confirmado; se a conexão cair, o
+  envio recomeça da marca e a central ignora o que já recebeu.
+- Os alunos são identificados pelo RA, já que o id local muda de um banco para
+  outro. Conflitos seguem a regra de add_attendance_record: por aluno, dia e
+  tipo, fica o registro mais recente.
+- Registros de RAs que a central ainda não conhece (ex: a importação da
+  central está atrasada) ficam guardados em 'sincronizacao_pendentes' e são
+  aplicados assim que o aluno existir: a cada lote recebido e depois de uma
+  importação com alunos novos (aplicar_pendentes). Nenhum registro confirmado
+  à estação é perdido.
+
+Configuração (variáveis de ambiente):
+    PRESENCA_SYNC_URL         Endereço da central na estação (ex: http://192.168.0.10:5000)
+    PRESENCA_SYNC_TOKEN       Chave compartilhada; obrigatória na central e nas estações
+    PRESENCA_ESTACAO          Nome da estação (padrão: nome do computador)
+    PRESENCA_SYNC_INTERVALO   Segundos entre os envios (padrão: 10)
+
+Para testar com duas instâncias no mesmo computador:
+    PRESENCA_DB=central.db PRESENCA_PORTA_WEB=5001 PRESENCA_SYNC_TOKEN=abc python -m web.app
+    PRESENCA_SYNC_URL=http://127.0.0.1:5001 PRESENCA_SYNC_TOKEN=abc python sincronizacao.py
+"""
+
+import argparse
+import gzip
+import json
+import os
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+from datetime import datetime, timedelta
+import contadores
+import database as db
+
+TAMANHO_LOTE = 500
+INTERVALO_PADRAO_SEGUNDOS = 10
+ESPERA_MAXIMA_SEGUNDOS = 300  # Limite da espera entre tentativas quando a central não responde
+TAMANHO_MAXIMO_LOTE_BYTES = 10 * 1024 * 1024  # Depois de descomprimido
+
+
+def ativar_registro():
+    """
+    Cria o trigger que anota os novos registros de presença no log de
+    sincronização. Na primeira ativação, os registros já existentes também são
+    anotados, para que a central receba todo o histórico da estação.
+    """
+    conn = db.get_db_connection()
+    try:
+        ativo = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'presenca_log_sincronizacao'").fetchone()
+        if ativo:
+            return
+        conn.execute("""
+        CREATE TRIGGER presenca_log_sincronizacao AFTER INSERT ON presenca BEGIN
+            INSERT INTO log_sincronizacao (ra, timestamp, tipo_registro)
+            SELECT ra, NEW.timestamp, NEW.tipo_registro FROM alunos WHERE id = NEW.aluno_id;
+        END""")
+        conn.execute("""
+        INSERT INTO log_sincronizacao (ra, timestamp, tipo_registro)
+        SELECT a.ra, p.timestamp, p.tipo_registro FROM presenca p JOIN alunos a ON a.id = p.aluno_id ORDER BY p.id
+        """)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _marca_enviada(conn):
+    row = conn.execute("SELECT valor FROM sincronizacao_estado WHERE chave = 'enviado_ate'").fetchone()
+    return int(row['valor']) if row else 0
+
+
+def _pendentes(conn, limite=TAMANHO_LOTE):
+    return [
+        list(row) for row in conn.execute(
+            "SELECT seq, ra, timestamp, tipo_registro FROM log_sincronizacao WHERE seq > ? ORDER BY seq LIMIT ?",
+            (_marca_enviada(conn), limite)
+        )
+    ]
+
+
+def _enviar_lote(url_central, token, estacao, registros):
+    corpo = gzip.compress(json.dumps({'estacao': estacao, 'registros': registros}).encode('utf-8'))
+    requisicao = urllib.request.Request(
+        url_central.rstrip('/') + '/api/sync/push', data=corpo, method='POST',
+        headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip', 'X-Sync-Token': token}
+    )
+    with urllib.request.urlopen(requisicao, timeout=30) as resposta:
+        return json.loads(resposta.read())
+
+
+def enviar_pendentes(url_central, token, estacao=None):
+    """
+    Envia à central tudo o que está no log acima da marca d'água, em lotes.
+    Retorna o total de registros enviados e as contagens devolvidas pela central.
+    Lança urllib.error.URLError (ou HTTPError) se a central não aceitar um lote.
+    """
+    estacao = estacao or socket.gethostname()
+    totais = {'enviados': 0, 'aplicados': 0, 'ignorados': 0, 'desconhecidos': 0}
+    while True:
+        conn = db.get_db_connection()
+        try:
+            registros = _pendentes(conn)
+        finally:
+            conn.close()
+        if not registros:
+            return totais
+
+        resposta = _enviar_lote(url_central, token, estacao, registros)
+        confirmado = int(resposta['ultimo_seq'])
+
+        conn = db.get_db_connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO sincronizacao_estado (chave, valor) VALUES ('enviado_ate', ?)", (str(confirmado),)
+            )
+            conn.execute("DELETE FROM log_sincronizacao WHERE seq <= ?", (confirmado,))
+            conn.commit()
+        finally:
+            conn.close()
+
+        totais['enviados'] += len(registros)
+        for chave in ('aplicados', 'ignorados', 'desconhecidos'):
+            totais[chave] += resposta.get(chave, 0)
+        if len(registros) < TAMANHO_LOTE:
+            return totais
+
+
+def _aplicar_registro(cursor, aluno_id, timestamp, tipo_registro):
+    """
+    Aplica um registro recebido com a regra de add_attendance_record: fica o
+    registro mais recente do aluno para o mesmo dia e tipo. Retorna True se aplicado.
+    """
+    dia = datetime.fromisoformat(timestamp).date()
+    inicio_dia = datetime.combine(dia, datetime.min.time())
+    fim_dia = inicio_dia + timedelta(days=1)
+    mais_recente = cursor.execute(
+        "SELECT MAX(timestamp) FROM presenca WHERE aluno_id = ? AND tipo_registro = ? AND timestamp >= ? AND timestamp < ?",
+        (aluno_id, tipo_registro, inicio_dia, fim_dia)
+    ).fetchone()[0]
+    if mais_recente is not None and datetime.fromisoformat(mais_recente) >= datetime.fromisoformat(timestamp):
+        return False
+    cursor.execute(
+        "DELETE FROM presenca WHERE aluno_id = ? AND tipo_registro = ? AND timestamp >= ? AND timestamp < ?",
+        (aluno_id, tipo_registro, inicio_dia, fim_dia)
+    )
+    cursor.execute(
+        "INSERT INTO presenca (aluno_id, timestamp, tipo_registro) VALUES (?, ?, ?)",
+        (aluno_id, datetime.fromisoformat(timestamp), tipo_registro)
+    )
+    return True
+
+
+def receber_lote(estacao, registros):
+    """
+    Aplica, na central, um lote enviado por uma estação ([seq, ra, timestamp,
+    tipo_registro], em ordem de seq). Tudo é feito em uma única transação; os
+    registros com seq já recebido daquela estação são ignorados.
+    Retorna a resposta para a estação, com a nova marca d'água ('ultimo_seq').
+    """
+    resultado = {'aplicados': 0, 'ignorados': 0, 'desconhecidos': 0, 'pendentes_aplicados': 0}
+    conn = db.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        row = cursor.execute("SELECT ultimo_seq FROM sincronizacao_estacoes WHERE estacao = ?", (estacao,)).fetchone()
+        ultimo_seq = row['ultimo_seq'] if row else 0
+        novos = [registro for registro in registros if int(registro[0]) > ultimo_seq]
+
+        ras = list({str(registro[1]) for registro in novos})
+        ids_por_ra = {}
+        for i in range(0, len(ras), 500):  # Respeita o limite de parâmetros do SQLite
+            parte = ras[i:i + 500]
+            marcadores = ','.join('?' * len(parte))
+            ids_por_ra.update(
+                (row['ra'], row['id'])
+                for row in cursor.execute(f"SELECT id, ra FROM alunos WHERE ra IN ({marcadores})", parte)
+            )
+
+        aplicados = _aplicar_pendentes(cursor)
+        resultado['pendentes_aplicados'] = len(aplicados)
+        for seq, ra, timestamp, tipo_registro in novos:
+            aluno_id = ids_por_ra.get(str(ra))
+            if aluno_id is None:
+                # Guardado até o aluno existir na central; a marca d'água pode avançar.
+                cursor.execute(
+                    "INSERT OR IGNORE INTO sincronizacao_pendentes (estacao, seq, ra, timestamp, tipo_registro, recebido_em) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (estacao, int(seq), str(ra), timestamp, tipo_registro, datetime.now())
+                )
+                resultado['desconhecidos'] += 1
+            elif tipo_registro in ('entrada', 'saida') and _aplicar_registro(cursor, aluno_id, timestamp, tipo_registro):
+                resultado['aplicados'] += 1
+                aplicados.append((aluno_id, tipo_registro, datetime.fromisoformat(timestamp)))
+            else:
+                resultado['ignorados'] += 1
+            ultimo_seq = max(ultimo_seq, int(seq))
+
+        cursor.execute(
+            "INSERT OR REPLACE INTO sincronizacao_estacoes (estacao, ultimo_seq, atualizado_em) VALUES (?, ?, ?)",
+            (estacao, ultimo_seq, datetime.now())
+        )
+        conn.commit()
+        for aluno_id, tipo_registro, instante in aplicados:
+            contadores.registrar_leitura(aluno_id, tipo_registro, instante)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    resultado['ultimo_seq'] = ultimo_seq
+    resultado['repetidos'] = len(registros) - len(novos)
+    return resultado
+
+
+def _aplicar_pendentes(cursor):
+    """
+    Aplica os registros guardados cujos alunos já existem, sem commit.
+    Retorna as leituras aplicadas [(aluno_id, tipo_registro, instante)].
+    """
+    pendentes = cursor.execute("""
+        SELECT p.estacao, p.seq, p.timestamp, p.tipo_registro, a.id AS aluno_id
+        FROM sincronizacao_pendentes p JOIN alunos a ON a.ra = p.ra
+        ORDER BY p.timestamp
+    """).fetchall()
+    aplicados = []
+    for row in pendentes:
+        if row['tipo_registro'] in ('entrada', 'saida') and _aplicar_registro(
+            cursor, row['aluno_id'], row['timestamp'], row['tipo_registro']
+        ):
+            aplicados.append((row['aluno_id'], row['tipo_registro'], datetime.fromisoformat(row['timestamp'])))
+    cursor.executemany(
+        "DELETE FROM sincronizacao_pendentes WHERE estacao = ? AND seq = ?", [(row['estacao'], row['seq']) for row in pendentes]
+    )
+    return aplicados
+
+
+def aplicar_pendentes():
+    """Aplica, na central, os registros guardados de alunos que já foram cadastrados. Retorna quantos foram aplicados."""
+    conn = db.get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        aplicados = _aplicar_pendentes(cursor)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    for aluno_id, tipo_registro, instante in aplicados:
+        contadores.registrar_leitura(aluno_id, tipo_registro, instante)
+    return len(aplicados)
+
+
+def listar_estacoes():
+    """Retorna, na central, as estações conhecidas e a marca d'água de cada uma."""
+    conn = db.get_db_connection()
+    estacoes = conn.execute("SELECT * FROM sincronizacao_estacoes ORDER BY estacao").fetchall()
+    conn.close()
+    return [dict(row) for row in estacoes]
+
+
+def iniciar_agente(url_central=None, token=None, estacao=None, intervalo_segundos=None):
+    """
+    Inicia o agente de sincronização em uma thread daemon, se a central estiver
+    configurada (parâmetros ou variáveis de ambiente). Retorna a thread ou None.
+    """
+    url_central = url_central or os.environ.get('PRESENCA_SYNC_URL')
+    token = token or os.environ.get('PRESENCA_SYNC_TOKEN')
+    estacao = estacao or os.environ.get('PRESENCA_ESTACAO') or socket.gethostname()
+    intervalo_segundos = intervalo_segundos or int(os.environ.get('PRESENCA_SYNC_INTERVALO', INTERVALO_PADRAO_SEGUNDOS))
+    if not url_central:
+        return None
+    if not token:
+        print("[SYNC] PRESENCA_SYNC_URL definido sem PRESENCA_SYNC_TOKEN. Sincronização desativada.")
+        return None
+
+    ativar_registro()
+
+    def _loop():
+        espera = intervalo_segundos
+        while True:
+            try:
+                totais = enviar_pendentes(url_central, token, estacao)
+                if totais['enviados']:
+                    print(f"[SYNC] {totais['enviados']} registros enviados a {url_central} "
+                          f"({totais['aplicados']} aplicados, {totais['desconhecidos']} alunos desconhecidos).")
+                espera = intervalo_segundos
+            except Exception as e:
+                espera = min(espera * 2, ESPERA_MAXIMA_SEGUNDOS)
+                print(f"[SYNC] Falha ao enviar para {url_central}: {e}. Nova tentativa em {espera} s.")
+            time.sleep(espera)
+
+    thread = threading.Thread(target=_loop, name='sincronizacao', daemon=True)
+    thread.start()
+    print(f"[SYNC] Estação '{estacao}' sincronizando com {url_central} a cada {intervalo_segundos} s.")
+    return thread
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Envia as leituras desta estação para a central.")
+    parser.add_argument("--central", default=os.environ.get('PRESENCA_SYNC_URL'), help="Endereço da central.")
+    parser.add_argument("--token", default=os.environ.get('PRESENCA_SYNC_TOKEN'), help="Chave compartilhada.")
+    parser.add_argument("--estacao", default=os.environ.get('PRESENCA_ESTACAO'), help="Nome desta estação.")
+    parser.add_argument("--estacoes", action="store_true", help="Lista as estações conhecidas (na central).")
+    args = parser.parse_args()
+
+    db.init_db()
+    if args.estacoes:
+        for estacao in listar_estacoes():
+            print(estacao)
+    elif not args.central or not args.token:
+        parser.error("Informe --central e --token (ou PRESENCA_SYNC_URL e PRESENCA_SYNC_TOKEN).")
+    else:
+        ativar_registro()
+        print(enviar_pendentes(args.central, args.token, args.estacao))
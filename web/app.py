@@ -1,10 +1,26 @@
 # -*- coding: utf-8 -*-
 import os
+import io
+import gzip
+import hmac
+import csv
 from functools import wraps
 import json
-from flask import Flask, render_template, abort, jsonify, request, session, redirect, url_for, flash
+from datetime import date, datetime, timedelta
+from flask import Flask, render_template, abort, jsonify, request, session, redirect, url_for, flash, send_file, Response
 from flask.helpers import send_from_directory
 import database as db
+import analytics
+import contadores
+import metricas
+import profiler
+import sincronizacao
+import jobs
+import importacao
+import regras_horario
+from catalogo_turmas import catalogo
+from web import assets
+from web import auth
 
 # ==============================================================================
 # --- CONFIGURAÇÃO INICIAL DA APLICAÇÃO FLASK ---
@@ -20,18 +36,66 @@ app = Flask(
 # Em um ambiente de produção, use uma variável de ambiente para maior segurança.
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'supersecretkey-for-dev')
 
-# Carrega os nomes das turmas para um cache em memória ao iniciar.
-CLASS_NAMES = {}
+# Gera os arquivos estáticos versionados e comprimidos (veja web/assets.py).
+assets.init_app(app)
+
+# Instrumentação: tempo e linhas de cada função do database.py e latência das rotas (veja metricas.py).
+metricas.instrumentar_modulo(db)
+metricas.instrumentar_flask(app)
+
+
+def _medidas_auth():
+    estatisticas = auth.estatisticas()
+    return [
+        (f'auth_{chave}', None, valor) for chave, valor in estatisticas.items()
+        if isinstance(valor, (int, float))
+    ]
+
+metricas.registrar_coletor(_medidas_auth)
+
 try:
-    # Constrói o caminho para o arquivo JSON de forma robusta
-    json_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'turmas-com-disciplinas.json')
-    with open(json_path, 'r', encoding='utf-8') as f:
-        turmas_data = json.load(f)
-        # Cria um dicionário mapeando codigoTurma -> nomeTurma
-        CLASS_NAMES = {item['codigoTurma']: item['nomeTurma'] for item in turmas_data}
-    print("Nomes das turmas carregados com sucesso.")
-except Exception as e:
-    print(f"AVISO: Não foi possível carregar os nomes das turmas do arquivo JSON. Erro: {e}")
+    import orjson
+except ImportError:  # O orjson é opcional; sem ele, usa-se o módulo json padrão.
+    orjson = None
+
+
+def fast_json_response(payload, status=200):
+    """
+    Serializa 'payload' com o orjson (quando instalado) ou com o json padrão em
+    modo compacto. Usado nas respostas grandes, onde o jsonify é mais lento.
+    """
+    if orjson is not None:
+        body = orjson.dumps(payload)
+    else:
+        body = json.dumps(payload, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    return Response(body, status=status, mimetype='application/json')
+
+def to_columnar(students):
+    """
+    Converte a lista de alunos para o formato colunar: uma lista por campo,
+    os nomes das turmas enviados uma única vez e o status como código numérico
+    (índice em 'status_labels').
+    """
+    status_codes = {label: code for code, label in enumerate(db.STATUS_PRESENCA)}
+    turmas = {}
+    for student in students:
+        codigo = student['codigo_turma']
+        if codigo is not None and codigo not in turmas:
+            turmas[codigo] = student.get('nome_turma', codigo)
+    return {
+        "format": "columnar",
+        "count": len(students),
+        "status_labels": list(db.STATUS_PRESENCA),
+        "turmas": turmas,
+        "columns": {
+            "ra": [s['ra'] for s in students],
+            "nome": [s['nome'] for s in students],
+            "codigo_turma": [s['codigo_turma'] for s in students],
+            "status": [status_codes[s['status_presenca']] for s in students],
+            "timestamp_entrada": [s['timestamp_entrada'] for s in students],
+            "timestamp_saida": [s['timestamp_saida'] for s in students],
+        },
+    }
 
 
 # ==============================================================================
@@ -91,11 +155,19 @@ def login():
         password = request.form['password']
         user = db.get_user_by_username(username)
 
-        if user and db.check_user_password(user['password'], password):
+        # A verificação da senha roda no pool do serviço de autenticação (web/auth.py).
+        ok, motivo = auth.verificar_login(user, username, password, request.remote_addr)
+        if ok:
             session['username'] = user['username']
             session['role'] = user['role']
             flash('Login realizado com sucesso!', 'success')
             return redirect(url_for('index'))
+        elif motivo == auth.BLOQUEADO:
+            flash('Muitas tentativas de login sem sucesso. Aguarde alguns minutos e tente novamente.', 'danger')
+            return render_template('login.html'), 429
+        elif motivo == auth.OCUPADO:
+            flash('O servidor está ocupado. Tente novamente em instantes.', 'warning')
+            return render_template('login.html'), 503
         else:
             flash('Nome de usuário ou senha inválidos.', 'danger')
     return render_template('login.html')
@@ -139,13 +211,24 @@ def index():
 
     return render_template('index.html', user_role=user_role, can_view_sensitive_data=can_view_sensitive_data, api_base_url=api_base_url)
 
+USUARIOS_POR_PAGINA = 50
+
 @app.route('/admin/users', methods=['GET', 'POST'])
 @login_required
 @admin_required
 def manage_users():
     """
-    Página para administradores gerenciarem usuários (listar, adicionar, excluir).
+    Página para administradores gerenciarem usuários: listagem paginada com filtro
+    por função e busca pelo nome de usuário, adição, exclusão e ações em lote
+    (excluir, redefinir senha, mudar função) sobre os usuários selecionados.
     """
+    filtros = {
+        'role': request.args.get('role') or None,
+        'q': request.args.get('q', '').strip() or None,
+        'pagina': max(request.args.get('pagina', 1, type=int), 1),
+    }
+    filtros_url = {chave: valor for chave, valor in filtros.items() if valor}
+
     if request.method == 'POST':
         action = request.form.get('action')
 
@@ -164,15 +247,67 @@ def manage_users():
         elif action == 'delete':
             user_id = request.form.get('user_id')
             # Impede que o admin se auto-delete
-            if str(session.get('user_id')) == str(user_id):
+            if request.form.get('username') == session.get('username'):
                  flash('Você não pode excluir sua própria conta de administrador.', 'danger')
             elif db.delete_user_by_id(user_id):
                 flash('Usuário excluído com sucesso!', 'success')
 
-        return redirect(url_for('manage_users'))
+        elif action == 'bulk':
+            user_ids = request.form.getlist('user_ids')
+            acao_lote = request.form.get('bulk_action')
+            valor = request.form.get('new_password') if acao_lote == 'reset_password' else request.form.get('new_role')
+            if not user_ids:
+                flash('Selecione ao menos um usuário.', 'warning')
+            else:
+                try:
+                    alterados = db.bulk_update_users(user_ids, acao_lote, valor, preservar=session.get('username'))
+                    flash(f'{alterados} usuário(s) atualizado(s).', 'success')
+                except ValueError as e:
+                    flash(str(e), 'danger')
+
+        return redirect(url_for('manage_users', **filtros_url))
+
+    users, total = db.list_users(filtros['role'], filtros['q'], filtros['pagina'], USUARIOS_POR_PAGINA)
+    paginas = max(1, -(-total // USUARIOS_POR_PAGINA))
+    return render_template('admin_users.html', users=users, total=total, paginas=paginas,
+                           filtros=filtros, filtros_url=filtros_url, roles=db.ROLES)
+
+@app.route('/admin/relatorios', methods=['GET'])
+@login_required
+@admin_required
+def download_reports():
+    """
+    Gera e devolve os relatórios de fim de período para download.
+    Parâmetros: from e to (AAAA-MM-DD) e formato ('xlsx', 'csv' ou 'parquet', se houver um motor Parquet instalado).
+    """
+    # Importado aqui para que o pandas só seja carregado quando um relatório for pedido.
+    import relatorios
+
+    formato = request.args.get('formato', 'xlsx')
+    if formato == 'parquet' and not relatorios.MOTOR_PARQUET:
+        return jsonify({"error": relatorios.MENSAGEM_SEM_PARQUET}), 400
+    if formato not in relatorios.FORMATOS:
+        return jsonify({"error": f"Formato inválido: {formato}"}), 400
+    try:
+        fim = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        inicio = date.fromisoformat(request.args['from']) if request.args.get('from') else fim.replace(month=1, day=1)
+    except ValueError:
+        return jsonify({"error": "Datas inválidas. Use o formato AAAA-MM-DD."}), 400
 
-    users = db.get_all_users()
-    return render_template('admin_users.html', users=users)
+    try:
+        buffer = io.BytesIO()
+        relatorios.exportar(relatorios.gerar_relatorios(inicio, fim), formato, buffer)
+        buffer.seek(0)
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao gerar relatórios: {e}")
+        return jsonify({"error": "Erro ao gerar relatórios"}), 500
+
+    extensao = 'xlsx' if formato == 'xlsx' else 'zip'
+    return send_file(
+        buffer,
+        as_attachment=True,
+        download_name=f"relatorios_{inicio.isoformat()}_{fim.isoformat()}.{extensao}",
+    )
 
 @app.route('/aluno/<ra>')
 @login_required
@@ -184,62 +319,471 @@ def student_history(ra):
         aluno, historico = db.get_student_attendance_history_by_ra(ra)
         if not aluno:
             abort(404)  # Aluno não encontrado
+        diario = db.get_student_daily_status(aluno['id'])
     except Exception as e:
         print(f"Erro ao buscar histórico do aluno {ra}: {e}")
         abort(500)  # Erro interno do servidor
 
-    return render_template('historico.html', aluno=aluno, historico=historico)
+    return render_template('historico.html', aluno=aluno, historico=historico, diario=diario)
 
 
 # ==============================================================================
 # --- ENDPOINTS DE API (PARA COMUNICAÇÃO COM O FRONTEND) ---
 # ==============================================================================
 
+PAINEL_MAXIMO_POR_PAGINA = 500
+
 @app.route('/api/presence_data', methods=['GET'])
 def get_presence_data():
     """
-    Retorna todos os dados de presença dos alunos em formato JSON.
+    Retorna os dados de presença do dia dos alunos em formato JSON.
     Se o usuário logado for um aluno, retorna apenas os seus próprios dados.
+    Parâmetros opcionais, avaliados no banco: turma (código; vazio para os alunos
+    sem turma), status, q (nome ou RA), sort (veja db.ORDENACOES_PAINEL; '-' para
+    ordem decrescente), pagina e por_pagina (máximo PAINEL_MAXIMO_POR_PAGINA).
+    Com '?format=columnar', retorna o formato compacto gerado por to_columnar(),
+    com o total de alunos encontrados em 'total'; no formato padrão, o total vai
+    no cabeçalho X-Total-Count.
     """
+    por_pagina = request.args.get('por_pagina', type=int)
+    if por_pagina is not None:
+        por_pagina = min(max(por_pagina, 1), PAINEL_MAXIMO_POR_PAGINA)
     try:
-        all_students = db.get_all_students_with_latest_attendance()
-        
-        # Adiciona o nome da turma a cada registro de aluno
-        for student in all_students:
-            # Usa o nome da turma do cache ou o próprio código se não for encontrado
-            student['nome_turma'] = CLASS_NAMES.get(student['codigo_turma'], student['codigo_turma'])
-
-        students_to_return = all_students
-        user_role = session.get('role')
-        if user_role == 'aluno':
-            logged_in_ra = session.get('username')
-            students_to_return = [aluno for aluno in students_to_return if aluno['ra'] == logged_in_ra]
-            
-        return jsonify(students_to_return)
-    except Exception as e:        
+        # Garante que a tabela 'turmas' (usada no JOIN que traz o nome da turma) esteja atualizada.
+        catalogo.nomes()
+        students_to_return, total = db.consultar_painel(
+            codigo_turma=request.args.get('turma'),
+            status=request.args.get('status') or None,
+            busca=request.args.get('q', '').strip() or None,
+            # Um aluno logado só recebe os seus próprios dados.
+            ra=session.get('username') if session.get('role') == 'aluno' else None,
+            ordem=request.args.get('sort') or 'nome',
+            pagina=request.args.get('pagina', 1, type=int),
+            por_pagina=por_pagina,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
         print(f"[ERRO-API] Erro ao buscar dados de presença para API: {e}")
         return jsonify({"error": "Erro ao buscar dados de presença"}), 500
 
+    if request.args.get('format') == 'columnar':
+        payload = to_columnar(students_to_return)
+        payload['total'] = total
+        return fast_json_response(payload)
+    response = jsonify(students_to_return)
+    response.headers['X-Total-Count'] = str(total)
+    return response
+
+@app.route('/api/turmas', methods=['GET'])
+@login_required
+def get_turmas_summary():
+    """
+    Resumo do dia por turma (alunos, presentes e ausentes), usado pelo painel para
+    montar as abas e os totais antes de carregar os alunos de cada turma.
+    Com os parâmetros status e/ou q, 'encontrados' traz quantos alunos de cada
+    turma atendem aos filtros.
+    """
+    if session.get('role') == 'aluno':
+        return jsonify({"error": "Acesso negado."}), 403
+    try:
+        catalogo.nomes()
+        turmas = db.resumo_turmas(
+            status=request.args.get('status') or None,
+            busca=request.args.get('q', '').strip() or None,
+        )
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao resumir as turmas: {e}")
+        return jsonify({"error": "Erro ao resumir as turmas"}), 500
+
+    for turma in turmas:
+        turma['ausentes'] = turma['alunos'] - turma['presentes']
+    return jsonify({
+        "turmas": turmas,
+        "alunos": sum(turma['alunos'] for turma in turmas),
+        "presentes": sum(turma['presentes'] for turma in turmas),
+        "ausentes": sum(turma['ausentes'] for turma in turmas),
+    })
+
+@app.route('/api/summary', methods=['GET'])
+def get_summary():
+    """
+    Contadores do dia mantidos em memória (veja contadores.py): por turma e
+    para a escola, alunos, presentes, ausentes, pontuais, atrasos, saídas
+    antecipadas, apenas entrada e alunos dentro da escola agora. Não consulta
+    o banco, então pode ser chamada a cada segundo (ex: painéis de TV).
+    Com '?turma=', retorna apenas a turma informada. Não expõe dados de alunos.
+    """
+    try:
+        resumo = contadores.resumo()
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao ler os contadores do dia: {e}")
+        return jsonify({"error": "Erro ao ler os contadores do dia"}), 500
+
+    nomes_turmas = catalogo.nomes()
+    turma = request.args.get('turma')
+    if turma is not None:
+        resumo['turmas'] = [linha for linha in resumo['turmas'] if linha['codigo_turma'] == turma]
+        if not resumo['turmas']:
+            return jsonify({"error": f"Turma não encontrada: {turma}"}), 404
+    for linha in resumo['turmas']:
+        linha['nome_turma'] = nomes_turmas.get(linha['codigo_turma'], linha['codigo_turma'] or 'Sem Turma')
+    return fast_json_response(resumo)
+
+@app.route('/api/stats', methods=['GET'])
+@login_required
+@professor_or_admin_required
+def get_stats():
+    """
+    Retorna estatísticas históricas de presença a partir dos agregados pré-calculados.
+    Parâmetros: turma (código), from e to (AAAA-MM-DD) e periodo ('dia', 'semana' ou 'mes').
+    """
+    try:
+        inicio = date.fromisoformat(request.args['from']) if request.args.get('from') else None
+        fim = date.fromisoformat(request.args['to']) if request.args.get('to') else None
+    except ValueError:
+        return jsonify({"error": "Datas inválidas. Use o formato AAAA-MM-DD."}), 400
+    if inicio and fim and inicio > fim:
+        return jsonify({"error": "A data inicial deve ser anterior à data final."}), 400
+
+    periodo = request.args.get('periodo', 'mes')
+    if periodo not in analytics.PERIODOS:
+        return jsonify({"error": f"Período inválido: {periodo}"}), 400
+
+    try:
+        stats = analytics.consultar_estatisticas(
+            codigo_turma=request.args.get('turma') or None,
+            inicio=inicio,
+            fim=fim,
+            periodo=periodo,
+        )
+        nomes_turmas = catalogo.nomes()
+        for linha in stats['turmas']:
+            linha['nome_turma'] = nomes_turmas.get(linha['codigo_turma'], linha['codigo_turma'])
+        return jsonify(stats)
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao calcular estatísticas: {e}")
+        return jsonify({"error": "Erro ao calcular estatísticas"}), 500
+
+@app.route('/api/students/search', methods=['GET'])
+@login_required
+@professor_or_admin_required
+def search_students():
+    """
+    Busca alunos por nome, RA ou INEP (parâmetro 'q'), sem precisar baixar a lista completa.
+    Parâmetro opcional 'limit' (padrão 20, máximo 100).
+    """
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    try:
+        students = db.search_students(query, limit=limit)
+        nomes_turmas = catalogo.nomes()
+        for student in students:
+            student['nome_turma'] = nomes_turmas.get(student['codigo_turma'], student['codigo_turma'])
+        return jsonify(students)
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao buscar alunos: {e}")
+        return jsonify({"error": "Erro ao buscar alunos"}), 500
+
+# Limites de /api/scans: itens por lote e tolerância para relógios adiantados.
+MAX_LEITURAS_POR_LOTE = 1000
+TOLERANCIA_RELOGIO = timedelta(minutes=5)
+
+def _ler_instante(valor):
+    """Converte o 'timestamp' de uma leitura (ISO 8601) para o horário local, sem fuso."""
+    if not valor:
+        return datetime.now()
+    instante = datetime.fromisoformat(str(valor).replace('Z', '+00:00'))
+    if instante.tzinfo is not None:
+        instante = instante.astimezone().replace(tzinfo=None)
+    return instante
+
+@app.route('/api/scans', methods=['POST'])
+@login_required
+@professor_or_admin_required
+def ingest_scans():
+    """
+    Recebe um lote de leituras de QR Code de leitores remotos (celulares, estações
+    offline). Corpo JSON: {"leituras": [{"identificador", "timestamp", "estacao",
+    "chave"}]}, em que 'identificador' é o RA ou o INEP, 'timestamp' é ISO 8601
+    (padrão: agora) e 'chave' é uma chave de idempotência opcional para reenvios.
+    Retorna um resultado por leitura, na mesma ordem.
+    """
+    dados = request.get_json(silent=True)
+    itens = dados.get('leituras') if isinstance(dados, dict) else dados
+    if not isinstance(itens, list) or not itens:
+        return jsonify({"error": "Envie uma lista de leituras em 'leituras'."}), 400
+    if len(itens) > MAX_LEITURAS_POR_LOTE:
+        return jsonify({"error": f"Máximo de {MAX_LEITURAS_POR_LOTE} leituras por lote."}), 413
+
+    limite = datetime.now() + TOLERANCIA_RELOGIO
+    validas, resultados = [], []
+    for item in itens:
+        try:
+            identificador = str(item['identificador']).strip()
+            instante = _ler_instante(item.get('timestamp'))
+            if not identificador or instante > limite:
+                raise ValueError
+            validas.append({'identificador': identificador, 'timestamp': instante,
+                            'estacao': item.get('estacao'), 'chave': item.get('chave') or None})
+            resultados.append(None)
+        except (AttributeError, KeyError, TypeError, ValueError):
+            resultados.append({'resultado': 'invalido', 'status': "Leitura inválida"})
+
+    try:
+        registradas = iter(db.add_attendance_records_bulk(validas)) if validas else iter(())
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao registrar lote de leituras: {e}")
+        return jsonify({"error": "Erro ao registrar as leituras."}), 500
+    resultados = [resultado or next(registradas) for resultado in resultados]
+    for indice, resultado in enumerate(resultados):
+        resultado['indice'] = indice
+    return jsonify({"resultados": resultados,
+                    "registradas": sum(1 for r in resultados if r['resultado'] == 'registrado' and not r.get('repetida'))})
+
+# Limite de /api/students/bulk: alunos por lote.
+MAX_ALUNOS_POR_LOTE = 2000
+
+@app.route('/api/students/bulk', methods=['POST'])
+@login_required
+@admin_required
+def update_students_bulk():
+    """
+    Altera vários alunos em uma única transação (ex: troca de turmas no início do
+    ano letivo). Corpo JSON: {"alunos": [{"ra", "alteracoes": {"codigo_turma",
+    "nome", "inep"}}]}. Retorna um resultado por aluno, na mesma ordem.
+    """
+    dados = request.get_json(silent=True)
+    itens = dados.get('alunos') if isinstance(dados, dict) else dados
+    if not isinstance(itens, list) or not itens:
+        return jsonify({"error": "Envie uma lista de alunos em 'alunos'."}), 400
+    if len(itens) > MAX_ALUNOS_POR_LOTE:
+        return jsonify({"error": f"Máximo de {MAX_ALUNOS_POR_LOTE} alunos por lote."}), 413
+
+    alteracoes = [
+        (item.get('ra'), item.get('alteracoes')) if isinstance(item, dict) and item.get('ra') is not None else None
+        for item in itens
+    ]
+    try:
+        resultados = db.update_students_bulk(alteracoes)
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao alterar lote de alunos: {e}")
+        return jsonify({"error": "Erro ao alterar os alunos."}), 500
+    for indice, resultado in enumerate(resultados):
+        resultado['indice'] = indice
+    return jsonify({"resultados": resultados,
+                    "atualizados": sum(1 for r in resultados if r['resultado'] == 'atualizado')})
+
+EXPORT_COLUMNS = ['data', 'ra', 'nome', 'codigo_turma', 'status_presenca', 'timestamp_entrada', 'timestamp_saida']
+
+@app.route('/api/export.<formato>', methods=['GET'])
+@login_required
+@professor_or_admin_required
+def export_attendance(formato):
+    """
+    Exporta o status de presença diário diretamente do banco de dados, em CSV ou NDJSON.
+    Parâmetros: turma (código), from e to (AAAA-MM-DD) e status.
+    A resposta é enviada em partes (streaming), sem montar o arquivo inteiro na memória.
+    """
+    if formato not in ('csv', 'ndjson'):
+        abort(404)
+    try:
+        data_fim = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        data_inicio = date.fromisoformat(request.args['from']) if request.args.get('from') else data_fim
+    except ValueError:
+        return jsonify({"error": "Datas inválidas. Use o formato AAAA-MM-DD."}), 400
+
+    try:
+        rows = db.iter_attendance_export(
+            codigo_turma=request.args.get('turma') or None,
+            data_inicio=data_inicio,
+            data_fim=data_fim,
+            status=request.args.get('status') or None,
+        )
+    except ValueError as e:
+        # Status inválido ou intervalo com arquivos demais: avisado antes de o arquivo começar.
+        return jsonify({"error": str(e)}), 400
+
+    def generate_csv():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM para que o Excel reconheça o arquivo como UTF-8.
+        buffer.write('\ufeff')
+        writer.writerow(EXPORT_COLUMNS)
+        for row in rows:
+            writer.writerow([row[col] for col in EXPORT_COLUMNS])
+            if buffer.tell() > 8192:
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        yield buffer.getvalue()
+
+    def generate_ndjson():
+        for row in rows:
+            yield json.dumps(row, ensure_ascii=False) + '\n'
+
+    nome_arquivo = f"presenca_{data_inicio.isoformat()}_{data_fim.isoformat()}.{formato}"
+    if formato == 'csv':
+        response = Response(generate_csv(), mimetype='text/csv; charset=utf-8')
+    else:
+        response = Response(generate_ndjson(), mimetype='application/x-ndjson')
+    response.headers['Content-Disposition'] = f'attachment; filename="{nome_arquivo}"'
+    return response
+
+@app.route('/api/auth/stats', methods=['GET'])
+@login_required
+@admin_required
+def get_auth_stats():
+    """Retorna as estatísticas do serviço de autenticação (latência de verificação, fila, bloqueios)."""
+    return jsonify(auth.estatisticas())
+
+@app.route('/admin/profiler', methods=['GET', 'POST'])
+@login_required
+@admin_required
+def toggle_profiler():
+    """
+    GET: estado do profiler por amostragem.
+    POST: inicia uma sessão ('segundos', padrão 30; 'intervalo_ms', padrão 10)
+    ou, com 'acao' = 'parar', encerra a sessão ativa. Veja profiler.py.
+    """
+    if request.method == 'GET':
+        return jsonify(profiler.estado())
+
+    dados = request.get_json(silent=True) or request.form
+    if dados.get('acao') == 'parar':
+        profiler.parar()
+        return jsonify(profiler.estado())
+    try:
+        segundos = int(dados.get('segundos', 30))
+        intervalo_ms = int(dados.get('intervalo_ms', profiler.INTERVALO_PADRAO_MS))
+    except (TypeError, ValueError):
+        return jsonify({"error": "Parâmetros 'segundos' e 'intervalo_ms' devem ser inteiros."}), 400
+    try:
+        arquivo = profiler.iniciar(segundos, intervalo_ms)
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"status": "iniciado", "arquivo": arquivo}), 202
+
+@app.route('/api/regras_horario', methods=['GET', 'POST', 'DELETE'])
+@login_required
+@admin_required
+def manage_schedule_rules():
+    """
+    GET: lista as regras de horário por turma.
+    POST: cria ou substitui uma regra ('codigo_turma', 'dia_semana', 'hora_entrada',
+    'hora_saida', 'tolerancia_minutos'). DELETE: remove a regra da turma/dia.
+    Após uma alteração, os agregados históricos são recalculados pela fila de tarefas
+    (veja jobs.py); alterações feitas enquanto o recálculo aguarda na fila são agrupadas.
+    """
+    if request.method == 'GET':
+        return jsonify(regras_horario.listar_regras())
+
+    dados = request.get_json(silent=True) or request.form
+    try:
+        if request.method == 'POST':
+            regras_horario.definir_regra(
+                dados.get('codigo_turma'),
+                dados.get('dia_semana', regras_horario.TODOS_OS_DIAS),
+                dados.get('hora_entrada', ''),
+                dados.get('hora_saida', ''),
+                dados.get('tolerancia_minutos', 20),
+            )
+        elif not regras_horario.remover_regra(dados.get('codigo_turma'), dados.get('dia_semana', regras_horario.TODOS_OS_DIAS)):
+            return jsonify({"error": "Regra não encontrada."}), 404
+    except (TypeError, ValueError) as e:
+        return jsonify({"error": f"Regra inválida: {e}"}), 400
+
+    try:
+        job_id, _ = jobs.enfileirar('recalcular_historico', solicitado_por=session.get('username'))
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao agendar o recálculo do histórico: {e}")
+        return jsonify({"error": "Regra gravada, mas não foi possível agendar o recálculo do histórico."}), 500
+    return jsonify({
+        "status": "ok",
+        "regras": regras_horario.listar_regras(),
+        "job_id": job_id,
+        "status_url": url_for('get_job', job_id=job_id),
+    })
+
+@app.route('/api/sync/push', methods=['POST'])
+def sync_push():
+    """
+    Recebe um lote de leituras de uma estação (veja sincronizacao.py). Autenticado
+    pela chave compartilhada PRESENCA_SYNC_TOKEN no cabeçalho 'X-Sync-Token'.
+    """
+    token = os.environ.get('PRESENCA_SYNC_TOKEN')
+    if not token:
+        return jsonify({"error": "Sincronização desativada nesta instância."}), 403
+    if not hmac.compare_digest(request.headers.get('X-Sync-Token', ''), token):
+        return jsonify({"error": "Chave de sincronização inválida."}), 403
+
+    try:
+        corpo = request.get_data()
+        if request.headers.get('Content-Encoding') == 'gzip':
+            with gzip.GzipFile(fileobj=io.BytesIO(corpo)) as arquivo:
+                corpo = arquivo.read(sincronizacao.TAMANHO_MAXIMO_LOTE_BYTES + 1)
+        if len(corpo) > sincronizacao.TAMANHO_MAXIMO_LOTE_BYTES:
+            return jsonify({"error": "Lote muito grande."}), 413
+        dados = json.loads(corpo)
+        estacao = str(dados['estacao'])
+        registros = dados['registros']
+    except (OSError, ValueError, KeyError, TypeError):
+        return jsonify({"error": "Lote inválido."}), 400
+
+    try:
+        return jsonify(sincronizacao.receber_lote(estacao, registros))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": f"Registro inválido no lote: {e}"}), 400
+    except Exception as e:
+        print(f"[ERRO-API] Erro ao receber lote da estação {estacao}: {e}")
+        return jsonify({"error": "Erro ao aplicar o lote."}), 500
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """
+    Exporta as métricas da aplicação no formato de texto do Prometheus.
+    Acessível a administradores logados ou, para o coletor do Prometheus, com a chave
+    PRESENCA_METRICS_TOKEN no cabeçalho 'Authorization: Bearer <chave>'.
+    """
+    token = os.environ.get('PRESENCA_METRICS_TOKEN')
+    autorizacao = request.headers.get('Authorization', '')
+    if session.get('role') != 'admin' and not (
+            token and hmac.compare_digest(autorizacao, f"Bearer {token}")):
+        return jsonify({"error": "Acesso às métricas não autorizado."}), 403
+    return Response(metricas.formato_prometheus(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
 @app.route('/api/repopulate_students', methods=['POST'])
 @login_required
 @professor_or_admin_required
 def repopulate_students():
     """
-    Endpoint para forçar a limpeza e repopulação do banco de dados de alunos.
-    Acessível apenas por usuários com a função 'professor'.
+    Agenda a sincronização dos alunos com os arquivos JSON da pasta 'data' (veja
+    importacao.py) como tarefa em segundo plano. Responde 202 com o id da tarefa,
+    cujo andamento é consultado em /api/jobs/<id>. Pedidos repetidos enquanto a
+    tarefa ainda está na fila recebem o mesmo id.
     """
     try:
-        count, errors = db.repopulate_all_students()
-        if errors:
-            return jsonify({
-                "message": f"{count} alunos importados, mas ocorreram {len(errors)} erros.",
-                "errors": errors
-            }), 400
-        return jsonify({
-            "message": f"Banco de dados repopulado com sucesso! {count} alunos importados."
-        }), 200
+        job_id, agrupada = jobs.enfileirar('repopular_alunos', solicitado_por=session.get('username'))
     except Exception as e:
-        return jsonify({"error": f"Ocorreu um erro grave: {e}"}), 500
+        print(f"[ERRO-API] Erro ao agendar a repopulação de alunos: {e}")
+        return jsonify({"error": "Não foi possível agendar a repopulação."}), 500
+    return jsonify({
+        "message": "A repopulação já estava na fila." if agrupada else "Repopulação agendada.",
+        "job_id": job_id,
+        "status_url": url_for('get_job', job_id=job_id),
+    }), 202
+
+@app.route('/api/jobs/<int:job_id>', methods=['GET'])
+@login_required
+@professor_or_admin_required
+def get_job(job_id):
+    """Estado, progresso e resultado de uma tarefa em segundo plano (veja jobs.py)."""
+    job = jobs.consultar(job_id)
+    if job is None:
+        return jsonify({"error": "Tarefa não encontrada."}), 404
+    return jsonify(job)
 
 @app.route('/qrcodes/<path:filename>')
 def serve_qrcode(filename):
@@ -262,14 +806,16 @@ def start_web_server():
     """
     Inicia o servidor Flask.
     """
-    print("Iniciando o servidor web em http://0.0.0.0:5000")
-    app.run(host='0.0.0.0', port=5000, debug=False)
+    porta = int(os.environ.get('PRESENCA_PORTA_WEB', 5000))
+    print(f"Iniciando o servidor web em http://0.0.0.0:{porta}")
+    app.run(host='0.0.0.0', port=porta, debug=False)
 
 if __name__ == '__main__':
     # Bloco para permitir a execução deste arquivo de forma independente para testes.
     # sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-    init_db()
+    db.init_db()
+    jobs.iniciar_worker()
     # populate_students_if_empty()
     
     # Em modo de teste, ativamos o debug.
-    app.run(host='0.0.0.0', port=5000, debug=True)
+    app.run(host='0.0.0.0', port=int(os.environ.get('PRESENCA_PORTA_WEB', 5000)), debug=True)
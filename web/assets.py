@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""
+Pipeline de arquivos estáticos da interface web.
+
+Na inicialização, cada arquivo listado em ASSETS é copiado para 'static/dist' com
+o hash do conteúdo no nome (ex: 'js/index.3f2a9c1b7d4e.js') e ganha variantes
+pré-comprimidas em gzip e, se o pacote 'brotli' estiver instalado, em brotli.
+A rota '/assets/<arquivo>' entrega a variante que o navegador aceita, com cache
+de longa duração: como o nome muda sempre que o conteúdo muda, o navegador nunca
+precisa revalidar o arquivo.
+
+Nos templates, use asset_url('js/index.js') no lugar de url_for('static', ...).
+"""
+
+import gzip
+import hashlib
+import os
+from pathlib import Path
+from flask import abort, request, send_file, url_for
+
+try:
+    import brotli
+except ImportError:  # O brotli é opcional; sem ele, apenas o gzip é gerado.
+    brotli = None
+
+STATIC_DIR = Path(__file__).resolve().parent / 'static'
+DIST_DIR = STATIC_DIR / 'dist'
+
+# Arquivos usados pelos templates.
+ASSETS = [
+    'css/bootstrap.min.css',
+    'css/index.css',
+    'css/login.css',
+    'js/bootstrap.bundle.min.js',
+    'js/qrcode.min.js',
+    'js/chart.min.js',
+    'js/index.js',
+]
+
+# Definidos explicitamente porque o registro do Windows às vezes associa '.js' a 'text/plain'.
+MIMETYPES = {
+    '.css': 'text/css',
+    '.js': 'application/javascript',
+}
+
+# Codificações na ordem de preferência, com a extensão do arquivo pré-comprimido.
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+_manifest = {}  # 'js/index.js' -> 'js/index.3f2a9c1b7d4e.js'
+_hashed_files = set()
+
+
+def _write_if_missing(path, data_factory):
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + '.tmp')
+        tmp_path.write_bytes(data_factory())
+        os.replace(tmp_path, path)
+
+
+def build_assets():
+    """
+    Gera os arquivos com hash e as variantes comprimidas em 'static/dist'.
+    Arquivos já gerados para o mesmo conteúdo são reaproveitados, então chamadas
+    repetidas só custam a leitura e o hash dos originais.
+    """
+    manifest = {}
+    for logical_name in ASSETS:
+        source = STATIC_DIR / logical_name
+        if not source.exists():
+            print(f"AVISO: Arquivo estático não encontrado: {source}")
+            continue
+        data = source.read_bytes()
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        stem, ext = os.path.splitext(logical_name)
+        hashed_name = f"{stem}.{digest}{ext}"
+        target = DIST_DIR / hashed_name
+
+        _write_if_missing(target, lambda: data)
+        _write_if_missing(target.with_name(target.name + '.gz'), lambda: gzip.compress(data, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write_if_missing(target.with_name(target.name + '.br'), lambda: brotli.compress(data, quality=11))
+
+        manifest[logical_name] = hashed_name
+
+    _manifest.clear()
+    _manifest.update(manifest)
+    _hashed_files.clear()
+    _hashed_files.update(manifest.values())
+    return manifest
+
+
+def asset_url(filename):
+    """Retorna a URL versionada de um arquivo estático (ou a URL normal, se não estiver no pipeline)."""
+    hashed_name = _manifest.get(filename)
+    if hashed_name is None:
+        return url_for('static', filename=filename)
+    return url_for('serve_asset', filename=hashed_name)
+
+
+def serve_asset(filename):
+    """Entrega um arquivo com hash, escolhendo a variante comprimida pelo cabeçalho Accept-Encoding."""
+    if filename not in _hashed_files:
+        abort(404)
+
+    path = DIST_DIR / filename
+    content_encoding = None
+    for encoding, suffix in ENCODINGS:
+        candidate = path.with_name(path.name + suffix)
+        if request.accept_encodings[encoding] and candidate.exists():
+            path = candidate
+            content_encoding = encoding
+            break
+
+    mimetype = MIMETYPES.get(os.path.splitext(filename)[1], 'application/octet-stream')
+    response = send_file(path, mimetype=mimetype, max_age=31536000)
+    if content_encoding:
+        response.headers['Content-Encoding'] = content_encoding
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = CACHE_CONTROL
+    return response
+
+
+def init_app(app):
+    """Gera os arquivos e registra a rota e a função 'asset_url' nos templates."""
+    try:
+        build_assets()
+    except OSError as e:
+        # Sem permissão de escrita, os templates continuam usando '/static' normalmente.
+        print(f"AVISO: Não foi possível gerar os arquivos estáticos otimizados. Erro: {e}")
+    app.add_url_rule('/assets/<path:filename>', 'serve_asset', serve_asset)
+    app.add_template_global(asset_url, 'asset_url')
+
+
+if __name__ == '__main__':
+    # Permite gerar os arquivos durante o build (ex: antes de rodar o PyInstaller).
+    for logical_name, hashed_name in build_assets().items():
+        print(f"{logical_name} -> dist/{hashed_name}")
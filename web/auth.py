@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""
+Serviço de autenticação usado pela rota de login.
+
+- A verificação do hash da senha (lenta de propósito) roda em um pool de processos
+  de tamanho limitado, fora da thread que atende a requisição.
+- Verificações bem-sucedidas ficam em cache por alguns minutos. A chave do cache é
+  um HMAC (com um segredo aleatório gerado a cada execução) de usuário, senha e hash
+  armazenado; a senha em texto puro nunca é guardada.
+- Falhas de login consomem fichas de "baldes" (token buckets) por usuário e por IP.
+  Com o balde vazio, novas tentativas são recusadas até que as fichas se recomponham.
+"""
+
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash
+
+# --- Configuração ---
+MAX_WORKERS = max(1, min(4, (os.cpu_count() or 2) - 1))
+MAX_PENDENTES = MAX_WORKERS * 8  # Verificações aguardando ou em execução no pool
+TIMEOUT_FILA_SEGUNDOS = 5
+CACHE_TTL_SEGUNDOS = 300
+CACHE_MAX_ENTRADAS = 2048
+BALDE_CAPACIDADE = 5  # Falhas permitidas em sequência
+BALDE_RECARGA_SEGUNDOS = 30  # Tempo para recuperar uma ficha
+
+# Motivos de recusa retornados por verificar_login.
+CREDENCIAIS_INVALIDAS = 'credenciais_invalidas'
+BLOQUEADO = 'bloqueado'
+OCUPADO = 'ocupado'
+
+_segredo_cache = secrets.token_bytes(32)
+_lock = threading.Lock()
+_executor = None
+_vagas = threading.BoundedSemaphore(MAX_PENDENTES)
+_cache = OrderedDict()  # chave HMAC -> instante de expiração
+_baldes = {}  # ('usuario' | 'ip', valor) -> [fichas, último_instante]
+_estatisticas = {
+    'verificacoes': 0,
+    'cache_hits': 0,
+    'falhas': 0,
+    'bloqueios': 0,
+    'recusas_ocupado': 0,
+    'fila_atual': 0,
+    'latencia_max_ms': 0.0,
+}
+_latencias_ms = deque(maxlen=500)
+
+
+def _verificar_hash(hashed_password, password):
+    """Executada nos processos do pool."""
+    return check_password_hash(hashed_password, password)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=MAX_WORKERS)
+        return _executor
+
+
+def _chave_cache(username, password, hashed_password):
+    mensagem = '\0'.join((username, password, hashed_password)).encode('utf-8')
+    return hmac.new(_segredo_cache, mensagem, hashlib.sha256).digest()
+
+
+def _cache_valido(chave):
+    agora = time.monotonic()
+    with _lock:
+        expira_em = _cache.get(chave)
+        if expira_em is None:
+            return False
+        if expira_em < agora:
+            del _cache[chave]
+            return False
+        _cache.move_to_end(chave)
+        return True
+
+
+def _guardar_cache(chave):
+    with _lock:
+        _cache[chave] = time.monotonic() + CACHE_TTL_SEGUNDOS
+        _cache.move_to_end(chave)
+        while len(_cache) > CACHE_MAX_ENTRADAS:
+            _cache.popitem(last=False)
+
+
+def _fichas(chave_balde, agora):
+    """Retorna o balde atualizado com as fichas recompostas até 'agora'. Chamar com _lock."""
+    balde = _baldes.get(chave_balde)
+    if balde is None:
+        return None
+    fichas, ultimo = balde
+    fichas = min(BALDE_CAPACIDADE, fichas + (agora - ultimo) / BALDE_RECARGA_SEGUNDOS)
+    if fichas >= BALDE_CAPACIDADE:
+        # Balde cheio de novo: não há motivo para continuar guardando.
+        del _baldes[chave_balde]
+        return None
+    balde[0], balde[1] = fichas, agora
+    return balde
+
+
+def _esta_bloqueado(chaves_balde):
+    agora = time.monotonic()
+    with _lock:
+        for chave_balde in chaves_balde:
+            balde = _fichas(chave_balde, agora)
+            if balde is not None and balde[0] < 1:
+                return True
+    return False
+
+
+def _registrar_falha(chaves_balde):
+    agora = time.monotonic()
+    with _lock:
+        _estatisticas['falhas'] += 1
+        for chave_balde in chaves_balde:
+            balde = _fichas(chave_balde, agora)
+            if balde is None:
+                balde = _baldes[chave_balde] = [float(BALDE_CAPACIDADE), agora]
+            balde[0] = max(0.0, balde[0] - 1)
+
+
+def _verificar_no_pool(hashed_password, password):
+    """Envia a verificação ao pool. Retorna None se a fila estiver cheia."""
+    if not _vagas.acquire(timeout=TIMEOUT_FILA_SEGUNDOS):
+        return None
+    with _lock:
+        _estatisticas['fila_atual'] += 1
+    inicio = time.perf_counter()
+    try:
+        try:
+            return _get_executor().submit(_verificar_hash, hashed_password, password).result()
+        except BrokenProcessPool:
+            # Se o pool não puder ser usado (ex: processo filho encerrado), verifica localmente.
+            return _verificar_hash(hashed_password, password)
+    finally:
+        latencia_ms = (time.perf_counter() - inicio) * 1000
+        with _lock:
+            _estatisticas['fila_atual'] -= 1
+            _estatisticas['verificacoes'] += 1
+            _estatisticas['latencia_max_ms'] = max(_estatisticas['latencia_max_ms'], latencia_ms)
+            _latencias_ms.append(latencia_ms)
+        _vagas.release()
+
+
+def verificar_login(user, username, password, ip):
+    """
+    Verifica a senha de 'user' (linha da tabela users, ou None se não existir).
+    Retorna (True, None) em caso de sucesso ou (False, motivo), onde motivo é
+    CREDENCIAIS_INVALIDAS, BLOQUEADO ou OCUPADO.
+    """
+    chaves_balde = [('usuario', username), ('ip', ip or '')]
+    if _esta_bloqueado(chaves_balde):
+        with _lock:
+            _estatisticas['bloqueios'] += 1
+        return False, BLOQUEADO
+
+    if user is None:
+        _registrar_falha(chaves_balde)
+        return False, CREDENCIAIS_INVALIDAS
+
+    chave = _chave_cache(username, password, user['password'])
+    if _cache_valido(chave):
+        with _lock:
+            _estatisticas['cache_hits'] += 1
+        return True, None
+
+    resultado = _verificar_no_pool(user['password'], password)
+    if resultado is None:
+        with _lock:
+            _estatisticas['recusas_ocupado'] += 1
+        return False, OCUPADO
+    if not resultado:
+        _registrar_falha(chaves_balde)
+        return False, CREDENCIAIS_INVALIDAS
+
+    _guardar_cache(chave)
+    return True, None
+
+
+def estatisticas():
+    """Retorna um resumo das verificações, incluindo latência e tamanho atual da fila."""
+    with _lock:
+        resumo = dict(_estatisticas)
+        latencias = sorted(_latencias_ms)
+        resumo['baldes_ativos'] = len(_baldes)
+        resumo['cache_entradas'] = len(_cache)
+    if latencias:
+        resumo['latencia_p50_ms'] = round(latencias[len(latencias) // 2], 2)
+        resumo['latencia_p95_ms'] = round(latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))], 2)
+    resumo['latencia_max_ms'] = round(resumo['latencia_max_ms'], 2)
+    return resumo
+
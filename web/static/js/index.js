@@ -2,7 +2,10 @@ document.addEventListener('DOMContentLoaded', function () {
     // =================================================================
     // BLOCO DE INICIALIZAÇÃO E CACHE DE DADOS
     // =================================================================
-    let allStudentsData = []; // Variável para armazenar em cache os dados originais de todos os alunos.
+    const PAGE_SIZE = 200; // Alunos carregados por vez em cada aba.
+    let turmasResumo = []; // Resumo por turma (/api/turmas), usado para montar as abas.
+    let loadedTurmas = {}; // Alunos já carregados por aba: { turmaId: { students, total, pagina } }.
+    let currentSort = 'nome'; // Ordenação das tabelas (parâmetro 'sort' da API).
 
     // =================================================================
     // BLOCO DE UTILITÁRIOS DA UI
@@ -31,32 +34,105 @@ document.addEventListener('DOMContentLoaded', function () {
         }, 5000);
     }
 
+    /**
+     * Gera o id da aba de uma turma a partir do código (alunos sem turma ficam em 'turma-sem-turma').
+     * @param {string|null} codigoTurma - O código da turma.
+     * @returns {string} O id do painel da aba.
+     */
+    function turmaTabId(codigoTurma) {
+        return `turma-${String(codigoTurma ?? 'sem-turma').replace(/[^\w-]/g, '-')}`;
+    }
+
 
     // =================================================================
     // BLOCO DE BUSCA DE DADOS (API)
     // =================================================================
 
-    // Função assíncrona para buscar os dados de presença da API do Flask.
+    /**
+     * Converte a resposta no formato colunar (/api/presence_data?format=columnar)
+     * de volta para uma lista de objetos, um por aluno.
+     * @param {Object} payload - A resposta da API no formato colunar.
+     * @returns {Array} A lista de alunos.
+     */
+    function decodeColumnar(payload) {
+        const cols = payload.columns;
+        const students = new Array(payload.count);
+        for (let i = 0; i < payload.count; i++) {
+            const codigoTurma = cols.codigo_turma[i];
+            students[i] = {
+                ra: cols.ra[i],
+                nome: cols.nome[i],
+                codigo_turma: codigoTurma,
+                nome_turma: (codigoTurma in payload.turmas) ? payload.turmas[codigoTurma] : codigoTurma,
+                status_presenca: payload.status_labels[cols.status[i]],
+                timestamp_entrada: cols.timestamp_entrada[i],
+                timestamp_saida: cols.timestamp_saida[i],
+            };
+        }
+        return students;
+    }
+
+    /**
+     * Lê os filtros da barra de filtros (visível para o professor) como parâmetros da API.
+     * @returns {URLSearchParams} Os parâmetros 'status' e 'q' preenchidos.
+     */
+    function currentFilterParams() {
+        const params = new URLSearchParams();
+        const filterStatus = document.getElementById('filterStatus');
+        const filterNameRa = document.getElementById('filterNameRa');
+        if (filterStatus && filterStatus.value) {
+            params.set('status', filterStatus.value);
+        }
+        if (filterNameRa && filterNameRa.value.trim()) {
+            params.set('q', filterNameRa.value.trim());
+        }
+        return params;
+    }
+
+    /**
+     * Busca uma página de alunos de uma turma, já filtrada e ordenada pelo servidor.
+     * @param {string|null} codigoTurma - O código da turma.
+     * @param {Object} options - pagina, porPagina e applyFilters (padrão: true).
+     * @returns {Promise<{students: Array, total: number}>}
+     */
+    async function fetchTurmaStudents(codigoTurma, { pagina = 1, porPagina = PAGE_SIZE, applyFilters = true } = {}) {
+        const params = applyFilters ? currentFilterParams() : new URLSearchParams();
+        params.set('format', 'columnar');
+        params.set('turma', codigoTurma ?? '');
+        params.set('sort', currentSort);
+        if (porPagina) {
+            params.set('pagina', pagina);
+            params.set('por_pagina', porPagina);
+        }
+        const response = await fetch(`${apiBaseUrl}/api/presence_data?${params.toString()}`);
+        if (!response.ok) {
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+        const payload = await response.json();
+        return { students: decodeColumnar(payload), total: payload.total };
+    }
+
+    // Busca o resumo das turmas e monta o painel. Os alunos de cada turma só são
+    // carregados quando a aba dela é aberta (veja loadTurmaTab).
     async function fetchPresenceData(userRole, apiBaseUrl) {
         try {
             // Constrói a URL completa para a API, garantindo que funcione em dispositivos móveis.
-            const apiUrl = `${apiBaseUrl}/api/presence_data`;
+            const apiUrl = `${apiBaseUrl}/api/turmas?${currentFilterParams().toString()}`;
             console.log("Buscando dados de:", apiUrl); // Log para depuração
             const response = await fetch(apiUrl);
             if (!response.ok) {
                 throw new Error(`HTTP error! status: ${response.status}`);
             }
-            const data = await response.json(); // Converte a resposta para JSON. 
-            allStudentsData = data; // Armazena os dados no cache local.
-            
+            const summary = await response.json();
+            turmasResumo = summary.turmas;
+            loadedTurmas = {};
+
             // Popula os filtros apenas se a barra de filtro existir (visível para o professor).
             if (document.getElementById('filterTurma')) {
-                populateFilterOptions(allStudentsData); 
+                populateFilterOptions(turmasResumo);
             }
 
-            updateDashboardStats(allStudentsData); // Calcula e exibe as estatísticas
-
-            renderPresenceData(allStudentsData); // Renderiza os dados na tela pela primeira vez.
+            renderTurmaTabs(turmasResumo); // Monta as abas e carrega a turma ativa.
         } catch (error) {
             console.error('Error fetching presence data:', error);
             showFlashMessage('Erro ao carregar os dados dos alunos.', 'danger');
@@ -71,28 +147,29 @@ document.addEventListener('DOMContentLoaded', function () {
     // =================================================================
 
     let presenceChartInstance = null; // Variável para manter a instância do gráfico
+    const STATS_REFRESH_MS = 5000; // Intervalo de atualização dos cards (/api/summary é mantida em memória).
 
     /**
-     * Calcula as estatísticas gerais e atualiza os cards e o gráfico.
-     * @param {Array} data - Os dados de todos os alunos.
+     * Atualiza os cards e o gráfico com os contadores do dia.
+     * @param {Object} summary - A resposta de /api/summary.
      */
-    function updateDashboardStats(data) {
-        const totalAlunos = data.length;
-        const presentes = data.filter(a => a.status_presenca !== 'Ausente').length;
-        const ausentes = totalAlunos - presentes;
-        const totalTurmas = [...new Set(data.map(aluno => aluno.nome_turma || 'Sem Turma'))].length;
+    function updateDashboardStats(summary) {
+        const presentes = summary.escola.presentes;
+        const ausentes = summary.escola.ausentes;
 
         // Atualiza os cards
-        document.getElementById('stats-total-alunos').textContent = totalAlunos;
-        document.getElementById('stats-total-turmas').textContent = totalTurmas;
+        document.getElementById('stats-total-alunos').textContent = summary.escola.alunos;
+        document.getElementById('stats-total-turmas').textContent = summary.turmas.length;
         document.getElementById('stats-presentes').textContent = presentes;
         document.getElementById('stats-ausentes').textContent = ausentes;
 
-        // Atualiza o gráfico de pizza
-        const ctx = document.getElementById('presenceChart').getContext('2d');
+        // Atualiza o gráfico de pizza (criado uma única vez; depois só os números mudam)
         if (presenceChartInstance) {
-            presenceChartInstance.destroy(); // Destrói o gráfico anterior para criar um novo
+            presenceChartInstance.data.datasets[0].data = [presentes, ausentes];
+            presenceChartInstance.update();
+            return;
         }
+        const ctx = document.getElementById('presenceChart').getContext('2d');
         presenceChartInstance = new Chart(ctx, {
             type: 'pie',
             data: {
@@ -105,38 +182,49 @@ document.addEventListener('DOMContentLoaded', function () {
                     borderWidth: 2
                 }]
             },
-            options: { responsive: true, maintainAspectRatio: true, plugins: { legend: { position: 'top' } } }
+            // 'legend' é a opção do Chart.js 2 (versão incluída em static/js); 'plugins.legend' a das versões 3+.
+            options: { responsive: true, maintainAspectRatio: true, legend: { position: 'top' }, plugins: { legend: { position: 'top' } } }
         });
     }
 
+    // Busca os contadores do dia e atualiza os cards.
+    async function refreshDashboardStats() {
+        try {
+            const response = await fetch(`${apiBaseUrl}/api/summary`);
+            if (!response.ok) {
+                throw new Error(`HTTP error! status: ${response.status}`);
+            }
+            updateDashboardStats(await response.json());
+        } catch (error) {
+            console.error('Error fetching summary:', error);
+        }
+    }
+
     // =================================================================
     // BLOCO DE POPULAÇÃO DOS FILTROS
     // =================================================================
 
     // Função para popular o menu suspenso (dropdown) de filtro de turmas.
-    function populateFilterOptions(data) {
+    function populateFilterOptions(turmas) {
         const filterTurmaSelect = document.getElementById('filterTurma');
         // Procede apenas se o elemento de filtro existir.
         if (!filterTurmaSelect) return;
 
         const currentTurma = filterTurmaSelect.value;
 
-        // Cria uma lista de turmas únicas a partir dos dados dos alunos e as ordena.
-        const uniqueTurmas = [...new Set(data.map(aluno => aluno.nome_turma || 'Sem Turma'))].sort();
-
         // Limpa as opções existentes, exceto a opção "Todas".
         filterTurmaSelect.innerHTML = '<option value="">Todas</option>';
 
-        // Adiciona cada turma como uma nova opção no dropdown.
-        uniqueTurmas.forEach(turma => {
+        // Adiciona cada turma como uma nova opção no dropdown (o valor é o id da aba).
+        turmas.forEach(turma => {
             const option = document.createElement('option');
-            option.value = turma;
-            option.textContent = turma;
+            option.value = turmaTabId(turma.codigo_turma);
+            option.textContent = turma.nome_turma;
             filterTurmaSelect.appendChild(option);
         });
 
         // Restaura a seleção anterior se ela ainda existir
-        if (uniqueTurmas.includes(currentTurma)) {
+        if (turmas.some(turma => turmaTabId(turma.codigo_turma) === currentTurma)) {
             filterTurmaSelect.value = currentTurma;
         }
     }
@@ -145,18 +233,22 @@ document.addEventListener('DOMContentLoaded', function () {
     // BLOCO DE RENDERIZAÇÃO DA INTERFACE (ABAS E TABELAS)
     // =================================================================
 
-    // Função principal para renderizar os dados de presença, agrupando-os por turma em abas.
-    function renderPresenceData(data) {
+    // Monta uma aba (vazia) por turma. A tabela de cada turma é carregada quando a aba é aberta.
+    function renderTurmaTabs(turmas) {
         const turmaTabs = document.getElementById('turmaTabs');
         const turmaTabContent = document.getElementById('turmaTabContent');
         const noStudentsAlert = document.getElementById('no-students-alert');
-        
-        // Limpa o conteúdo existente antes de renderizar novamente.
+
+        // Mantém aberta a aba que o usuário estava vendo, se ela ainda existir.
+        const activePane = turmaTabContent.querySelector('.tab-pane.active');
+        const activeId = activePane ? activePane.id : null;
+
+        // Limpa o conteúdo existente antes de renderizar novamente (o alerta é preservado).
         turmaTabs.innerHTML = '';
-        turmaTabContent.innerHTML = '';
+        turmaTabContent.querySelectorAll('.tab-pane').forEach(pane => pane.remove());
 
         // Lógica para exibir/ocultar filtros e controles com base na existência de alunos.
-        const hasAnyStudent = allStudentsData.length > 0;
+        const hasAnyStudent = turmas.length > 0;
         const filterBarElement = document.getElementById('filter-bar');
         if (filterBarElement) {
             filterBarElement.style.display = hasAnyStudent ? 'block' : 'none';
@@ -166,174 +258,220 @@ document.addEventListener('DOMContentLoaded', function () {
             controlsElement.style.display = hasAnyStudent ? 'block' : 'none';
         }
 
-        // Se não houver dados (seja no geral ou após filtrar), mostra o alerta e para.
-        if (data.length === 0) {
-            // Se não houver nenhum aluno cadastrado, a mensagem é "Nenhum aluno encontrado".
-            // Se houver alunos, mas o filtro não retornou nada, a mensagem é mais específica.
-            if (hasAnyStudent) {
-                noStudentsAlert.textContent = 'Nenhum aluno corresponde aos critérios do filtro.';
-            } else {
-                noStudentsAlert.textContent = 'Nenhum aluno encontrado no banco de dados.';
-            }
+        if (!hasAnyStudent) {
+            noStudentsAlert.textContent = 'Nenhum aluno encontrado no banco de dados.';
             noStudentsAlert.style.display = 'block';
             return;
-        } else {
-            noStudentsAlert.style.display = 'none';
         }
+        noStudentsAlert.style.display = 'none';
 
-        // Agrupa os dados dos alunos por turma.
-        const groupedByTurma = data.reduce((acc, aluno) => {
-            const turma = aluno.nome_turma || 'Sem Turma';
-            if (!acc[turma]) {
-                acc[turma] = [];
-            }
-            acc[turma].push(aluno);
-            return acc;
-        }, {});
+        const firstId = turmas.some(turma => turmaTabId(turma.codigo_turma) === activeId)
+            ? activeId : turmaTabId(turmas[0].codigo_turma);
 
-        const sortedTurmas = Object.keys(groupedByTurma).sort();
-        let isFirstTab = true;
+        for (const turma of turmas) {
+            const turmaId = turmaTabId(turma.codigo_turma); // ID único para a aba e seu conteúdo.
+            const isActive = turmaId === firstId;
 
-        // Pega as permissões do corpo do HTML
-        const userRole = document.body.dataset.userRole;
-        const canViewSensitiveData = document.body.dataset.canViewSensitiveData === 'true';
-
-        for (const turma of sortedTurmas) {
-            const turmaId = `turma-${turma.replace(/\s+/g, '-')}`; // ID único para a aba e seu conteúdo.
-            
             // Cria o item de navegação (o botão da aba).
             const navItem = document.createElement('li');
             navItem.classList.add('nav-item');
             navItem.setAttribute('role', 'presentation');
             navItem.innerHTML = `
-                <button class="nav-link ${isFirstTab ? 'active' : ''}" id="${turmaId}-tab" data-bs-toggle="tab" 
+                <button class="nav-link ${isActive ? 'active' : ''}" id="${turmaId}-tab" data-bs-toggle="tab"
                         data-bs-target="#${turmaId}" type="button" role="tab" aria-controls="${turmaId}"
-                        aria-selected="${isFirstTab ? 'true' : 'false'}">
-                    ${turma} <span class="badge bg-secondary ms-1" id="count-${turmaId}">${groupedByTurma[turma].length}</span>
+                        aria-selected="${isActive ? 'true' : 'false'}">
+                    ${turma.nome_turma} <span class="badge bg-secondary ms-1" id="count-${turmaId}">${turma.encontrados}</span>
                 </button>
             `;
             turmaTabs.appendChild(navItem);
+            navItem.querySelector('button').addEventListener('shown.bs.tab', () => loadTurmaTab(turmaId));
 
-            // Cria o painel de conteúdo da aba (que conterá a tabela).
+            // Cria o painel de conteúdo da aba (a tabela é criada em loadTurmaTab).
             const tabPane = document.createElement('div');
             tabPane.classList.add('tab-pane', 'fade');
-            if (isFirstTab) {
+            if (isActive) {
                 tabPane.classList.add('show', 'active');
             }
             tabPane.setAttribute('id', turmaId);
             tabPane.setAttribute('role', 'tabpanel');
             tabPane.setAttribute('aria-labelledby', `${turmaId}-tab`);
-            tabPane.innerHTML = `
-                <table class="table table-striped table-hover mt-3">
-                    <thead class="table-dark"> 
-                        <tr>
-                            ${canViewSensitiveData ? '<th>RA</th>' : ''}
-                            <th>Nome</th>
-                            <th>Status</th>
-                            <th>Entrada</th>
-                            <th>Saída</th>
-                            <th>Ações</th>
-                        </tr>
-                    </thead> 
-                    <tbody>
-                        ${groupedByTurma[turma].map(aluno => {
-                            let statusBadgeClass = 'bg-danger'; // Padrão para 'Ausente'
-                            switch (aluno.status_presenca) {
-                                case 'Presente':
-                                    statusBadgeClass = 'bg-success';
-                                    break;
-                                case 'Apenas Entrada':
-                                    statusBadgeClass = 'bg-info text-dark';
-                                    break;
-                                case 'Atraso':
-                                case 'Saída Antecipada':
-                                case 'Presente (Incompleto)':
-                                    statusBadgeClass = 'bg-warning text-dark';
-                                    break;
-                            }
-
-                            return `
-                            <tr>
-                                ${canViewSensitiveData ? `<td data-label="RA"><a href="#" class="qr-code-trigger" data-ra="${aluno.ra}" data-nome="${aluno.nome}">${aluno.ra}</a></td>` : ''}
-                                <td>${aluno.nome}</td>
-                                <td>
-                                    <span class="badge ${statusBadgeClass}">
-                                        ${aluno.status_presenca}
-                                    </span>
-                                </td>
-                                <td>${aluno.timestamp_entrada ? new Date(aluno.timestamp_entrada).toLocaleTimeString('pt-BR') : 'N/A'}</td>
-                                <td>${aluno.timestamp_saida ? new Date(aluno.timestamp_saida).toLocaleTimeString('pt-BR') : 'N/A'}</td>
-                                <td>
-                                    ${userRole === 'professor' ? `<a href="/aluno/${aluno.ra}" class="btn btn-sm btn-info">Ver Histórico</a>` : ''}
-                                </td>
-                            </tr>
-                        `}).join('')}
-                    </tbody>
-                </table>
-            `;
+            tabPane.dataset.codigoTurma = turma.codigo_turma ?? '';
+            tabPane.dataset.nomeTurma = turma.nome_turma;
+            tabPane.innerHTML = '<p class="text-muted mt-3">Carregando...</p>';
             turmaTabContent.appendChild(tabPane);
+        }
+
+        loadTurmaTab(firstId);
+    }
+
+    /**
+     * Carrega (ou continua carregando) os alunos de uma aba e renderiza a tabela.
+     * @param {string} turmaId - O id do painel da aba.
+     * @param {boolean} nextPage - Se true, acrescenta a próxima página à tabela.
+     */
+    async function loadTurmaTab(turmaId, nextPage = false) {
+        const tabPane = document.getElementById(turmaId);
+        if (!tabPane || (loadedTurmas[turmaId] && !nextPage)) return;
+
+        const loaded = loadedTurmas[turmaId] || { students: [], total: 0, pagina: 0 };
+        loadedTurmas[turmaId] = loaded;
+        const codigoTurma = tabPane.dataset.codigoTurma;
+        try {
+            const { students, total } = await fetchTurmaStudents(codigoTurma, { pagina: loaded.pagina + 1 });
+            if (loadedTurmas[turmaId] !== loaded) return; // Os filtros mudaram durante a busca.
+            loaded.students = loaded.students.concat(students);
+            loaded.total = total;
+            loaded.pagina += 1;
+            renderTurmaTable(tabPane, loaded);
+        } catch (error) {
+            console.error('Error fetching class students:', error);
+            delete loadedTurmas[turmaId];
+            showFlashMessage('Erro ao carregar os alunos da turma.', 'danger');
+        }
+    }
+
+    // Renderiza a tabela de uma aba com os alunos já carregados.
+    function renderTurmaTable(tabPane, loaded) {
+        // Pega as permissões do corpo do HTML
+        const userRole = document.body.dataset.userRole;
+        const canViewSensitiveData = document.body.dataset.canViewSensitiveData === 'true';
 
-            isFirstTab = false;
+        if (loaded.students.length === 0) {
+            tabPane.innerHTML = '<div class="alert alert-warning mt-3">Nenhum aluno corresponde aos critérios do filtro.</div>';
+            return;
         }
 
-        // Adiciona event listeners aos novos links de RA
-        document.querySelectorAll('.qr-code-trigger').forEach(trigger => {
+        const sortKey = currentSort.replace(/^-/, '');
+        const sortArrow = currentSort.startsWith('-') ? ' ▼' : ' ▲';
+        const sortableHeader = (key, label) =>
+            `<th class="sortable" data-sort="${key}" role="button">${label}${key === sortKey ? sortArrow : ''}</th>`;
+
+        tabPane.innerHTML = `
+            <table class="table table-striped table-hover mt-3">
+                <thead class="table-dark">
+                    <tr>
+                        ${canViewSensitiveData ? sortableHeader('ra', 'RA') : ''}
+                        ${sortableHeader('nome', 'Nome')}
+                        ${sortableHeader('status', 'Status')}
+                        ${sortableHeader('entrada', 'Entrada')}
+                        ${sortableHeader('saida', 'Saída')}
+                        <th>Ações</th>
+                    </tr>
+                </thead>
+                <tbody>
+                    ${loaded.students.map(aluno => {
+                        let statusBadgeClass = 'bg-danger'; // Padrão para 'Ausente'
+                        switch (aluno.status_presenca) {
+                            case 'Presente':
+                                statusBadgeClass = 'bg-success';
+                                break;
+                            case 'Apenas Entrada':
+                                statusBadgeClass = 'bg-info text-dark';
+                                break;
+                            case 'Atraso':
+                            case 'Saída Antecipada':
+                            case 'Presente (Incompleto)':
+                                statusBadgeClass = 'bg-warning text-dark';
+                                break;
+                        }
+
+                        return `
+                        <tr>
+                            ${canViewSensitiveData ? `<td data-label="RA"><a href="#" class="qr-code-trigger" data-ra="${aluno.ra}" data-nome="${aluno.nome}" data-codigo-turma="${aluno.codigo_turma ?? ''}">${aluno.ra}</a></td>` : ''}
+                            <td>${aluno.nome}</td>
+                            <td>
+                                <span class="badge ${statusBadgeClass}">
+                                    ${aluno.status_presenca}
+                                </span>
+                            </td>
+                            <td>${aluno.timestamp_entrada ? new Date(aluno.timestamp_entrada).toLocaleTimeString('pt-BR') : 'N/A'}</td>
+                            <td>${aluno.timestamp_saida ? new Date(aluno.timestamp_saida).toLocaleTimeString('pt-BR') : 'N/A'}</td>
+                            <td>
+                                ${userRole === 'professor' ? `<a href="/aluno/${aluno.ra}" class="btn btn-sm btn-info">Ver Histórico</a>` : ''}
+                            </td>
+                        </tr>
+                    `}).join('')}
+                </tbody>
+            </table>
+            ${loaded.students.length < loaded.total ? `
+                <button type="button" class="btn btn-outline-secondary mb-3 load-more">
+                    Carregar mais (${loaded.students.length} de ${loaded.total})
+                </button>` : ''}
+        `;
+
+        // Adiciona event listeners aos links de RA, aos cabeçalhos ordenáveis e ao botão "Carregar mais".
+        tabPane.querySelectorAll('.qr-code-trigger').forEach(trigger => {
             trigger.addEventListener('click', showStudentQrCode);
         });
+        tabPane.querySelectorAll('th.sortable').forEach(th => {
+            th.addEventListener('click', () => changeSort(th.dataset.sort));
+        });
+        const loadMoreButton = tabPane.querySelector('.load-more');
+        if (loadMoreButton) {
+            loadMoreButton.addEventListener('click', () => {
+                loadMoreButton.disabled = true;
+                loadTurmaTab(tabPane.id, true);
+            });
+        }
     }
 
     // =================================================================
-    // BLOCO DE LÓGICA DE FILTRAGEM
+    // BLOCO DE LÓGICA DE FILTRAGEM E ORDENAÇÃO
     // =================================================================
 
-    // Função para aplicar os filtros selecionados pelo usuário.
-    function applyFilters(event) {
-        const filterTurma = document.getElementById('filterTurma').value;
-        const filterNameRa = document.getElementById('filterNameRa').value.toLowerCase();
-        const filterStatus = document.getElementById('filterStatus').value;
+    // Descarta os alunos carregados e recarrega a aba ativa (as outras recarregam ao serem abertas).
+    function reloadActiveTab() {
+        loadedTurmas = {};
+        const activePane = document.querySelector('#turmaTabContent .tab-pane.active');
+        if (activePane) {
+            loadTurmaTab(activePane.id);
+        }
+    }
+
+    // Alterna a ordenação pela coluna clicada (clicar de novo inverte a ordem).
+    function changeSort(key) {
+        currentSort = currentSort === key ? `-${key}` : key;
+        reloadActiveTab();
+    }
+
+    let filterTimer = null;
 
-        // Se o filtro de turma foi alterado, ativa a aba correspondente.
+    // Função para aplicar os filtros selecionados pelo usuário. Os filtros de
+    // status e nome/RA são avaliados pelo servidor: os contadores das abas vêm
+    // de /api/turmas e a aba ativa é recarregada.
+    function applyFilters(event) {
+        // Se o filtro de turma foi alterado, apenas ativa a aba correspondente.
         if (event && event.target.id === 'filterTurma') {
-            const turmaId = `turma-${filterTurma.replace(/\s+/g, '-')}`;
-            const tabButton = document.getElementById(`${turmaId}-tab`);
+            const tabButton = document.getElementById(`${event.target.value}-tab`);
             if (tabButton) {
                 // Cria uma instância do Tab do Bootstrap e a exibe.
                 const tab = new bootstrap.Tab(tabButton);
                 tab.show();
             }
+            return;
         }
 
-        // Itera sobre todas as linhas de todas as tabelas para aplicar os filtros de texto e status.
-        const allRows = document.querySelectorAll('#turmaTabContent tbody tr');
-        let visibleStudentsByTurma = {};
-
-        allRows.forEach(row => {
-            const ra = row.querySelector('td[data-label="RA"]').textContent.toLowerCase();
-            const nome = row.cells[1].textContent.toLowerCase();
-            const status = row.cells[2].textContent.trim();
-            const turmaPane = row.closest('.tab-pane');
-            const studentTurma = turmaPane.id.replace('turma-', '').replace(/-/g, ' ');
-
-            const matchesTurma = filterTurma === '' || studentTurma === filterTurma;
-            const matchesNameRa = filterNameRa === '' || nome.includes(filterNameRa) || ra.includes(filterNameRa);
-            const matchesStatus = filterStatus === '' || status === filterStatus;
-
-            if (matchesTurma && matchesNameRa && matchesStatus) {
-                row.style.display = ''; // Mostra a linha
-                if (!visibleStudentsByTurma[turmaPane.id]) {
-                    visibleStudentsByTurma[turmaPane.id] = 0;
+        // Espera o usuário parar de digitar antes de consultar o servidor.
+        clearTimeout(filterTimer);
+        filterTimer = setTimeout(async () => {
+            reloadActiveTab();
+            try {
+                const response = await fetch(`${apiBaseUrl}/api/turmas?${currentFilterParams().toString()}`);
+                if (!response.ok) {
+                    throw new Error(`HTTP error! status: ${response.status}`);
                 }
-                visibleStudentsByTurma[turmaPane.id]++;
-            } else {
-                row.style.display = 'none'; // Esconde a linha
+                const summary = await response.json();
+                // Atualiza os contadores de alunos encontrados em cada aba.
+                summary.turmas.forEach(turma => {
+                    const badge = document.getElementById(`count-${turmaTabId(turma.codigo_turma)}`);
+                    if (badge) {
+                        badge.textContent = turma.encontrados;
+                    }
+                });
+            } catch (error) {
+                console.error('Error fetching class summary:', error);
             }
-        });
-
-        // Atualiza os contadores de alunos visíveis em cada aba.
-        document.querySelectorAll('#turmaTabs .badge').forEach(badge => {
-            const turmaId = badge.id.replace('count-', '');
-            badge.textContent = visibleStudentsByTurma[turmaId] || 0;
-        });
+        }, event && event.type === 'keyup' ? 300 : 0);
     }
 
     // =================================================================
@@ -341,6 +479,8 @@ document.addEventListener('DOMContentLoaded', function () {
     // =================================================================
 
     // Função para exportar os dados da aba ativa para um arquivo CSV.
+    // O arquivo é gerado pelo servidor (/api/export.csv), que lê direto do banco de dados,
+    // então a exportação não depende do que está renderizado na tela.
     function exportToCsv() {
         const activeTabContent = document.querySelector('.tab-pane.active');
         if (!activeTabContent) {
@@ -348,34 +488,19 @@ document.addEventListener('DOMContentLoaded', function () {
             return;
         }
 
-        const rows = activeTabContent.querySelectorAll('table tr');
-        let csvContent = "data:text/csv;charset=utf-8,";
-        
-        // Adiciona a linha de cabeçalho.
-        const headers = Array.from(rows[0].querySelectorAll('th')).map(th => `"${th.innerText.trim()}"`).join(',');
-        csvContent += headers + "\r\n";
-
-        // Adiciona as linhas de dados.
-        for (let i = 1; i < rows.length; i++) {
-            const cols = rows[i].querySelectorAll('td');
-            const rowData = Array.from(cols).map(col => {
-                // Limpa o texto da célula.
-                let cellText = col.innerText.trim();
-                // Para a coluna "Ações", não queremos o texto do botão.
-                if (col.querySelector('a.btn')) {
-                    return '""'; // Retorna uma string vazia entre aspas.
-                }
-                return `"${cellText.replace(/"/g, '""')}"`;
-            }).slice(0, -1).join(','); // Exclude the last column (Ações)
-            csvContent += rowData + "\r\n";
+        const today = new Date();
+        const isoToday = `${today.getFullYear()}-${String(today.getMonth() + 1).padStart(2, '0')}-${String(today.getDate()).padStart(2, '0')}`;
+        const params = new URLSearchParams({ from: isoToday, to: isoToday });
+        if (activeTabContent.dataset.codigoTurma) {
+            params.set('turma', activeTabContent.dataset.codigoTurma);
+        }
+        const filterStatus = document.getElementById('filterStatus');
+        if (filterStatus && filterStatus.value) {
+            params.set('status', filterStatus.value);
         }
 
-        const encodedUri = encodeURI(csvContent);
         const link = document.createElement("a");
-        link.setAttribute("href", encodedUri);
-        
-        const turmaName = activeTabContent.id.replace('turma-', '');
-        link.setAttribute("download", `presenca_turma_${turmaName}.csv`);
+        link.setAttribute("href", `/api/export.csv?${params.toString()}`);
         document.body.appendChild(link);
         link.click();
         document.body.removeChild(link);
@@ -383,37 +508,36 @@ document.addEventListener('DOMContentLoaded', function () {
 
     /**
      * Abre uma nova janela com os QR Codes de todos os alunos da aba ativa, pronta para impressão.
+     * A turma inteira é buscada no servidor, independentemente dos filtros e das páginas já carregadas.
      */
-    function printQrCodes() {
+    async function printQrCodes() {
         const activeTabContent = document.querySelector('.tab-pane.active');
         if (!activeTabContent) {
             showFlashMessage('Nenhuma turma selecionada para imprimir QR Codes.', 'warning');
             return;
         }
 
-        const turmaName = activeTabContent.id.replace('turma-', '').replace(/-/g, ' ');        
-        const rows = activeTabContent.querySelectorAll('tbody tr');
-        const studentsInTurma = [];
-
-        rows.forEach(row => {
-            // Pega o RA do link dentro da primeira célula de dados (td)
-            const raElement = row.querySelector('td[data-label="RA"] a');
-            if (raElement) {
-                const ra = raElement.dataset.ra;
-                // Encontra o aluno correspondente nos dados completos para obter todas as informações
-                const studentData = allStudentsData.find(s => s.ra === ra);
-                if (studentData) {
-                    studentsInTurma.push(studentData);
-                }
-            }
-        });
+        const turmaName = activeTabContent.dataset.nomeTurma;
+        // A janela é aberta antes da busca para não ser bloqueada pelo navegador.
+        const printWindow = window.open('', '', 'height=800,width=1000');
+        let studentsInTurma;
+        try {
+            ({ students: studentsInTurma } = await fetchTurmaStudents(
+                activeTabContent.dataset.codigoTurma, { porPagina: null, applyFilters: false }
+            ));
+        } catch (error) {
+            console.error('Error fetching class students:', error);
+            printWindow.close();
+            showFlashMessage('Erro ao carregar os alunos da turma.', 'danger');
+            return;
+        }
 
         if (studentsInTurma.length === 0) {
+            printWindow.close();
             showFlashMessage('Não há alunos nesta turma para imprimir QR Codes.', 'info');
             return;
         }
 
-        const printWindow = window.open('', '', 'height=800,width=1000');
         printWindow.document.write('<html><head><title>QR Codes - Turma ' + turmaName + '</title>');
         printWindow.document.write('<link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css">');
         printWindow.document.write(`
@@ -474,7 +598,13 @@ document.addEventListener('DOMContentLoaded', function () {
             return;
         }
 
-        const turmaName = activeTabContent.id.replace('turma-', '');
+        const tableToPrint = activeTabContent.querySelector('table');
+        if (!tableToPrint) {
+            alert('Não há alunos carregados nesta turma para imprimir.');
+            return;
+        }
+
+        const turmaName = activeTabContent.dataset.nomeTurma;
         const printWindow = window.open('', '', 'height=600,width=800');
         printWindow.document.write('<html><head><title>Imprimir Presença</title>');
         // Link para o CSS do Bootstrap para manter o estilo na impressão.
@@ -483,13 +613,13 @@ document.addEventListener('DOMContentLoaded', function () {
         printWindow.document.write('</head><body>');
         printWindow.document.write(`<h1>Lista de Presença - Turma: ${turmaName}</h1>`);
         
-        const tableToPrint = activeTabContent.querySelector('table').cloneNode(true);
+        const tableClone = tableToPrint.cloneNode(true);
         // Remove a coluna "Ações" do cabeçalho e do corpo da tabela para a impressão.
-        Array.from(tableToPrint.querySelectorAll('tr')).forEach(row => {
+        Array.from(tableClone.querySelectorAll('tr')).forEach(row => {
             row.deleteCell(-1); // Delete the last cell
         });
 
-        printWindow.document.write(tableToPrint.outerHTML);
+        printWindow.document.write(tableClone.outerHTML);
         printWindow.document.write('</body></html>');
         printWindow.document.close();
         
@@ -513,13 +643,7 @@ document.addEventListener('DOMContentLoaded', function () {
         event.preventDefault();
         const studentRa = event.target.dataset.ra;
         const studentName = event.target.dataset.nome;
-
-        // Encontra o aluno nos dados cacheados para obter o código da turma
-        const student = allStudentsData.find(s => s.ra === studentRa);
-        if (!student) {
-            showFlashMessage('Não foi possível encontrar os dados completos do aluno.', 'danger');
-            return;
-        }
+        const codigoTurma = event.target.dataset.codigoTurma;
 
         const modal = new bootstrap.Modal(document.getElementById('qrCodeModal'));
         const qrContainer = document.getElementById('qr-code-container');        
@@ -531,7 +655,7 @@ document.addEventListener('DOMContentLoaded', function () {
         document.getElementById('qr-modal-student-ra').textContent = `RA: ${studentRa}`;
 
         // Cria a URL para a imagem do QR Code
-        const qrImageUrl = `/qrcodes/turma_${student.codigo_turma}_ra_${student.ra}.png`;
+        const qrImageUrl = `/qrcodes/turma_${codigoTurma}_ra_${studentRa}.png`;
 
         // Cria o elemento de imagem e o adiciona ao contêiner
         const imgElement = document.createElement('img');
@@ -544,33 +668,68 @@ document.addEventListener('DOMContentLoaded', function () {
     }
 
     /**
-     * Envia uma requisição para repopular o banco de dados de alunos.
+     * Agenda a sincronização dos alunos com os arquivos JSON e acompanha o
+     * andamento da tarefa em segundo plano até ela terminar.
      * Pede confirmação ao usuário antes de proceder.
      */
     async function repopulateDatabase() {
         const confirmation = confirm(
             'Você tem certeza que deseja repopular o banco de dados?\n\n' +
-            'ATENÇÃO: Todos os alunos e registros de presença existentes serão APAGADOS. ' +
-            'Os alunos serão recarregados a partir dos arquivos JSON originais.'
+            'Os alunos serão sincronizados com os arquivos JSON originais: novos alunos serão adicionados, ' +
+            'os alterados serão atualizados e os que não estão em nenhum arquivo serão REMOVIDOS, ' +
+            'junto com seus registros de presença.'
         );
 
         if (!confirmation) {
             return;
         }
 
+        const button = document.getElementById('repopulateDbButton');
+        const originalText = button.textContent;
+        button.disabled = true;
+
         try {
             const response = await fetch('/api/repopulate_students', { method: 'POST' });
             const result = await response.json();
+            if (!response.ok) {
+                throw new Error(result.error || 'Erro desconhecido ao repopular o banco de dados.');
+            }
+            showFlashMessage(result.message, 'info');
+
+            // Consulta o andamento da tarefa a cada segundo.
+            let job;
+            do {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const jobResponse = await fetch(result.status_url);
+                job = await jobResponse.json();
+                if (!jobResponse.ok) {
+                    throw new Error(job.error || 'Erro ao consultar a tarefa.');
+                }
+                button.textContent = job.total ? `Repopulando... ${job.processados}/${job.total}` : 'Repopulando...';
+            } while (job.estado === 'pendente' || job.estado === 'executando');
 
-            if (response.ok) {
-                showFlashMessage(result.message, 'success');
+            if (job.estado === 'erro') {
+                throw new Error(`Falha na repopulação: ${job.erro}`);
+            }
+            const r = job.resultado;
+            let message = `Repopulação concluída: ${r.inseridos} novos, ${r.atualizados} atualizados.`;
+            if (r.ausentes.length) {
+                // Nada é removido automaticamente: a lista fica para conferência do administrador.
+                console.warn('Alunos da importação ausentes dos arquivos:', r.ausentes);
+                message += ` ${r.ausentes.length} aluno(s) não estão em nenhum arquivo (RAs no console).`;
+            }
+            if (r.erros.length) {
+                console.warn('Erros na repopulação:', r.erros);
+                showFlashMessage(`${message} ${r.erros.length} erro(s): ${r.erros.slice(0, 3).join('; ')}`, 'warning');
             } else {
-                throw new Error(result.message || 'Erro desconhecido ao repopular o banco de dados.');
+                showFlashMessage(message, r.ausentes.length ? 'warning' : 'success');
             }
         } catch (error) {
             console.error('Error repopulating database:', error);
             showFlashMessage(error.message, 'danger');
         } finally {
+            button.disabled = false;
+            button.textContent = originalText;
             // Recarrega os dados da tabela para refletir as mudanças.
             const userRole = document.body.dataset.userRole;
             const apiBaseUrl = document.body.dataset.apiBaseUrl;
@@ -590,6 +749,10 @@ document.addEventListener('DOMContentLoaded', function () {
     // Busca os dados iniciais assim que a página é carregada, passando a role.
     fetchPresenceData(userRole, apiBaseUrl);
 
+    // Exibe as estatísticas e as mantém atualizadas enquanto a página estiver aberta.
+    refreshDashboardStats();
+    setInterval(refreshDashboardStats, STATS_REFRESH_MS);
+
 
         // Adiciona os "escutadores de eventos" aos botões de filtro, impressão, etc.
     // Anexa os eventos apenas se os elementos existirem (visíveis para o professor).